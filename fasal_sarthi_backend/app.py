@@ -1,22 +1,48 @@
+from startup_report import StartupReport
+startup_report = StartupReport()
+
+import hmac
 import os
-import io
+import signal
 import threading
+import time
+import warnings
+import zipfile
 import numpy as np
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g, has_app_context
 from flask_cors import CORS
-from keras import layers, models, applications
-import tensorflow as tf
-from keras.applications import EfficientNetB3
-from keras.layers import Input, GlobalAveragePooling2D, Dense, Dropout
-from keras import Model
-from PIL import Image
-import requests  #Direct API Calls for Gemini and Weather
+from werkzeug.datastructures import FileStorage
+# NOTE: TensorFlow / Keras are NOT imported here. The disease model only needs a TFLite
+# Interpreter, which is loaded on demand from tflite_runtime (or TF as a fallback), see
+# interpreter_pool.load_interpreter_class(). sklearn is only pulled in by joblib.load.
 import json
 import joblib
+from collections import namedtuple, deque, Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import partial
 from datetime import datetime, timezone, timedelta
-import pandas as pd # For handling categorical features
-from sklearn.preprocessing import LabelEncoder # Although we load it, good to import
 from dotenv import load_dotenv
+from disease_batcher import DiseaseBatcher
+from interpreter_pool import InterpreterPool, load_interpreter_class, dequantize, variant_path, VARIANTS as DISEASE_MODEL_VARIANTS
+from preprocessing import ImagePreprocessor
+from prediction_cache import PredictionCache, content_hash, average_hash, model_fingerprint
+from crop_features import CropFeatureEncoder
+from batch_io import parse_batch_rows, parse_ndjson_line, iter_ndjson_lines, iter_chunks, NDJSON_CONTENT_TYPES
+from batch_io import ZIP_CONTENT_TYPES, is_zip, spool_stream, zip_image_members, read_upload, read_zip_member
+from fert_features import FertilizerFeatureEncoder
+from tree_engine import CompiledForest, compile_forest
+from artifacts import open_artifacts, LabelDecoder, ScalerParams, LazyJoblib
+from weather_cache import WeatherCache, weather_cache_key
+from http_client import get_client, all_stats as upstream_stats, CircuitOpenError
+from chat_sessions import ChatSessionStore, SESSION_ID_RE
+from faq_cache import FAQCache
+from inference_executor import InferenceExecutor, InferenceRejected
+from model_registry import ModelRegistry, ModelSlot
+import profiler
+import metrics
+from metrics import stage
+
+startup_report.mark("imports")
 
 load_dotenv() # Load environment variables from .env file like API keys
 
@@ -43,6 +69,31 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 #     return model
 
 # --- 2. MODEL LOADING ---
+# MODEL_MMAP=1: numpy arrays inside joblib files are memory-mapped read-only instead of copied
+# into each process (shared page cache across workers; enabled by default in gunicorn.conf.py)
+MODEL_MMAP = os.getenv('MODEL_MMAP', '0') == '1'
+
+def load_joblib(path):
+    return joblib.load(path, mmap_mode='r' if MODEL_MMAP else None)
+
+# MODEL_ARTIFACTS_DIR: compact layout written by `python artifacts.py export` (flat .npy arrays,
+# always memory-mapped, plus plain lists). The crop and fertilizer models load from
+# <dir>/crop and <dir>/fertilizer when those exist and match the joblib files, else from joblib.
+# Set it to '' to always load the joblib files.
+MODEL_ARTIFACTS_DIR = os.getenv('MODEL_ARTIFACTS_DIR', 'artifacts')
+
+def artifact_paths(model):
+    return {'artifacts': os.path.join(MODEL_ARTIFACTS_DIR, model)} if MODEL_ARTIFACTS_DIR else {}
+
+# Every model lives in a ModelSlot (see model_registry.py) that can load a new version in the
+# background, warm it up and swap it in while in-flight requests finish on the old one.
+# MODEL_MANIFEST names the version/files per model; each worker re-reads it every
+# MODEL_WATCH_INTERVAL seconds and hot-swaps what changed.
+model_registry = ModelRegistry(
+    manifest_path=os.getenv('MODEL_MANIFEST') or None,
+    watch_interval=float(os.getenv('MODEL_WATCH_INTERVAL', '10')),
+)
+
 # MODEL_WEIGHTS_PATH = 'FasalSarthi_Full_Model.h5'
 TFLITE_MODEL_PATH = 'FasalSarthi_Full_Model.tflite'
 IMAGE_SIZE = (300, 300)
@@ -61,105 +112,404 @@ CLASS_NAMES = [
 # print(f"Loading weights from: {MODEL_WEIGHTS_PATH}")
 # model.load_weights(MODEL_WEIGHTS_PATH)
 # print("Model weights loaded successfully! Server is ready.")
-# Global variable for the model, initially None
-disease_interpreter = None
-model_loading_error = None # To store loading error
-interpreter_lock = threading.Lock()  # For thread-safety when invoking interpreter
-
-# Function to load the model when needed
-def get_disease_interpreter():
-    global disease_interpreter, model_loading_error
-    if disease_interpreter is not None: return disease_interpreter
-    if model_loading_error is not None: return None
-
-    print("Attempting to load TFLite model interpreter (Lazy Load)...")
+# --- 2a. TFLITE INTERPRETER POOL ---
+# N preloaded interpreters (see interpreter_pool.py); each request/batch checks one out.
+# DISEASE_POOL_SIZE: number of interpreters, DISEASE_NUM_THREADS: intra-op threads per interpreter
+# DISEASE_EAGER_LOAD=1 loads + warms up the pool at startup instead of on the first scan
+TFLITE_MODEL_PATH = os.getenv('TFLITE_MODEL_PATH', TFLITE_MODEL_PATH)
+# DISEASE_MODEL_VARIANT serves a quantized build made by quantize_model.py (dynamic, float16 or
+# int8, found next to TFLITE_MODEL_PATH); pick one with benchmarks/bench_disease_variants.py
+DISEASE_MODEL_VARIANT = os.getenv('DISEASE_MODEL_VARIANT', 'float')
+DISEASE_MODEL_PATH = TFLITE_MODEL_PATH
+if DISEASE_MODEL_VARIANT not in DISEASE_MODEL_VARIANTS:
+    print(f"WARNING: Unknown DISEASE_MODEL_VARIANT '{DISEASE_MODEL_VARIANT}' (one of {DISEASE_MODEL_VARIANTS}); serving the float model.")
+elif not os.path.exists(variant_path(TFLITE_MODEL_PATH, DISEASE_MODEL_VARIANT)):
+    print(f"WARNING: {variant_path(TFLITE_MODEL_PATH, DISEASE_MODEL_VARIANT)} not found; serving the float model.")
+else:
+    DISEASE_MODEL_PATH = variant_path(TFLITE_MODEL_PATH, DISEASE_MODEL_VARIANT)
+CPU_COUNT = os.cpu_count() or 1
+DISEASE_POOL_SIZE = int(os.getenv('DISEASE_POOL_SIZE', '1'))
+DISEASE_NUM_THREADS = int(os.getenv('DISEASE_NUM_THREADS', str(max(1, CPU_COUNT // max(1, DISEASE_POOL_SIZE)))))
+DISEASE_EAGER_LOAD = os.getenv('DISEASE_EAGER_LOAD', '0') == '1'
+# Sample leaf photo every interpreter of a new disease model version runs before it is swapped in
+DISEASE_WARMUP_IMAGE = os.getenv('DISEASE_WARMUP_IMAGE', 'corn_blight.jpeg')
+
+# One loaded disease model version: interpreters, the preprocessor built from its input details
+# and its own micro-batcher (so a batch never mixes two versions)
+DiseaseModel = namedtuple('DiseaseModel', 'pool preprocessor batcher')
+
+def load_disease_model(paths):
+    print(f"Attempting to load TFLite interpreter pool (size {DISEASE_POOL_SIZE}, {DISEASE_NUM_THREADS} threads each)...")
     try:
-        # Use tf.lite.Interpreter (works for both tflite-runtime and full tensorflow)
-        disease_interpreter = tf.lite.Interpreter(model_path=TFLITE_MODEL_PATH)
-        disease_interpreter.allocate_tensors() # IMPORTANT: Allocate memory
-        print("✅ TFLite interpreter loaded successfully ON DEMAND.")
-        return disease_interpreter
+        # tflite_runtime Interpreter if installed, else tf.lite.Interpreter (imported only now)
+        pool = InterpreterPool(
+            load_interpreter_class(),
+            paths['model'],
+            size=DISEASE_POOL_SIZE,
+            num_threads=DISEASE_NUM_THREADS,
+        )
     except ValueError as e:
-         print(f"CRITICAL ERROR: Failed to load TFLite model '{TFLITE_MODEL_PATH}'. Corrupted or missing? Error: {e}")
-         model_loading_error = e
-         disease_interpreter = None
-         return None
-    except Exception as e:
-        print(f"CRITICAL ERROR loading TFLite interpreter: {e}")
-        import traceback
-        traceback.print_exc()
-        model_loading_error = e
-        disease_interpreter = None
-        return None
+        print(f"CRITICAL ERROR: Failed to load TFLite model '{paths['model']}'. Corrupted or missing? Error: {e}")
+        raise
+    num_outputs = pool.output_details()[0]['shape'][-1]
+    if num_outputs != len(CLASS_NAMES):
+        raise ValueError(f"model has {num_outputs} outputs but there are {len(CLASS_NAMES)} class names")
+    batcher = None
+    if DISEASE_BATCH_MAX_SIZE > 1:
+        batcher = DiseaseBatcher(
+            partial(invoke_disease_model, pool),
+            max_batch_size=DISEASE_BATCH_MAX_SIZE,
+            max_wait_ms=DISEASE_BATCH_MAX_WAIT_MS,
+            num_workers=DISEASE_POOL_SIZE, # One batch in flight per pooled interpreter
+            result_timeout=DISEASE_BATCH_TIMEOUT,
+        )
+    print(f"✅ TFLite interpreter pool loaded successfully in {pool.load_seconds:.2f}s.")
+    return DiseaseModel(pool, ImagePreprocessor(pool.input_details()[0]), batcher)
+
+def warm_up_disease_model(disease):
+    # Each interpreter runs the sample photo once (zeros if it is missing), so lazy kernel /
+    # XNNPACK set-up happens here and not in the first requests after a swap
+    if not os.path.exists(DISEASE_WARMUP_IMAGE):
+        disease.pool.warmup()
+        return
+    with open(DISEASE_WARMUP_IMAGE, 'rb') as f:
+        img_array = disease.preprocessor.preprocess(f.read()).copy()
+    for _ in range(disease.pool.size): # Checkouts rotate through the pool
+        predictions = invoke_disease_model(disease.pool, img_array)
+    if predictions.shape != (1, len(CLASS_NAMES)) or not np.all(np.isfinite(predictions)):
+        raise ValueError(f"warm-up prediction has shape {predictions.shape} or is not finite")
+
+def close_disease_model(disease):
+    if disease.batcher is not None:
+        disease.batcher.stop()
+
+# Loaded on the first scan (or at startup with DISEASE_EAGER_LOAD=1)
+disease_models = model_registry.register(ModelSlot(
+    'disease', {'model': DISEASE_MODEL_PATH},
+    load_disease_model, warm_up_disease_model, close_disease_model, lazy=True))
+
+def get_disease_pool():
+    disease = disease_models.get()
+    return disease.model.pool if disease is not None else None
+
+# --- 2b. DISEASE MICRO-BATCHING ---
+# Concurrent uploads are grouped into one interpreter invoke (see disease_batcher.py)
+# DISEASE_BATCH_MAX_SIZE=1 disables batching and invokes per request on a pooled interpreter
+DISEASE_BATCH_MAX_SIZE = int(os.getenv('DISEASE_BATCH_MAX_SIZE', '8'))
+DISEASE_BATCH_MAX_WAIT_MS = float(os.getenv('DISEASE_BATCH_MAX_WAIT_MS', '5'))
+# Batches are zero-padded up to one of these sizes, so the interpreter's input is only resized
+# (resize_tensor_input + allocate_tensors) when the bucket changes, not for every new batch size
+DISEASE_BATCH_BUCKETS = sorted({int(b) for b in os.getenv('DISEASE_BATCH_BUCKETS', '1,4,8').split(',') if b.strip()}
+                               | {max(1, DISEASE_BATCH_MAX_SIZE)})
+DISEASE_BATCH_TIMEOUT = float(os.getenv('DISEASE_BATCH_TIMEOUT', '30')) # Max wait for a batched prediction
+
+def batch_bucket(batch_size):
+    for size in DISEASE_BATCH_BUCKETS:
+        if batch_size <= size:
+            return size
+    step = DISEASE_BATCH_BUCKETS[-1] # Bigger batches (bulk scans) round up to a multiple of the largest
+    return -(-batch_size // step) * step
+
+def invoke_disease_model(pool, batch_array):
+    # Returns float32 predictions, [batch, num_classes] (int8/uint8 outputs are dequantized)
+    output_detail = pool.output_details()[0]
+    with pool.checkout() as interpreter:
+        input_index = interpreter.get_input_details()[0]['index']
+        output_index = interpreter.get_output_details()[0]['index']
+        batch_size = batch_array.shape[0]
+
+        if batch_size > 1 and pool.batch_resize_supported: # Per model version
+            padded_size = batch_bucket(batch_size)
+            try:
+                if interpreter.get_input_details()[0]['shape'][0] != padded_size:
+                    interpreter.resize_tensor_input(input_index, (padded_size,) + batch_array.shape[1:], strict=False)
+                    interpreter.allocate_tensors()
+            except Exception as e:
+                # Only a model that refuses the batch dimension turns batching off; an error while
+                # running one batch (below) just fails that batch
+                print(f"Warning: Batched invoke not supported by model ({e}). Falling back to per-image invoke.")
+                pool.batch_resize_supported = False
+            else:
+                if padded_size != batch_size:
+                    padding = np.zeros((padded_size - batch_size,) + batch_array.shape[1:], dtype=batch_array.dtype)
+                    batch_array = np.concatenate([batch_array, padding], axis=0)
+                interpreter.set_tensor(input_index, batch_array)
+                with stage('disease', 'invoke'):
+                    interpreter.invoke()
+                return dequantize(interpreter.get_tensor(output_index)[:batch_size].copy(), output_detail)
+
+        # Batch size 1 (or no dynamic batch support): invoke one image at a time
+        if interpreter.get_input_details()[0]['shape'][0] != 1:
+            interpreter.resize_tensor_input(input_index, (1,) + batch_array.shape[1:], strict=False)
+            interpreter.allocate_tensors()
+        results = []
+        for i in range(batch_size):
+            interpreter.set_tensor(input_index, batch_array[i:i + 1])
+            with stage('disease', 'invoke'):
+                interpreter.invoke()
+            results.append(interpreter.get_tensor(output_index).copy())
+        return dequantize(np.concatenate(results, axis=0), output_detail)
+
+def run_disease_batch(batch_array, version=None, paths=None):
+    # Direct invoke on a pooled interpreter of `version` (default: the current one)
+    disease = disease_models.get(version, paths)
+    if disease is None:
+        raise RuntimeError(f"Disease model could not be loaded: {disease_models.error}")
+    return invoke_disease_model(disease.model.pool, batch_array)
+
+def predict_disease_tensor(img_array, disease):
+    # img_array: [1, H, W, 3] in the model's input dtype. Returns predictions of shape [1, num_classes]
+    if disease.batcher is None:
+        return invoke_disease_model(disease.pool, img_array)
+    # A copy: img_array is the request thread's reusable buffer, and after a predict timeout that
+    # thread may take the next request and overwrite it while the batch is still being assembled
+    return disease.batcher.predict(img_array.copy())[np.newaxis, ...]
+
+# --- 2c. DISEASE PREDICTION CACHE ---
+# Re-uploads of the same photo (retries, shared in groups) skip inference (see prediction_cache.py)
+# PREDICTION_CACHE_SIZE=0 disables it; PREDICTION_CACHE_DIR adds a disk backend shared by all workers
+# PREDICTION_CACHE_PHASH=1 also matches re-encoded copies of a photo by perceptual hash
+PREDICTION_CACHE_PHASH = os.getenv('PREDICTION_CACHE_PHASH', '0') == '1'
+prediction_cache = PredictionCache(
+    max_entries=int(os.getenv('PREDICTION_CACHE_SIZE', '1024')),
+    ttl_seconds=float(os.getenv('PREDICTION_CACHE_TTL', '3600')),
+    disk_dir=os.getenv('PREDICTION_CACHE_DIR') or None,
+)
+prediction_cache.set_model_fingerprint(model_fingerprint(DISEASE_MODEL_PATH))
+# A new disease model version gets a fresh cache namespace
+disease_models.listeners.append(lambda loaded: prediction_cache.set_model_fingerprint(loaded.fingerprint))
+
+# --- 2d. INFERENCE EXECUTOR (see inference_executor.py) ---
+# Per-model admission control: each model runs at most *_MAX_CONCURRENCY calls at once with up
+# to *_QUEUE_DEPTH more waiting. Beyond that a request gets 429 + Retry-After right away (503
+# if it waited INFERENCE_QUEUE_TIMEOUT seconds), instead of every request slowing down together.
+# INFERENCE_PROCESSES > 0 runs the models listed in INFERENCE_OFFLOAD in forked worker processes.
+INFERENCE_PROCESSES = int(os.getenv('INFERENCE_PROCESSES', '0'))
+INFERENCE_OFFLOAD = {m.strip() for m in os.getenv('INFERENCE_OFFLOAD', 'crop,fertilizer').split(',') if m.strip()}
+INFERENCE_QUEUE_TIMEOUT = float(os.getenv('INFERENCE_QUEUE_TIMEOUT', '10'))
+INFERENCE_DEFAULT_CONCURRENCY = INFERENCE_PROCESSES or CPU_COUNT
+
+def init_inference_worker():
+    # Runs in each forked inference process: TFLite interpreters and batcher threads are never
+    # shared with the parent, and shutdown is left to the parent (not its server's signal handlers)
+    for slot in model_registry.slots.values():
+        slot.reset_after_fork(drop_models=slot.name == 'disease')
+    metrics.buffer_stages()
+    for sig in (signal.SIGTERM, signal.SIGQUIT, signal.SIGHUP, signal.SIGUSR1, signal.SIGUSR2, signal.SIGWINCH):
+        signal.signal(sig, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+inference = InferenceExecutor(processes=INFERENCE_PROCESSES, initializer=init_inference_worker)
+inference.add_model(
+    'disease',
+    concurrency=int(os.getenv('DISEASE_MAX_CONCURRENCY', str(DISEASE_POOL_SIZE * max(1, DISEASE_BATCH_MAX_SIZE)))),
+    max_depth=int(os.getenv('DISEASE_QUEUE_DEPTH', '32')),
+    max_wait=INFERENCE_QUEUE_TIMEOUT,
+    offload='disease' in INFERENCE_OFFLOAD,
+)
+inference.add_model(
+    'crop',
+    concurrency=int(os.getenv('CROP_MAX_CONCURRENCY', str(INFERENCE_DEFAULT_CONCURRENCY))),
+    max_depth=int(os.getenv('CROP_QUEUE_DEPTH', '64')),
+    max_wait=INFERENCE_QUEUE_TIMEOUT,
+    offload='crop' in INFERENCE_OFFLOAD,
+)
+inference.add_model(
+    'fertilizer',
+    concurrency=int(os.getenv('FERT_MAX_CONCURRENCY', str(INFERENCE_DEFAULT_CONCURRENCY))),
+    max_depth=int(os.getenv('FERT_QUEUE_DEPTH', '64')),
+    max_wait=INFERENCE_QUEUE_TIMEOUT,
+    offload='fertilizer' in INFERENCE_OFFLOAD,
+)
+
+for queue in inference.queues.values():
+    queue.queue_stats.observer = metrics.stage_observer(queue.name, 'queue_wait')
+    queue.exec_stats.observer = metrics.stage_observer(queue.name, 'execution')
+
+def on_model_swap(loaded):
+    # Inference processes are not re-forked: every call sends its pinned version and files, and
+    # a process that doesn't have that version loads it (ModelSlot.get with follow_versions)
+    metrics.model_load.set(loaded.load_seconds, loaded.name)
+
+def run_inference(model, fn, *args):
+    # Model call behind its queue; queue wait and execution time go into the Server-Timing header
+    result, timing = inference.run(model, fn, *args)
+    record_inference_timing(model, timing)
+    return result
+
+def record_inference_timing(model, timing):
+    if not has_app_context(): return # e.g. benchmarks calling the helpers directly
+    timings = g.setdefault('inference_timings', {})
+    queue_seconds, exec_seconds = timings.get(model, (0.0, 0.0))
+    timings[model] = (queue_seconds + timing.queue_seconds, exec_seconds + (timing.exec_seconds or 0.0))
+
+def inference_busy(e):
+    return jsonify({"error": str(e)}), e.status, {"Retry-After": str(e.retry_after)}
+
+def infer_disease(img_array, version=None, paths=None):
+    # In an inference process there is no batching across requests, so invoke directly
+    if inference.queues['disease'].offload:
+        return run_disease_batch(img_array, version, paths)
+    disease = disease_models.get(version)
+    if disease is None:
+        raise RuntimeError(f"Disease model could not be loaded: {disease_models.error}")
+    return predict_disease_tensor(img_array, disease.model)
+
+
 # --- 3. FLASK APP LOGIC ---
 
 app = Flask(__name__)
 CORS(app)
 
+def use_model(slot):
+    """The slot's current version, pinned until this request ends (a hot swap doesn't affect it)."""
+    pinned = g.setdefault('pinned_models', {})
+    if slot.name not in pinned:
+        pinned[slot.name] = slot.acquire()
+    return pinned[slot.name]
+
+@app.teardown_request
+def release_models(exc):
+    # Runs after streamed bodies finish too (stream_with_context keeps the request open)
+    for loaded in g.pop('pinned_models', {}).values():
+        if loaded is not None:
+            model_registry.slots[loaded.name].release(loaded)
+
+@app.before_request
+def start_request_timer():
+    if metrics.timing_enabled():
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # Route template (not the raw path) keeps label cardinality bounded
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    started = g.get('request_started')
+    metrics.observe_request(route, request.method, response.status_code,
+                            time.perf_counter() - started if started is not None else None)
+    return response
+
+@app.after_request
+def add_server_timing(response):
+    timings = g.get('inference_timings')
+    if timings:
+        response.headers['Server-Timing'] = ", ".join(
+            f"{model}-queue;dur={queue_seconds * 1000:.2f}, {model}-exec;dur={exec_seconds * 1000:.2f}"
+            for model, (queue_seconds, exec_seconds) in timings.items())
+    return response
+
+# --- REQUEST PROFILING (see profiler.py) ---
+# PROFILE_SECRET turns it on: a request sent with `X-Fasal-Profile: <secret>` is profiled (and
+# answers with X-Fasal-Profile-Id), PROFILE_SAMPLE_RATE profiles that fraction of all requests.
+# Without a secret the hooks below are never registered.
+request_profiler = profiler.RequestProfiler(
+    secret=os.getenv('PROFILE_SECRET'),
+    sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', '0')),
+    mode=os.getenv('PROFILE_MODE', 'sample'),
+    buffer_size=int(os.getenv('PROFILE_BUFFER_SIZE', '20')),
+    interval=float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000.0,
+)
+
+def start_profile():
+    if request.path.startswith('/admin/'): return
+    reason = request_profiler.should_profile(request.headers)
+    if reason is None: return
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    mode = request.headers.get(profiler.HEADER + '-Mode') or request.args.get('profile_mode')
+    g.profile = request_profiler.start(route, request.method, reason, mode)
+
+def finish_profile(response):
+    # Stopped when the response is closed, so streamed bodies (SSE chat, NDJSON) are included
+    active = g.pop('profile', None)
+    if active is not None:
+        response.headers[profiler.HEADER + '-Id'] = str(active.id)
+        response.call_on_close(lambda: active.stop(response.status_code))
+    return response
+
+def abort_profile(exc):
+    # Unhandled exception: after_request never ran
+    active = g.pop('profile', None)
+    if active is not None:
+        active.stop(500)
+
+if request_profiler.enabled:
+    app.before_request(start_profile)
+    app.after_request(finish_profile)
+    app.teardown_request(abort_profile)
+    print(f"Request profiling on (mode {request_profiler.mode}, sample rate {request_profiler.sample_rate}).")
+
+def require_profile_secret():
+    if not request_profiler.enabled:
+        return jsonify({"error": "Not found"}), 404
+    if not request_profiler.authorized(request.headers):
+        return jsonify({"error": "Forbidden"}), 403
+    return None
+
+@app.route('/admin/profiles', methods=['GET'])
+def handle_profile_list():
+    denied = require_profile_secret()
+    if denied: return denied
+    return jsonify({**request_profiler.stats(), "profiles": request_profiler.summaries()})
+
+@app.route('/admin/profiles/<int:profile_id>', methods=['GET'])
+def handle_profile_download(profile_id):
+    # ?format=text (top functions), collapsed (flamegraph input) or pstats (cprofile mode only)
+    denied = require_profile_secret()
+    if denied: return denied
+    summary, data = request_profiler.get(profile_id)
+    if summary is None:
+        return jsonify({"error": f"Profile {profile_id} not found (only the last {request_profiler.profiles.maxlen} are kept)"}), 404
+    output = request.args.get('format', 'text')
+    if output == 'collapsed':
+        return Response(profiler.as_collapsed(summary["mode"], data), content_type='text/plain; charset=utf-8')
+    if output == 'pstats':
+        if summary["mode"] != 'cprofile':
+            return jsonify({"error": "pstats output needs a cprofile-mode profile"}), 400
+        return Response(profiler.as_pstats(data), content_type='application/octet-stream',
+                        headers={"Content-Disposition": f"attachment; filename=profile-{profile_id}.pstats"})
+    if output == 'text':
+        return Response(profiler.as_text(summary["mode"], data), content_type='text/plain; charset=utf-8')
+    return jsonify({"error": "format must be text, collapsed or pstats"}), 400
+
 @app.route('/', methods=['GET'])
 def home():
     return "Fasal Sarthi Backend Server is running!"
 
 @app.route('/predict_disease', methods=['POST'])
 def handle_prediction():
-    # Get the interpreter
-    interpreter = get_disease_interpreter()
-    if interpreter is None:
-         error_msg = str(model_loading_error) if model_loading_error else "Disease model could not be loaded."
+    # Get the interpreter pool of the current model version
+    disease = use_model(disease_models)
+    if disease is None:
+         error_msg = disease_models.error or "Disease model could not be loaded."
          return jsonify({"error": f"Model loading failed: {error_msg}"}), 503
 
-    # Get input/output details
-    try:
-        input_details = interpreter.get_input_details()
-        output_details = interpreter.get_output_details()
-    except Exception as e:
-         print(f"Error getting interpreter details: {e}")
-         return jsonify({"error": "Failed to get model input/output details."}), 500
-
     # --- File handling (same as before) ---
     if 'file' not in request.files: return jsonify({"error": "No file part key found"}), 400
     file = request.files.get('file')
     if not file or file.filename == '': return jsonify({"error": "No selected file"}), 400
 
     try:
-        # --- Preprocessing (Ensure dtype and shape match model input) ---
         image_bytes = file.read()
-        img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-
-        # Get target shape from model details
-        input_shape = input_details[0]['shape'] # e.g., [1, 300, 300, 3]
-        target_height = input_shape[1]
-        target_width = input_shape[2]
-        img = img.resize((target_width, target_height))
-
-        img_array = tf.keras.preprocessing.image.img_to_array(img)
-        img_array = np.expand_dims(img_array, axis=0)
-
-        # Ensure input dtype matches
-        input_dtype = input_details[0]['dtype'] # e.g., np.float32 or np.uint8
-        img_array = img_array.astype(input_dtype)
-
-        # Handle normalization/quantization
-        # Check if the model expects input between 0-1, -1 to 1, or 0-255 (quantized)
-        input_scale, input_zero_point = input_details[0].get('quantization', (1.0, 0)) # Default for float models
-
-        if input_dtype == np.float32 and input_scale == 1.0 and input_zero_point == 0:
-             # Common case: Normalize float input to 0-1
-             img_array = img_array / 255.0
-        elif input_dtype == np.uint8:
-             # Quantized model - no normalization needed if input is already 0-255
-             pass # Assuming img_to_array gives 0-255
-        # Add other normalization logic if needed (e.g., /127.5 - 1.0 for -1 to 1)
-
-        # --- Prediction using TFLite Interpreter ---
-        interpreter.set_tensor(input_details[0]['index'], img_array)
-        interpreter.invoke() # Run inference
-        predictions = interpreter.get_tensor(output_details[0]['index'])
-
-        # Dequantize output if necessary
-        output_scale, output_zero_point = output_details[0].get('quantization', (1.0, 0))
-        if output_details[0]['dtype'] == np.uint8: # If output is quantized
-            predictions = (predictions.astype(np.float32) - output_zero_point) * output_scale
+
+        # --- Cache lookup (exact bytes first, then perceptual hash of the resized image) ---
+        preprocessor = disease.model.preprocessor
+        bytes_key = content_hash(image_bytes) if prediction_cache.enabled else None
+        cached = prediction_cache.get(bytes_key)
+        if cached is not None:
+            return jsonify(cached)
+
+        # --- Preprocessing (single pass into a reusable buffer, see preprocessing.py) ---
+        img = preprocessor.load_image(image_bytes)
+        phash_key = average_hash(img) if prediction_cache.enabled and PREDICTION_CACHE_PHASH else None
+        cached = prediction_cache.get(phash_key)
+        if cached is not None:
+            prediction_cache.put(bytes_key, cached)
+            return jsonify(cached)
+        img_array = preprocessor.preprocess_image(img)
+
+        # --- Prediction using TFLite Interpreter (micro-batched with other requests) ---
+        # (quantized model outputs come back dequantized, see invoke_disease_model)
+        predictions = run_inference('disease', infer_disease, img_array, disease.version, disease.paths)
 
         # --- Post-processing (same as before) ---
         predicted_class_index = np.argmax(predictions[0])
@@ -169,17 +519,205 @@ def handle_prediction():
              return jsonify({"error": "Model prediction resulted in invalid class index."}), 500
         predicted_class_name = CLASS_NAMES[predicted_class_index]
         confidence = float(np.max(predictions[0])) # Note: Confidence might need adjustment after dequantization
-        return jsonify({
+        result = {
             "predicted_disease": predicted_class_name,
             "confidence": f"{confidence * 100:.2f}%"
-        })
+        }
+        prediction_cache.put(bytes_key, result, disease.fingerprint)
+        prediction_cache.put(phash_key, result, disease.fingerprint)
+        return jsonify(result)
 
+    except InferenceRejected as e: return inference_busy(e)
     except Exception as e:
         print(f"Prediction error with TFLite model: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({"error": "Error processing image with TFLite model"}), 500
 
+# --- 3b. BULK FIELD SCAN (/predict_disease/bulk) ---
+# Extension workers photograph dozens of leaves per field visit. Instead of one request per
+# photo they send them all at once: many `file` parts and/or ZIP archives (as a `file` part or
+# as an application/zip body), plus an optional `field_id` form field.
+# - ZIP members are read one at a time from the upload (werkzeug spools big parts to a temp
+#   file, a raw body is spooled the same way), so an archive is never held in memory whole
+# - decode + resize run on DISEASE_BULK_DECODE_THREADS threads (PIL releases the GIL), at most
+#   two batches ahead of the model
+# - the model runs DISEASE_BULK_BATCH_SIZE images per invoke, behind the disease queue
+# The response has one result per image in upload order and a disease summary for the field.
+DISEASE_BULK_MAX_IMAGES = int(os.getenv('DISEASE_BULK_MAX_IMAGES', '200'))
+DISEASE_BULK_MAX_IMAGE_BYTES = int(float(os.getenv('DISEASE_BULK_MAX_IMAGE_MB', '15')) * 1024 * 1024)
+DISEASE_BULK_BATCH_SIZE = max(1, int(os.getenv('DISEASE_BULK_BATCH_SIZE', '16')))
+DISEASE_BULK_DECODE_THREADS = max(1, int(os.getenv('DISEASE_BULK_DECODE_THREADS', str(CPU_COUNT))))
+
+bulk_decode_pool = None
+bulk_decode_pool_pid = None
+bulk_decode_pool_lock = threading.Lock()
+
+def get_bulk_decode_pool():
+    # Created on first use in each worker (threads don't survive gunicorn's fork)
+    global bulk_decode_pool, bulk_decode_pool_pid
+    with bulk_decode_pool_lock:
+        if bulk_decode_pool is None or bulk_decode_pool_pid != os.getpid():
+            bulk_decode_pool = ThreadPoolExecutor(max_workers=DISEASE_BULK_DECODE_THREADS, thread_name_prefix='disease-decode')
+            bulk_decode_pool_pid = os.getpid()
+        return bulk_decode_pool
+
+def bulk_image_sources(opened):
+    """(name, read) for every image in the request, in upload order; read() returns its bytes.
+    Archives (and a spooled body) are appended to `opened` for the caller to close."""
+    content_type = (request.content_type or '').split(';')[0].strip().lower()
+    if content_type in ZIP_CONTENT_TYPES:
+        opened.append(spool_stream(request.stream))
+        uploads = [('upload.zip', opened[-1])]
+    else:
+        uploads = [(file.filename or f"file{i}", file) for i, file in enumerate(request.files.getlist('file'))]
+    sources = []
+    for name, upload in uploads:
+        if isinstance(upload, FileStorage) and not is_zip(upload):
+            sources.append((name, partial(read_upload, upload, DISEASE_BULK_MAX_IMAGE_BYTES)))
+            continue
+        try:
+            archive = zipfile.ZipFile(upload.stream if isinstance(upload, FileStorage) else upload)
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"{name} is not a valid ZIP archive: {e}")
+        opened.append(archive)
+        for info in zip_image_members(archive):
+            sources.append((f"{name}/{info.filename}", partial(read_zip_member, archive, info, DISEASE_BULK_MAX_IMAGE_BYTES)))
+    return sources
+
+def decode_bulk_image(preprocessor, image_bytes):
+    # On the decode pool: (cached result, None) or (None, ([H, W, 3] tensor, cache keys))
+    bytes_key = content_hash(image_bytes) if prediction_cache.enabled else None
+    cached = prediction_cache.get(bytes_key)
+    if cached is not None:
+        return cached, None
+    img = preprocessor.load_image(image_bytes)
+    phash_key = average_hash(img) if prediction_cache.enabled and PREDICTION_CACHE_PHASH else None
+    cached = prediction_cache.get(phash_key)
+    if cached is not None:
+        prediction_cache.put(bytes_key, cached)
+        return cached, None
+    # Copied out of this thread's reusable buffer, which the next image overwrites
+    return None, (preprocessor.preprocess_image(img)[0].copy(), (bytes_key, phash_key))
+
+def disease_result(prediction_row):
+    predicted_class_index = int(np.argmax(prediction_row))
+    if predicted_class_index >= len(CLASS_NAMES):
+        raise ValueError(f"Predicted index {predicted_class_index} out of bounds for CLASS_NAMES")
+    return {
+        "predicted_disease": CLASS_NAMES[predicted_class_index],
+        "confidence": f"{float(np.max(prediction_row)) * 100:.2f}%",
+    }
+
+def field_summary(results):
+    # Per-disease counts for the field, most frequent first; "healthy" classes counted apart
+    counts, confidence = Counter(), Counter()
+    for result in results:
+        if "predicted_disease" in result:
+            counts[result["predicted_disease"]] += 1
+            confidence[result["predicted_disease"]] += float(result["confidence"].rstrip('%'))
+    predicted = sum(counts.values())
+    healthy = sum(count for name, count in counts.items() if 'healthy' in name.lower())
+    diseases = [
+        {"disease": name, "count": count, "share": round(count / predicted, 3),
+         "mean_confidence": f"{confidence[name] / count:.2f}%"}
+        for name, count in counts.most_common()
+    ]
+    top_disease = next((d["disease"] for d in diseases if 'healthy' not in d["disease"].lower()), None)
+    return {
+        "images": len(results),
+        "predicted": predicted,
+        "errors": len(results) - predicted,
+        "healthy": healthy,
+        "diseased": predicted - healthy,
+        "diseased_share": round((predicted - healthy) / predicted, 3) if predicted else None,
+        "top_disease": top_disease,
+        "diseases": diseases,
+    }
+
+@app.route('/predict_disease/bulk', methods=['POST'])
+def handle_prediction_bulk():
+    disease = use_model(disease_models)
+    if disease is None:
+         error_msg = disease_models.error or "Disease model could not be loaded."
+         return jsonify({"error": f"Model loading failed: {error_msg}"}), 503
+
+    opened = []
+    try:
+        try:
+            sources = bulk_image_sources(opened)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if not sources:
+            return jsonify({"error": "No images found (send 'file' parts or a ZIP archive)"}), 400
+        if len(sources) > DISEASE_BULK_MAX_IMAGES:
+            return jsonify({"error": f"Too many images in one request ({len(sources)}), max is {DISEASE_BULK_MAX_IMAGES}."}), 413
+
+        preprocessor = disease.model.preprocessor
+        decode_pool = get_bulk_decode_pool()
+        results = [None] * len(sources)
+        batch = [] # (index, tensor, cache keys)
+
+        def run_batch():
+            predictions = run_inference('disease', run_disease_batch, np.stack([tensor for _, tensor, _ in batch]), disease.version, disease.paths)
+            for (index, _, (bytes_key, phash_key)), row in zip(batch, predictions):
+                result = disease_result(row)
+                prediction_cache.put(bytes_key, result, disease.fingerprint)
+                prediction_cache.put(phash_key, result, disease.fingerprint)
+                results[index].update(result)
+            batch.clear()
+
+        def collect(index, future):
+            try:
+                cached, decoded = future.result()
+            except Exception as e:
+                print(f"Bulk scan: could not read {results[index]['name']}: {e}")
+                results[index]["error"] = "Could not read image"
+                return
+            if cached is not None:
+                results[index].update(cached)
+                return
+            batch.append((index, *decoded))
+            if len(batch) >= DISEASE_BULK_BATCH_SIZE:
+                run_batch()
+
+        # Archive members are read here, in order; decoding runs ahead on the pool
+        in_flight = deque()
+        for index, (name, read) in enumerate(sources):
+            results[index] = {"index": index, "name": name}
+            try:
+                image_bytes = read()
+            except (ValueError, OSError, zipfile.BadZipFile) as e:
+                results[index]["error"] = str(e)
+                continue
+            in_flight.append((index, decode_pool.submit(decode_bulk_image, preprocessor, image_bytes)))
+            if len(in_flight) > 2 * DISEASE_BULK_BATCH_SIZE:
+                collect(*in_flight.popleft())
+        while in_flight:
+            collect(*in_flight.popleft())
+        if batch:
+            run_batch()
+
+        summary = field_summary(results)
+        print(f"Bulk disease scan: {len(results)} images, {summary['predicted']} predicted, {summary['errors']} failed")
+        return jsonify({
+            "field_id": request.form.get('field_id'),
+            "count": len(results),
+            "errors": summary["errors"],
+            "summary": summary,
+            "results": results,
+        })
+
+    except InferenceRejected as e: return inference_busy(e)
+    except Exception as e:
+        print(f"Bulk prediction error with TFLite model: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": "Error processing images with TFLite model"}), 500
+    finally:
+        for f in reversed(opened):
+            f.close()
+
 ''''--------------------------- CROP RECOMMENDATION MODEL -----------------------------------------'''
     
 # --- 4. CROP RECOMMENDATION MODEL LOADING ---
@@ -206,10 +744,33 @@ POSSIBLE_SOIL_TYPES = sorted(['Black (Vertisol)', 'Laterite', 'Loamy', 'Red', 'S
 POSSIBLE_IRRIGATION_TYPES = sorted(['Drip', 'Groundwater', 'Mixed', 'Rainfed', 'Sprinkler'])
 POSSIBLE_PREVIOUS_CROPS = sorted(['Dal', 'Fallow', 'Ganna', 'Makka', 'Moongfali', 'Rice', 'Sarson', 'Wheat'])
 
-try:
-    crop_model_stacking = joblib.load(CROP_MODEL_STACKING_PATH)
-    crop_scaler = joblib.load(CROP_SCALER_PATH)
-    crop_encoder_final = joblib.load(CROP_ENCODER_FINAL_PATH)
+# Sample plot a new crop model version must predict before it is swapped in
+CROP_WARMUP_REQUEST = {
+    'soil_ph': 6.5, 'nitrogen_kg_ha': 200, 'phosphorus_kg_ha': 40, 'potassium_kg_ha': 180,
+    'annual_rainfall_mm': 900, 'avg_temp_c': 25, 'avg_humidity_pct': 55,
+    'soil_type': 'Loamy', 'irrigation_type': 'Drip', 'previous_crop': 'Wheat',
+}
+
+# The stacking model was fitted on a DataFrame, so sklearn warns on every ndarray predict. Wrapping each
+# call in a DataFrame doubles predict time (every sub-estimator re-validates it); the column order is
+# checked against feature_names_in_ at load time instead and this one warning is silenced.
+warnings.filterwarnings('ignore', message='X does not have valid feature names', category=UserWarning, module='sklearn')
+
+# One loaded crop model version (the encoder carries that version's scaler)
+CropModels = namedtuple('CropModels', 'stacking scaler label_encoder feature_encoder')
+
+def load_crop_models(paths):
+    crop_model_stacking = load_joblib(paths['model']) # The stacking ensemble has no compact form
+    artifacts = open_artifacts(paths.get('artifacts'), 'crop', paths)
+    if artifacts is not None:
+        crop_scaler = ScalerParams(
+            artifacts.arrays['scaler_mean'], artifacts.arrays['scaler_scale'],
+            artifacts.params['with_mean'], artifacts.params['with_std'], artifacts.lists['scaler_features'])
+        crop_encoder_final = LabelDecoder(artifacts.lists['label_classes'])
+        print(f"Crop scaler and encoder loaded from {artifacts.label}.")
+    else:
+        crop_scaler = joblib.load(paths['scaler'])
+        crop_encoder_final = joblib.load(paths['encoder'])
 
     # Validate scaler features
     scaler_features = getattr(crop_scaler, 'feature_names_in_', CROP_NUMERICAL_FEATURES)
@@ -225,79 +786,62 @@ try:
     elif not model_features_count:
          print("Warning: Could not read n_features_in_ from model.")
 
+    # Check the fitted column names once here; requests pass bare ndarrays in this order (see below)
+    fitted_names = getattr(crop_model_stacking, 'feature_names_in_', None)
+    if fitted_names is not None and list(fitted_names) != CROP_FULL_FEATURE_NAMES:
+        raise ValueError(f"model was fitted on columns {list(fitted_names)}, expected {CROP_FULL_FEATURE_NAMES}")
+
     print(f"Model expects features in this order: {CROP_FULL_FEATURE_NAMES}")
+
+    # Precompiled numpy encoder (see crop_features.py) - replaces per-request DataFrames
+    crop_feature_encoder = CropFeatureEncoder(CROP_FULL_FEATURE_NAMES, CROP_NUMERICAL_FEATURES, crop_scaler)
     print("Crop Recommendation (Stacking) model, scaler, and encoder loaded.")
+    return CropModels(crop_model_stacking, crop_scaler, crop_encoder_final, crop_feature_encoder)
 
-except Exception as e:
-    crop_full_feature_names = []
+def warm_up_crop_models(crop):
+    feature_matrix, _ = crop.feature_encoder.encode_rows([CROP_WARMUP_REQUEST] * 32)
+    predicted = crop.label_encoder.inverse_transform(crop.stacking.predict(feature_matrix))
+    if len(predicted) != 32 or not all(isinstance(name, str) and name for name in predicted):
+        raise ValueError(f"warm-up predicted {predicted[:3]!r}")
 
+crop_models = model_registry.register(ModelSlot(
+    'crop',
+    {'model': CROP_MODEL_STACKING_PATH, 'scaler': CROP_SCALER_PATH, 'encoder': CROP_ENCODER_FINAL_PATH, **artifact_paths('crop')},
+    load_crop_models, warm_up_crop_models))
+
+
+def infer_crop(feature_matrix, version=None, paths=None):
+    # Stacking model + label decoding (runs in an inference process when offloaded)
+    crop = crop_models.get(version, paths).model
+    with stage('crop', 'predict'):
+        prediction_encoded = crop.stacking.predict(feature_matrix)
+    with stage('crop', 'inverse_transform'):
+        return crop.label_encoder.inverse_transform(prediction_encoded).tolist()
 
 # --- FINAL UPDATE: CROP RECOMMENDATION ENDPOINT (/recommend_crop) ---
 @app.route('/recommend_crop', methods=['POST'])
 # @token_required
 def handle_crop_recommendation():
-    if not crop_model_stacking or not crop_scaler or not crop_encoder_final or len(CROP_FULL_FEATURE_NAMES) != 25: # Check for 25
+    crop = use_model(crop_models)
+    if crop is None or len(CROP_FULL_FEATURE_NAMES) != 25: # Check for 25
         return jsonify({"error": "Crop Recommendation model setup incorrect or not loaded."}), 500
 
     data = request.json
-    print(f"Received data for crop rec: {data}")
 
     try:
-        # 1. Prepare Input DataFrame matching the full expected features
-        input_df = pd.DataFrame(columns=CROP_FULL_FEATURE_NAMES, index=[0]).fillna(0.0)
-
-        # 2. Extract and Validate Numerical Features
-        numerical_values_dict = {}
-        for feature_name in CROP_NUMERICAL_FEATURES:
-            if feature_name not in data: raise KeyError(f"Missing: {feature_name}")
-            value = float(data[feature_name])
-            input_df.loc[0, feature_name] = value # Store raw first
-            numerical_values_dict[feature_name] = value
-
-        # 3. Scale Numerical Features
-        numerical_df_for_scaling = pd.DataFrame([numerical_values_dict], columns=CROP_NUMERICAL_FEATURES)
-        scaled_numerical_values = crop_scaler.transform(numerical_df_for_scaling)
-        input_df[CROP_NUMERICAL_FEATURES] = scaled_numerical_values # Put scaled back
-
-        # 4. Extract and One-Hot Encode Categorical Features using EXACT model column names
-        # Soil Type
-        soil_type = data.get('soil_type') # e.g., 'Black (Vertisol)'
-        if not soil_type: raise KeyError("Missing: soil_type")
-        soil_col_name = f'soil_type_{soil_type}'
-        if soil_col_name in input_df.columns: input_df.loc[0, soil_col_name] = 1.0
-        else: raise ValueError(f"Unknown/Unsupported soil_type: {soil_type}")
-
-        # Irrigation Type
-        irrigation_type = data.get('irrigation_type') # e.g., 'Groundwater'
-        if not irrigation_type: raise KeyError("Missing: irrigation_type")
-        irrigation_col_name = f'irrigation_type_{irrigation_type}'
-        if irrigation_col_name in input_df.columns: input_df.loc[0, irrigation_col_name] = 1.0
-        else: raise ValueError(f"Unknown/Unsupported irrigation_type: {irrigation_type}")
-
-        # Previous Crop
-        previous_crop = data.get('previous_crop') # e.g., 'Wheat'
-        if not previous_crop: raise KeyError("Missing: previous_crop")
-        previous_crop_col_name = f'previous_crop_{previous_crop}'
-        if previous_crop_col_name in input_df.columns:
-            input_df.loc[0, previous_crop_col_name] = 1.0
-        else:
-            # Handle crops not explicitly in the model's feature list (treat as 'Other'/all zeros)
-            print(f"Warning: Received previous_crop '{previous_crop}' not in model features, treating as 'Other'.")
-            # If model strictly requires one of the known crops, raise ValueError instead.
-
-        # 5. Ensure final DataFrame has the correct column order (already ensured by DataFrame creation)
-        input_final = input_df[CROP_FULL_FEATURE_NAMES] # Re-apply order just to be safe
-        print(f"Input shape to model: {input_final.shape}") # Should be (1, 25)
+        # 1-5. Encode straight into the model's 25-column row (scaled numericals + one-hot categoricals)
+        # (the 'encode' stage is what scaler.transform + get_dummies used to be)
+        with stage('crop', 'encode'):
+            input_final = crop.model.feature_encoder.encode(data)
 
-        # 6. Make Prediction
-        prediction_encoded = crop_model_stacking.predict(input_final)
-        predicted_crop_name = crop_encoder_final.inverse_transform(prediction_encoded)
+        # 6. Make Prediction (behind the crop model's queue, see inference_executor.py)
+        predicted_crop_name = run_inference('crop', infer_crop, input_final, crop.version, crop.paths)
 
-        print(f"Prediction successful: {predicted_crop_name[0]}")
         return jsonify({"recommended_crop": predicted_crop_name[0]})
 
     except KeyError as e: return jsonify({"error": f"Missing input feature: {e}"}), 400
     except ValueError as e: return jsonify({"error": f"Invalid input value: {e}"}), 400
+    except InferenceRejected as e: return inference_busy(e)
     except Exception as e:
         print(f"Error during crop recommendation: {e}")
         import traceback
@@ -305,89 +849,168 @@ def handle_crop_recommendation():
         return jsonify({"error": "Failed to recommend crop due to an internal error."}), 500
 
 
+
+# --- CROP RECOMMENDATION BATCH ENDPOINT (/recommend_crop/batch) ---
+# For village surveys: many plots in one request (JSON array, CSV or NDJSON body).
+# All plots are encoded into one feature matrix and predicted in chunks of CROP_BATCH_CHUNK_SIZE.
+CROP_BATCH_MAX_ROWS = int(os.getenv('CROP_BATCH_MAX_ROWS', '20000'))
+CROP_BATCH_CHUNK_SIZE = int(os.getenv('CROP_BATCH_CHUNK_SIZE', '2000'))
+
+def batch_row_error(e):
+    # Same messages as the single-plot endpoint
+    if isinstance(e, KeyError): return f"Missing input feature: {e}"
+    return f"Invalid input value: {e}"
+
+@app.route('/recommend_crop/batch', methods=['POST'])
+def handle_crop_recommendation_batch():
+    crop = use_model(crop_models)
+    if crop is None or len(CROP_FULL_FEATURE_NAMES) != 25: # Check for 25
+        return jsonify({"error": "Crop Recommendation model setup incorrect or not loaded."}), 500
+
+    try:
+        rows = parse_batch_rows(request.get_data(), request.content_type)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if len(rows) > CROP_BATCH_MAX_ROWS:
+        return jsonify({"error": f"Too many plots in one request ({len(rows)}), max is {CROP_BATCH_MAX_ROWS}."}), 413
+
+    try:
+        # 1. Encode every plot into one matrix; bad rows are reported, not predicted
+        parse_errors = {i: row for i, row in enumerate(rows) if isinstance(row, Exception)}
+        with stage('crop', 'encode'):
+            feature_matrix, errors = crop.model.feature_encoder.encode_rows([None if isinstance(row, Exception) else row for row in rows])
+        errors.update(parse_errors)
+        valid_index = np.array([i for i in range(len(rows)) if i not in errors], dtype=np.intp)
+
+        # 2. Predict valid rows in chunks (one stacking-model call per chunk)
+        predicted = {}
+        for start in range(0, len(valid_index), CROP_BATCH_CHUNK_SIZE):
+            chunk_index = valid_index[start:start + CROP_BATCH_CHUNK_SIZE]
+            predicted_names = run_inference('crop', infer_crop, feature_matrix[chunk_index], crop.version, crop.paths)
+            predicted.update(zip(chunk_index.tolist(), predicted_names))
+
+        # 3. Results in input order
+        results = []
+        for i in range(len(rows)):
+            if i in predicted:
+                results.append({"index": i, "recommended_crop": predicted[i]})
+            else:
+                results.append({"index": i, "error": batch_row_error(errors[i])})
+
+        print(f"Crop batch: {len(rows)} plots, {len(predicted)} predicted, {len(errors)} invalid")
+        return jsonify({"count": len(rows), "errors": len(errors), "results": results})
+
+    except InferenceRejected as e: return inference_busy(e)
+    except Exception as e:
+        print(f"Error during batch crop recommendation: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": "Failed to recommend crops due to an internal error."}), 500
+
 # ... (Existing model loading code for Disease, CropRec) ...
 
 # --- 8. FERTILIZER RECOMMENDATION MODEL LOADING ---
 FERT_MODEL_PATH = 'random_forest_model.joblib'
 FERT_COLUMNS_PATH = 'model_columns.joblib'
 FERT_ENCODER_PATH = 'label_encoder.joblib'
-
-try:
-    fert_model = joblib.load(FERT_MODEL_PATH)
-    fert_model_columns = joblib.load(FERT_COLUMNS_PATH) # Load the expected columns
-    fert_encoder = joblib.load(FERT_ENCODER_PATH)
+# Bulk mode: rows per predict call and the forest's n_jobs (unset keeps the saved model's value)
+FERT_BATCH_CHUNK_SIZE = int(os.getenv('FERT_BATCH_CHUNK_SIZE', '5000'))
+FERT_N_JOBS = int(os.getenv('FERT_N_JOBS')) if os.getenv('FERT_N_JOBS') else None
+# Compiled tree engine: used for inputs up to FERT_COMPILED_MAX_ROWS rows (single requests, small
+# chunks); bigger chunks go to sklearn's Cython predict, which is faster at that size
+FERT_COMPILED = os.getenv('FERT_COMPILED', '1') == '1'
+FERT_COMPILED_MAX_ROWS = int(os.getenv('FERT_COMPILED_MAX_ROWS', '256'))
+
+# Sample row a new fertilizer model version must predict before it is swapped in
+FERT_WARMUP_REQUEST = {
+    'Temparature': 26, 'Humidity': 52, 'Moisture': 38, 'Nitrogen': 37, 'Potassium': 0,
+    'Phosphorous': 0, 'Soil_Type': 'Sandy', 'Crop_Type': 'Maize',
+}
+
+# One loaded fertilizer model version
+FertilizerModels = namedtuple('FertilizerModels', 'forest columns label_encoder feature_encoder compiled')
+
+def set_fert_n_jobs(fert_model):
+    if FERT_N_JOBS is not None:
+        fert_model.n_jobs = FERT_N_JOBS # Trees are evaluated in parallel on big chunks
+
+def load_fertilizer_artifacts(artifacts, paths):
+    # The compiled forest straight from memory-mapped arrays (verified against sklearn at export)
+    arrays = artifacts.arrays
+    fert_compiled_model = CompiledForest(
+        arrays['feature'], arrays['threshold'], arrays['children'], arrays['value'], arrays['roots'],
+        artifacts.params['max_depth'], np.asarray(artifacts.lists['forest_classes']))
+    fert_compiled_model.n_features_in_ = artifacts.params['n_features_in']
+    # Chunks above FERT_COMPILED_MAX_ROWS are faster in sklearn: its forest is unpickled on the
+    # first such chunk (without the joblib file, the compiled forest takes every size)
+    fert_model = LazyJoblib(paths['model'], 'r' if MODEL_MMAP else None, set_fert_n_jobs) if os.path.exists(paths['model']) else None
+    fert_model_columns = artifacts.lists['columns']
+    fert_encoder = LabelDecoder(artifacts.lists['label_classes'])
+    print(f"Fertilizer Recommendation model, columns, and encoder loaded from {artifacts.label}.")
+    return FertilizerModels(fert_model, fert_model_columns, fert_encoder, FertilizerFeatureEncoder(fert_model_columns), fert_compiled_model)
+
+def load_fertilizer_models(paths):
+    artifacts = open_artifacts(paths.get('artifacts'), 'fertilizer', paths) if FERT_COMPILED else None
+    if artifacts is not None:
+        return load_fertilizer_artifacts(artifacts, paths)
+    try:
+        fert_model = load_joblib(paths['model'])
+        fert_model_columns = joblib.load(paths['columns']) # Load the expected columns
+        fert_encoder = joblib.load(paths['encoder'])
+    except FileNotFoundError as e:
+        print(f"Error loading Fertilizer model file: {e}. Make sure joblib files are in the correct folder.")
+        raise
+    fert_feature_encoder = FertilizerFeatureEncoder(fert_model_columns)
+    set_fert_n_jobs(fert_model)
+    # Flattened numpy version of the forest (see tree_engine.py), verified against sklearn
+    fert_compiled_model = compile_forest(fert_model, "fertilizer forest") if FERT_COMPILED else None
     print("Fertilizer Recommendation model, columns, and encoder loaded successfully.")
-except FileNotFoundError as e:
-    print(f"Error loading Fertilizer model file: {e}. Make sure joblib files are in the correct folder.")
-    fert_model = None
-    fert_model_columns = None
-    fert_encoder = None
-except Exception as e:
-    print(f"Error loading Fertilizer Recommendation model: {e}")
-    fert_model = None
-    fert_model_columns = None
-    fert_encoder = None
+    return FertilizerModels(fert_model, fert_model_columns, fert_encoder, fert_feature_encoder, fert_compiled_model)
+
+def warm_up_fertilizer_models(fert):
+    feature_matrix, valid, _ = fert.feature_encoder.encode_rows([FERT_WARMUP_REQUEST] * 32)
+    predicted = fert.label_encoder.inverse_transform(predict_fertilizer(feature_matrix, fert))
+    if fert.forest is not None and getattr(fert.forest, 'loaded', True):
+        fert.forest.predict(feature_matrix[:1]) # sklearn path too (bulk chunks); not a lazy one
+    if len(predicted) != len(valid) or len(valid) != 32:
+        raise ValueError(f"warm-up predicted {len(predicted)} of 32 rows")
+
+fert_models = model_registry.register(ModelSlot(
+    'fertilizer',
+    {'model': FERT_MODEL_PATH, 'columns': FERT_COLUMNS_PATH, 'encoder': FERT_ENCODER_PATH, **artifact_paths('fertilizer')},
+    load_fertilizer_models, warm_up_fertilizer_models))
 
 # ... (Existing Flask App logic, routes for /, /predict_disease, /sarthi_ai_chat, /recommend_crop, /get_weather) ...
 
+def predict_fertilizer(feature_matrix, fert):
+    if fert.compiled is not None and (len(feature_matrix) <= FERT_COMPILED_MAX_ROWS or fert.forest is None):
+        return fert.compiled.predict(feature_matrix)
+    return fert.forest.predict(feature_matrix)
+
+def infer_fertilizer(feature_matrix, version=None, paths=None):
+    # Forest + label decoding (runs in an inference process when offloaded)
+    fert = fert_models.get(version, paths).model
+    with stage('fertilizer', 'predict'):
+        prediction_encoded = predict_fertilizer(feature_matrix, fert)
+    with stage('fertilizer', 'inverse_transform'):
+        return fert.label_encoder.inverse_transform(prediction_encoded).tolist()
+
 # --- 9. NEW FERTILIZER RECOMMENDATION ENDPOINT ---
 @app.route('/recommend_fertilizer', methods=['POST'])
 def handle_fertilizer_recommendation():
-    if not fert_model or not fert_model_columns or not fert_encoder:
+    fert = use_model(fert_models)
+    if fert is None:
         return jsonify({"error": "Fertilizer Recommendation model is not loaded."}), 500
 
     data = request.json
 
-    # Expected numerical features from model_columns.joblib (check names carefully)
-    # Example names, adjust based on your actual columns:
-    num_features = ['Temparature', 'Humidity', 'Moisture', 'Nitrogen', 'Potassium', 'Phosphorous']
-    
-    # Expected categorical features (from model_columns.joblib)
-    soil_prefix = 'Soil_Type_'
-    crop_prefix = 'Crop_Type_'
-
     try:
-        # Create a dictionary for the input, starting with numerical values
-        input_data = {feat: float(data[feat]) for feat in num_features if feat in data}
-
-        # Get the Soil Type and Crop Type from input
-        soil_type = data.get('Soil_Type')
-        crop_type = data.get('Crop_Type')
-
-        if not soil_type or not crop_type:
-             raise KeyError("Missing Soil_Type or Crop_Type in input")
+        # One-hot encode Soil_Type / Crop_Type + numerical values into the model's column order
+        with stage('fertilizer', 'encode'):
+            input_final = fert.model.feature_encoder.encode(data)
 
-        # --- One-Hot Encode Categorical Features ---
-        # Create a DataFrame with columns matching the trained model, initialized to 0
-        input_df = pd.DataFrame(columns=fert_model_columns, index=[0]).fillna(0)
-
-        # Fill in the numerical values we received
-        for key, value in input_data.items():
-            if key in input_df.columns:
-                 input_df.loc[0, key] = value
-
-        # Set the correct Soil_Type column to 1
-        soil_col_name = soil_prefix + soil_type
-        if soil_col_name in input_df.columns:
-            input_df.loc[0, soil_col_name] = 1
-        else:
-             raise ValueError(f"Unknown Soil_Type: {soil_type}")
-
-        # Set the correct Crop_Type column to 1
-        crop_col_name = crop_prefix + crop_type
-        if crop_col_name in input_df.columns:
-            input_df.loc[0, crop_col_name] = 1
-        else:
-            raise ValueError(f"Unknown Crop_Type: {crop_type}")
-            
-        # Ensure the order matches exactly (should already match if created correctly)
-        input_final = input_df[fert_model_columns]
-
-        # --- Make Prediction ---
-        prediction_encoded = fert_model.predict(input_final)
-        
-        # Decode the prediction using the label encoder
-        predicted_fertilizer = fert_encoder.inverse_transform(prediction_encoded)
+        # --- Make Prediction (decoded with the label encoder, behind the fertilizer queue) ---
+        predicted_fertilizer = run_inference('fertilizer', infer_fertilizer, input_final, fert.version, fert.paths)
 
         return jsonify({
             "recommended_fertilizer": predicted_fertilizer[0]
@@ -399,12 +1022,66 @@ def handle_fertilizer_recommendation():
     except ValueError as e:
          print(f"Invalid input value: {e}")
          return jsonify({"error": str(e)}), 400
+    except InferenceRejected as e: return inference_busy(e)
     except Exception as e:
         print(f"Error during fertilizer recommendation: {e}")
         return jsonify({"error": "Failed to recommend fertilizer"}), 500
 
 
 
+# --- 9b. FERTILIZER BULK ENDPOINT (NDJSON in, NDJSON out) ---
+# Cooperative-scale planning: rows are read from the request stream, encoded and predicted
+# FERT_BATCH_CHUNK_SIZE at a time, and results are streamed back, so memory stays bounded
+# even for 100k-row uploads. A JSON array / CSV body is also accepted (read in one go).
+def predict_fertilizer_chunk(rows, offset, fert):
+    # fert: the ModelVersion pinned by the request
+    with stage('fertilizer', 'encode'):
+        feature_matrix, valid, errors = fert.model.feature_encoder.encode_rows(rows)
+    predicted = {}
+    if valid:
+        predicted = dict(zip(valid, run_inference('fertilizer', infer_fertilizer, feature_matrix, fert.version, fert.paths)))
+    for i in range(len(rows)):
+        if i in predicted:
+            yield {"index": offset + i, "recommended_fertilizer": predicted[i]}
+        else:
+            error = errors[i]
+            message = f"Missing input value: {error}" if isinstance(error, KeyError) else str(error)
+            yield {"index": offset + i, "error": message}
+
+@app.route('/recommend_fertilizer/batch', methods=['POST'])
+def handle_fertilizer_recommendation_batch():
+    fert = use_model(fert_models)
+    if fert is None:
+        return jsonify({"error": "Fertilizer Recommendation model is not loaded."}), 500
+
+    content_type = (request.content_type or '').split(';')[0].strip().lower()
+    if content_type in NDJSON_CONTENT_TYPES:
+        rows = (parse_ndjson_line(line) for line in iter_ndjson_lines(request.stream))
+    else:
+        try:
+            rows = parse_batch_rows(request.get_data(), request.content_type)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    def generate():
+        offset = 0
+        try:
+            for chunk in iter_chunks(rows, FERT_BATCH_CHUNK_SIZE):
+                lines = [json.dumps(result, ensure_ascii=False) for result in predict_fertilizer_chunk(chunk, offset, fert)]
+                yield "\n".join(lines) + "\n"
+                offset += len(chunk)
+            print(f"Fertilizer batch: streamed {offset} rows")
+        except InferenceRejected as e:
+            # Model queue full: the client can resend the rows from `index` on after Retry-After
+            yield json.dumps({"index": offset, "error": str(e)}) + "\n"
+        except Exception as e:
+            # Headers are already sent; report the failure as the last NDJSON line
+            print(f"Error during batch fertilizer recommendation: {e}")
+            yield json.dumps({"index": offset, "error": "Failed to recommend fertilizer"}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 # --- CHATBOT SETUP (Direct API Call) ---
 # --- CHATBOT SETUP ---
 # Load key from environment variable
@@ -413,7 +1090,28 @@ if not GOOGLE_API_KEY:
     print("ERROR: GOOGLE_API_KEY environment variable not set!")
     # Optionally exit or handle the error
 # Hum 'v1beta' URL ka use karenge (jo API keys support karta hai)
-GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1/models/gemini-2.5-flash:generateContent?key={GOOGLE_API_KEY}"
+# GEMINI_API_BASE can point at a local stub (benchmarks/stub_upstreams.py) for load tests
+GEMINI_API_BASE = os.getenv('GEMINI_API_BASE', "https://generativelanguage.googleapis.com").rstrip('/')
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', "gemini-2.5-flash")
+GEMINI_API_URL = f"{GEMINI_API_BASE}/v1/models/{GEMINI_MODEL}:generateContent?key={GOOGLE_API_KEY}"
+# Streaming variant: the reply arrives as Server-Sent Events, one partial candidate per event
+GEMINI_STREAM_URL = f"{GEMINI_API_BASE}/v1/models/{GEMINI_MODEL}:streamGenerateContent?alt=sse&key={GOOGLE_API_KEY}"
+
+# --- OUTBOUND HTTP CLIENTS (see http_client.py) ---
+# Keep-alive pool per upstream, (connect, read) timeouts, jittered retries and a circuit breaker
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05'))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '2'))
+HTTP_BREAKER_THRESHOLD = int(os.getenv('HTTP_BREAKER_THRESHOLD', '5'))   # Consecutive failures that open the circuit
+HTTP_BREAKER_RESET = float(os.getenv('HTTP_BREAKER_RESET', '30'))        # Seconds before a trial call is allowed
+gemini_client = get_client(
+    'gemini',
+    connect_timeout=HTTP_CONNECT_TIMEOUT,
+    read_timeout=float(os.getenv('GEMINI_READ_TIMEOUT', '30')),
+    retries=HTTP_RETRIES,
+    failure_threshold=HTTP_BREAKER_THRESHOLD,
+    reset_timeout=HTTP_BREAKER_RESET,
+)
+gemini_client.latency.observer = metrics.stage_observer('upstream', 'gemini') # Per attempt, incl. retries
 
 chat_prompt_context = """
 तुम 'फसल सारथी' हो, एक विशेषज्ञ AI सहायक जो केवल हिंदी में किसानों की खेती-बाड़ी (फार्मिंग) में मदद करते हो।
@@ -424,172 +1122,751 @@ chat_prompt_context = """
 """
 print("Gemini AI Chatbot (Direct API) is ready.")
 
+# --- CHAT SESSIONS (see chat_sessions.py) ---
+# Clients that send a session_id only need to send the new message: the server keeps the
+# last CHAT_CONTEXT_TOKENS worth of turns and the serialized prompt prefix per session.
+# CHAT_SESSION_DB (SQLite file) shares sessions across workers and restarts.
+chat_sessions = ChatSessionStore(
+    chat_prompt_context,
+    token_budget=int(os.getenv('CHAT_CONTEXT_TOKENS', '2000')),
+    max_sessions=int(os.getenv('CHAT_SESSION_MAX', '10000')),
+    ttl_seconds=float(os.getenv('CHAT_SESSION_TTL', '21600')),
+    db_path=os.getenv('CHAT_SESSION_DB'),
+)
+
+# --- FAQ ANSWER CACHE (see faq_cache.py) ---
+# First questions of a conversation (no earlier user turns) are answered from cache when an
+# earlier question matches exactly after normalization. FAQ_CACHE_THRESHOLD < 1 also allows
+# near-duplicates (n-gram similarity >= threshold, floored at 0.95, same crop/negation words)
+faq_cache = FAQCache(
+    max_entries=int(os.getenv('FAQ_CACHE_SIZE', '2000')), # 0 disables the cache
+    ttl_seconds=float(os.getenv('FAQ_CACHE_TTL', '259200')),
+    threshold=float(os.getenv('FAQ_CACHE_THRESHOLD', '1')),
+)
+
 
 # --- CHATBOT ENDPOINT (Direct API Call) ---
-@app.route('/sarthi_ai_chat', methods=['POST'])
-def handle_chat():
-    if not GOOGLE_API_KEY: return jsonify({"error": "Chatbot API key not configured."}), 503
+def history_turns(history):
+    # Map frontend roles ('user'/'bot') to Gemini roles ('user'/'model'), skipping malformed entries
+    return [("user" if msg.get("role") == "user" else "model", msg["message"])
+            for msg in history if isinstance(msg, dict) and "message" in msg]
+
+def build_chat_payload(user_message, history):
+    # --- Format payload for Gemini API with history ---
+    # Combine system prompt, previous history, and new user message
+    api_contents = [{"parts": [{"text": chat_prompt_context}]}] # Start with system prompt/initial context
+
+    # Add existing history, ensuring correct roles ('user' and 'model')
+    for gemini_role, text in history_turns(history):
+         api_contents.append({"role": gemini_role, "parts": [{"text": text}]})
+
+    # Add the new user message
+    api_contents.append({"role": "user", "parts": [{"text": user_message}]})
+
+    return {
+        "contents": api_contents,
+        # Optional: Add generationConfig if needed (temperature, etc.)
+        # "generationConfig": { ... }
+        # Optional: Add safetySettings if needed
+        # "safetySettings": [ ... ]
+    }
 
-    data = request.json
+class SessionExpired(ValueError):
+    """A follow-up for a session this process doesn't have (other worker without CHAT_SESSION_DB,
+    restart, LRU/TTL eviction): the client must resend its full history."""
+
+def prepare_chat_request(user_message, history, session_id, session_started=False):
+    """Serialized Gemini request body and the ChatSession it belongs to (None if stateless)."""
+    if session_id and chat_sessions.enabled:
+        session, is_new = chat_sessions.get(session_id)
+        if is_new and history:
+            chat_sessions.seed(session, history_turns(history))
+        elif is_new and session_started:
+            # Answering would silently drop the conversation (and could serve a FAQ answer)
+            raise SessionExpired("Chat session not found or expired; resend the full history")
+        return session.request_body(user_message), session
+    return json.dumps(build_chat_payload(user_message, history)), None
+
+def is_first_turn(history, session):
+    # Follow-up questions depend on context, so only the opening question is cacheable
+    turns = session.turns if session is not None else history_turns(history)
+    return not any(role == "user" for role, *_ in turns)
+
+def google_api_error(response):
+    print(f"Error from Google API: {response.text}")
+    # Try to parse error message from Google
+    error_detail = "Unknown Google API error"
+    try:
+        error_json = response.json()
+        error_detail = error_json.get("error", {}).get("message", response.text)
+    except:
+        error_detail = response.text # Use raw text if JSON fails
+    return Exception(f"Google API error {response.status_code}: {error_detail}")
+
+def wants_chat_stream(data):
+    # Streaming is opt-in, so old clients keep getting the single JSON reply
+    return (data.get('stream') is True
+            or request.args.get('stream') == '1'
+            or 'text/event-stream' in request.headers.get('Accept', ''))
+
+def sse_event(payload, event=None):
+    line = f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    return f"event: {event}\n{line}" if event else line
+
+def gemini_sse_texts(raw_line):
+    # Text pieces in one line of Gemini's SSE stream (bytes or str); [] for non-data lines
+    if isinstance(raw_line, bytes):
+        raw_line = raw_line.decode('utf-8')
+    if not raw_line.startswith('data:'):
+        return []
+    chunk = json.loads(raw_line[5:])
+    return [part['text']
+            for candidate in chunk.get('candidates') or []
+            for part in candidate.get('content', {}).get('parts') or []
+            if part.get('text')]
+
+def iter_gemini_stream(response):
+    # Parse Gemini's SSE stream and yield text pieces as they arrive (no buffering of the reply)
+    for raw_line in response.iter_lines(chunk_size=None):
+        yield from gemini_sse_texts(raw_line)
+
+CHAT_ERROR_REPLY = "माफ़ कीजिये, AI से जवाब प्राप्त करने में कुछ समस्या हुई।" # Hindi error
+ChatPlan = namedtuple('ChatPlan', 'user_message body session faq_question cached_answer')
+
+def plan_chat(data):
+    """Validate a chat request and resolve its session and FAQ cache hit.
+
+    Raises ValueError (-> 400, see chat_plan_error). Shared by the Flask route and the async one in asgi.py.
+    A client that relies on the session for its context sends session_started: true (and no history).
+    """
     user_message = data.get('message')
     # Get history from frontend (expecting a list of {'role': 'user'/'model', 'parts': [{'text': '...'}]})
     history = data.get('history', []) # Default to empty list if not provided
 
-    if not user_message: return jsonify({"error": "No message provided"}), 400
+    if not user_message: raise ValueError("No message provided")
+
+    # Optional server-side session: the client then only needs to send the new message
+    session_id = data.get('session_id')
+    if session_id is not None and not SESSION_ID_RE.match(str(session_id)):
+        raise ValueError("Invalid session_id (8-64 letters, digits, '-' or '_')")
+    body, session = prepare_chat_request(user_message, history, session_id, data.get('session_started') is True)
+
+    # Opening question: a cached answer can be served without calling Gemini
+    faq_question = user_message if faq_cache.enabled and is_first_turn(history, session) else None
+    cached_answer = faq_cache.get(faq_question)[0] if faq_question is not None else None
+    return ChatPlan(user_message, body, session, faq_question, cached_answer)
+
+def chat_plan_error(e):
+    # (payload, status) for a rejected chat request; 409 + session_expired asks for the history again
+    if isinstance(e, SessionExpired):
+        return {"error": str(e), "session_expired": True}, 409
+    return {"error": str(e)}, 400
+
+def chat_reply(plan, bot_response, cached=False):
+    # Final reply payload; a real answer (bot_response not None) is recorded in the session + FAQ cache
+    reply = {"response": bot_response if bot_response is not None else CHAT_ERROR_REPLY}
+    if cached:
+        reply["cached"] = True
+    if bot_response is not None:
+        if plan.session is not None:
+            chat_sessions.add_exchange(plan.session, plan.user_message, bot_response)
+        if plan.faq_question is not None and not cached:
+            faq_cache.put(plan.faq_question, bot_response)
+    if plan.session is not None:
+        reply["session_id"] = plan.session.session_id
+    return reply
+
+def extract_bot_response(response_data):
+    # Extract the response text safely
+    candidates = response_data.get('candidates')
+    if candidates and candidates[0].get('content', {}).get('parts'):
+         return candidates[0]['content']['parts'][0]['text']
+         # Simple check if response seems non-Hindi (optional, might be unreliable)
+         # is_likely_hindi = any('\u0900' <= char <= '\u097f' for char in bot_response) # Check for Devanagari characters
+         # if not is_likely_hindi:
+         #     print("Warning: AI response might not be in Hindi:", bot_response[:100])
+         #     # Optionally append a reminder? Or just rely on the prompt.
+    print(f"Unexpected response structure from Gemini: {response_data}")
+    return None
+
+def ask_gemini(plan, **request_options):
+    # One non-streamed Gemini call -> final reply payload. Raises on upstream errors (see chat_error).
+    # request_options (timeout, retries) override the client's defaults for this call
+    headers = {"Content-Type": "application/json"}
+
+    # --- Call Google API ---
+    response = gemini_client.post(GEMINI_API_URL, headers=headers, data=plan.body.encode('utf-8'), **request_options)
+
+    if response.status_code != 200:
+        raise google_api_error(response)
+
+    return chat_reply(plan, extract_bot_response(response.json()))
+
+def chat_error(e):
+    # (payload, status, headers) for a failed Gemini call
+    if isinstance(e, CircuitOpenError):
+        print(f"Chat upstream unavailable: {e}")
+        return {"error": f"Failed to generate AI response: {e}"}, 503, {"Retry-After": str(int(e.retry_after))}
+    print(f"Error during chat generation: {e}")
+    # traceback.print_exc()
+    return {"error": f"Failed to generate AI response: {e}"}, 500, {}
+
+def cached_chat_stream(plan):
+    done = chat_reply(plan, plan.cached_answer, cached=True)
+    events = sse_event({"text": done["response"]}) + sse_event(done, event="done")
+    return Response(events, mimetype='text/event-stream', headers={"Cache-Control": "no-cache"})
+
+def stream_chat(plan):
+    """Relay Gemini's streamed reply as SSE: `data: {"text"}` per piece, then `event: done`."""
+    headers = {"Content-Type": "application/json"}
+
+    def generate():
+        pieces = []
+        try:
+            response = gemini_client.post(GEMINI_STREAM_URL, headers=headers, data=plan.body.encode('utf-8'), stream=True)
+            with response:
+                if response.status_code != 200:
+                    raise google_api_error(response)
+                for text in iter_gemini_stream(response):
+                    pieces.append(text)
+                    yield sse_event({"text": text})
+            done = chat_reply(plan, "".join(pieces) if pieces else None)
+            if not pieces:
+                yield sse_event({"text": done["response"]})
+            yield sse_event(done, event="done")
+        except Exception as e:
+            print(f"Error during streamed chat generation: {e}")
+            yield sse_event({"error": f"Failed to generate AI response: {e}"}, event="error")
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/sarthi_ai_chat', methods=['POST'])
+def handle_chat():
+    if not GOOGLE_API_KEY: return jsonify({"error": "Chatbot API key not configured."}), 503
 
+    data = request.json
     try:
-        # --- Format payload for Gemini API with history ---
-        # Combine system prompt, previous history, and new user message
-        api_contents = [{"parts": [{"text": chat_prompt_context}]}] # Start with system prompt/initial context
-
-        # Add existing history, ensuring correct roles ('user' and 'model')
-        for msg in history:
-             # Map frontend roles ('user'/'bot') to Gemini roles ('user'/'model')
-             gemini_role = "user" if msg.get("role") == "user" else "model"
-             # Ensure message format is correct
-             if "message" in msg:
-                 api_contents.append({"role": gemini_role, "parts": [{"text": msg["message"]}]})
-
-        # Add the new user message
-        api_contents.append({"role": "user", "parts": [{"text": user_message}]})
-
-        payload = {
-            "contents": api_contents,
-            # Optional: Add generationConfig if needed (temperature, etc.)
-            # "generationConfig": { ... }
-            # Optional: Add safetySettings if needed
-            # "safetySettings": [ ... ]
-        }
-        headers = {"Content-Type": "application/json"}
+        plan = plan_chat(data)
+    except ValueError as e:
+        payload, status = chat_plan_error(e)
+        return jsonify(payload), status
+    stream = wants_chat_stream(data)
 
-        # --- Call Google API ---
-        response = requests.post(GEMINI_API_URL, headers=headers, data=json.dumps(payload))
+    if plan.cached_answer is not None:
+        if stream:
+            return cached_chat_stream(plan)
+        return jsonify(chat_reply(plan, plan.cached_answer, cached=True))
 
-        if response.status_code != 200:
-            print(f"Error from Google API: {response.text}")
-            # Try to parse error message from Google
-            error_detail = "Unknown Google API error"
-            try:
-                error_json = response.json()
-                error_detail = error_json.get("error", {}).get("message", response.text)
-            except:
-                error_detail = response.text # Use raw text if JSON fails
-            raise Exception(f"Google API error {response.status_code}: {error_detail}")
-
-        response_data = response.json()
-
-        # Extract the response text safely
-        candidates = response_data.get('candidates')
-        if candidates and candidates[0].get('content', {}).get('parts'):
-             bot_response = candidates[0]['content']['parts'][0]['text']
-             # Simple check if response seems non-Hindi (optional, might be unreliable)
-             # is_likely_hindi = any('\u0900' <= char <= '\u097f' for char in bot_response) # Check for Devanagari characters
-             # if not is_likely_hindi:
-             #     print("Warning: AI response might not be in Hindi:", bot_response[:100])
-             #     # Optionally append a reminder? Or just rely on the prompt.
-        else:
-             print(f"Unexpected response structure from Gemini: {response_data}")
-             bot_response = "माफ़ कीजिये, AI से जवाब प्राप्त करने में कुछ समस्या हुई।" # Hindi error
+    if stream:
+        return stream_chat(plan)
 
-        return jsonify({"response": bot_response})
+    try:
+        return jsonify(ask_gemini(plan))
 
     except Exception as e:
-        print(f"Error during chat generation: {e}")
-        # traceback.print_exc()
-        return jsonify({"error": f"Failed to generate AI response: {e}"}), 500
+        payload, status, headers = chat_error(e)
+        return jsonify(payload), status, headers
 
 # --- 6. WEATHER API SETUP ---
 OWM_API_KEY = os.getenv('OWM_API_KEY')
 if not OWM_API_KEY:
     print("ERROR: OWM_API_KEY environment variable not set!")
     # Optionally exit or handle the error
-OWM_API_URL = "https://api.openweathermap.org/data/2.5/weather"
+OWM_API_URL = os.getenv('OWM_API_URL', "https://api.openweathermap.org/data/2.5/weather")
+owm_client = get_client(
+    'openweathermap',
+    connect_timeout=HTTP_CONNECT_TIMEOUT,
+    read_timeout=float(os.getenv('OWM_READ_TIMEOUT', '5')),
+    retries=HTTP_RETRIES,
+    failure_threshold=HTTP_BREAKER_THRESHOLD,
+    reset_timeout=HTTP_BREAKER_RESET,
+)
+owm_client.latency.observer = metrics.stage_observer('upstream', 'openweathermap')
+
+# --- 6a. WEATHER CACHE ---
+# Nearby farms (same ~1 km bucket) and repeated city lookups share one cached OWM result.
+# Stale entries are served instantly while one background refresh runs (no threads are
+# started until the first stale hit, so nothing is spawned in a gunicorn preload master).
+WEATHER_CACHE_TTL = float(os.getenv('WEATHER_CACHE_TTL', '600'))              # Seconds; 0 disables the cache
+WEATHER_CACHE_STALE_TTL = float(os.getenv('WEATHER_CACHE_STALE_TTL', '1800')) # Extra seconds a stale entry may be served
+WEATHER_CACHE_GEO_DECIMALS = int(os.getenv('WEATHER_CACHE_GEO_DECIMALS', '2')) # lat/lon rounding (2 = ~1.1 km)
+weather_cache = WeatherCache(
+    ttl_seconds=WEATHER_CACHE_TTL,
+    stale_ttl_seconds=WEATHER_CACHE_STALE_TTL,
+    max_entries=int(os.getenv('WEATHER_CACHE_MAX_ENTRIES', '5000')),
+)
+
+def deg_to_cardinal(deg):
+    # Convert Wind Direction (Degrees to Cardinal)
+    if deg is None: return 'N/A'
+    dirs = ["N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE", "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW"]
+    ix = round(deg / (360. / len(dirs)))
+    return dirs[ix % len(dirs)]
+
+def simplify_weather(weather_data):
+    # --- NAYA DATA EXTRACTION ---
+    main = weather_data.get('main', {})
+    wind = weather_data.get('wind', {})
+    weather_desc = weather_data.get('weather', [{}])[0]
+    sys_data = weather_data.get('sys', {})
+    clouds = weather_data.get('clouds', {})
+    visibility = weather_data.get('visibility') # Meters
+
+    # Convert Timestamps (Sunrise/Sunset) to Local Time
+    # Assuming server runs in IST (UTC+5:30) - Adjust if needed
+    ist_offset = timedelta(hours=5, minutes=30)
+    sunrise_ts = sys_data.get('sunrise')
+    sunset_ts = sys_data.get('sunset')
+    sunrise_local = datetime.fromtimestamp(sunrise_ts + weather_data.get('timezone', 0), timezone.utc).astimezone(timezone(ist_offset)).strftime('%I:%M %p') if sunrise_ts else 'N/A'
+    sunset_local = datetime.fromtimestamp(sunset_ts + weather_data.get('timezone', 0), timezone.utc).astimezone(timezone(ist_offset)).strftime('%I:%M %p') if sunset_ts else 'N/A'
+
+    wind_direction = deg_to_cardinal(wind.get('deg'))
+
+    # Extract Rain (handle missing key)
+    rain_1h = weather_data.get('rain', {}).get('1h', 0) # mm in last 1 hour
+
+    simplified_data = {
+        "city": weather_data.get('name', 'N/A'),
+        "country": sys_data.get('country', 'N/A'),
+        "temperature": main.get('temp'),
+        "feels_like": main.get('feels_like'),
+        "temp_min": main.get('temp_min'), # Naya
+        "temp_max": main.get('temp_max'), # Naya
+        "humidity": main.get('humidity'),
+        "pressure": main.get('pressure'), # Naya
+        "description": weather_desc.get('description', 'N/A').capitalize(),
+        "wind_speed": wind.get('speed'),
+        "wind_direction": wind_direction, # Naya
+        "clouds": clouds.get('all'), # Naya (% cloudiness)
+        "rain_1h": rain_1h, # Naya (mm)
+        "visibility": visibility / 1000 if visibility else None, # Naya (Convert meters to km)
+        "sunrise": sunrise_local, # Naya
+        "sunset": sunset_local, # Naya
+        "icon_url": f"http://openweathermap.org/img/wn/{weather_desc.get('icon')}@2x.png" if weather_desc.get('icon') else None
+    }
 
-# --- 7. NAYA WEATHER ENDPOINT ---
-# --- 7. NAYA WEATHER ENDPOINT (Updated for Lat/Lon) ---
-@app.route('/get_weather', methods=['POST'])
-def handle_get_weather():
-    data = request.json
-    city = data.get('city')
-    lat = data.get('lat')
-    lon = data.get('lon')
+    # Remove keys with None values (optional, for cleaner JSON)
+    return {k: v for k, v in simplified_data.items() if v is not None}
 
+def weather_request(lat=None, lon=None, city=None):
+    # OWM query params and cache key for coordinates or a city name
     params = {
         'appid': OWM_API_KEY,
         'units': 'metric'
     }
-    
     if lat is not None and lon is not None:
         params['lat'] = lat
         params['lon'] = lon
-    elif city:
-        params['q'] = city
     else:
+        params['q'] = city
+    return params, weather_cache_key(lat, lon, city, WEATHER_CACHE_GEO_DECIMALS)
+
+def parse_weather_response(weather_data):
+    if weather_data.get('cod') != 200:
+        return {"error": weather_data.get('message', 'Location not found')}, 404
+    return simplify_weather(weather_data), 200
+
+def fetch_weather(params, **request_options):
+    # One upstream OWM call -> (payload, status). Raises on network / JSON errors.
+    response = owm_client.get(OWM_API_URL, params=params, **request_options)
+    return parse_weather_response(response.json())
+
+def get_weather(lat=None, lon=None, city=None, **request_options):
+    """Cached weather for coordinates or a city name -> (payload, status)."""
+    params, key = weather_request(lat, lon, city)
+    return weather_cache.get_or_fetch(key, lambda: fetch_weather(params, **request_options))
+
+def weather_error(e):
+    # (payload, status, headers) for a failed OWM call
+    if isinstance(e, CircuitOpenError):
+        print(f"Weather upstream unavailable: {e}")
+        return {"error": "Failed to fetch detailed weather data"}, 503, {"Retry-After": str(int(e.retry_after))}
+    print(f"Error during detailed weather fetch: {e}")
+    return {"error": "Failed to fetch detailed weather data"}, 500, {}
+
+# --- 7. NAYA WEATHER ENDPOINT ---
+# --- 7. NAYA WEATHER ENDPOINT (Updated for Lat/Lon) ---
+@app.route('/get_weather', methods=['POST'])
+def handle_get_weather():
+    data = request.json
+    city = data.get('city')
+    lat = data.get('lat')
+    lon = data.get('lon')
+
+    if (lat is None or lon is None) and not city:
         return jsonify({"error": "City name or coordinates (lat, lon) are required"}), 400
 
     try:
-        response = requests.get(OWM_API_URL, params=params)
-        weather_data = response.json()
-        
-        if weather_data.get('cod') != 200:
-            return jsonify({"error": weather_data.get('message', 'Location not found')}), 404
-        
-        # --- NAYA DATA EXTRACTION ---
-        main = weather_data.get('main', {})
-        wind = weather_data.get('wind', {})
-        weather_desc = weather_data.get('weather', [{}])[0]
-        sys_data = weather_data.get('sys', {})
-        clouds = weather_data.get('clouds', {})
-        visibility = weather_data.get('visibility') # Meters
-        
-        # Convert Timestamps (Sunrise/Sunset) to Local Time
-        # Assuming server runs in IST (UTC+5:30) - Adjust if needed
-        ist_offset = timedelta(hours=5, minutes=30)
-        sunrise_ts = sys_data.get('sunrise')
-        sunset_ts = sys_data.get('sunset')
-        sunrise_local = datetime.fromtimestamp(sunrise_ts + weather_data.get('timezone', 0), timezone.utc).astimezone(timezone(ist_offset)).strftime('%I:%M %p') if sunrise_ts else 'N/A'
-        sunset_local = datetime.fromtimestamp(sunset_ts + weather_data.get('timezone', 0), timezone.utc).astimezone(timezone(ist_offset)).strftime('%I:%M %p') if sunset_ts else 'N/A'
-
-        # Convert Wind Direction (Degrees to Cardinal)
-        def deg_to_cardinal(deg):
-            if deg is None: return 'N/A'
-            dirs = ["N", "NNE", "NE", "ENE", "E", "ESE", "SE", "SSE", "S", "SSW", "SW", "WSW", "W", "WNW", "NW", "NNW"]
-            ix = round(deg / (360. / len(dirs)))
-            return dirs[ix % len(dirs)]
-        
-        wind_direction = deg_to_cardinal(wind.get('deg'))
-
-        # Extract Rain (handle missing key)
-        rain_1h = weather_data.get('rain', {}).get('1h', 0) # mm in last 1 hour
-
-        simplified_data = {
-            "city": weather_data.get('name', 'N/A'),
-            "country": sys_data.get('country', 'N/A'),
-            "temperature": main.get('temp'),
-            "feels_like": main.get('feels_like'),
-            "temp_min": main.get('temp_min'), # Naya
-            "temp_max": main.get('temp_max'), # Naya
-            "humidity": main.get('humidity'),
-            "pressure": main.get('pressure'), # Naya
-            "description": weather_desc.get('description', 'N/A').capitalize(),
-            "wind_speed": wind.get('speed'),
-            "wind_direction": wind_direction, # Naya
-            "clouds": clouds.get('all'), # Naya (% cloudiness)
-            "rain_1h": rain_1h, # Naya (mm)
-            "visibility": visibility / 1000 if visibility else None, # Naya (Convert meters to km)
-            "sunrise": sunrise_local, # Naya
-            "sunset": sunset_local, # Naya
-            "icon_url": f"http://openweathermap.org/img/wn/{weather_desc.get('icon')}@2x.png" if weather_desc.get('icon') else None
-        }
-        
-        # Remove keys with None values (optional, for cleaner JSON)
-        simplified_data = {k: v for k, v in simplified_data.items() if v is not None}
+        payload, status = get_weather(lat, lon, city)
+        return jsonify(payload), status
 
-        return jsonify(simplified_data)
+    except Exception as e:
+        payload, status, headers = weather_error(e)
+        return jsonify(payload), status, headers
+
+# --- 7b. FIELD ADVISORY (/field_advisory) ---
+# One advisory screen used to be /get_weather, then /recommend_crop, then /recommend_fertilizer
+# (and often /sarthi_ai_chat), one after another. This endpoint takes them in one JSON body:
+#   {"lat": .., "lon": .. (or "city"), "crop": {soil readings}, "fertilizer": {soil readings},
+#    "chat": {same body as /sarthi_ai_chat}}       (every part optional, at least one required)
+# and runs them at the same time on ADVISORY_THREADS threads. The weather fills the model inputs
+# the client left out (ADVISORY_WEATHER_FIELDS); a model with all of its inputs starts right
+# away, one that needs the weather starts as soon as it arrives. Each stage has its own timeout
+# (ADVISORY_*_TIMEOUT seconds from when it starts) and a failed or slow stage only turns its own
+# part into {"error", "status"}: the others are still returned, with "partial": true.
+# A stage that times out while running can't be interrupted; it keeps its advisory thread until
+# its own call returns. So each stage's blocking call is bounded by the same timeout: one upstream
+# attempt with that read timeout (weather, chat), and at most that long in the model queue.
+ADVISORY_WEATHER_TIMEOUT = float(os.getenv('ADVISORY_WEATHER_TIMEOUT', '5'))
+ADVISORY_MODEL_TIMEOUT = float(os.getenv('ADVISORY_MODEL_TIMEOUT', '5'))
+ADVISORY_CHAT_TIMEOUT = float(os.getenv('ADVISORY_CHAT_TIMEOUT', '20'))
+ADVISORY_THREADS = max(1, int(os.getenv('ADVISORY_THREADS', str(max(8, 4 * CPU_COUNT)))))
+
+# Model input -> key of the simplified weather payload
+ADVISORY_WEATHER_FIELDS = {
+    'crop': {'avg_temp_c': 'temperature', 'avg_humidity_pct': 'humidity'},
+    'fertilizer': {'Temparature': 'temperature', 'Humidity': 'humidity'},
+}
+
+advisory_pool = None
+advisory_pool_pid = None
+advisory_pool_lock = threading.Lock()
+
+def get_advisory_pool():
+    # Created on first use in each worker (threads don't survive gunicorn's fork)
+    global advisory_pool, advisory_pool_pid
+    with advisory_pool_lock:
+        if advisory_pool is None or advisory_pool_pid != os.getpid():
+            advisory_pool = ThreadPoolExecutor(max_workers=ADVISORY_THREADS, thread_name_prefix='advisory')
+            advisory_pool_pid = os.getpid()
+        return advisory_pool
+
+def timed_stage(fn, *args):
+    # Runs on an advisory thread; the finish time lets the caller time the stage from submission
+    return fn(*args), time.perf_counter()
+
+def stage_request_options(timeout):
+    # One upstream attempt that gives up about when the stage times out (no retries past it)
+    return {"timeout": (min(HTTP_CONNECT_TIMEOUT, timeout), timeout), "retries": 0}
+
+def advisory_weather(lat, lon, city):
+    payload, status = get_weather(lat, lon, city, **stage_request_options(ADVISORY_WEATHER_TIMEOUT))
+    if status != 200:
+        return {**payload, "status": status}
+    return payload
+
+def advisory_model(model, loaded, infer, data):
+    # Encode + predict one plot; returns (prediction, inference timing) for the Server-Timing header
+    with stage(model, 'encode'):
+        input_final = loaded.model.feature_encoder.encode(data)
+    result, timing = inference.run(model, infer, input_final, loaded.version, loaded.paths, max_wait=ADVISORY_MODEL_TIMEOUT)
+    return result[0], timing
+
+def advisory_stage_error(name, e):
+    # {"error", "status"} in the same words as the stage's own endpoint
+    if isinstance(e, InferenceRejected):
+        return {"error": str(e), "status": e.status, "retry_after": e.retry_after}
+    if name == 'weather':
+        payload, status, headers = weather_error(e)
+    elif name == 'chat':
+        payload, status, headers = chat_error(e)
+    elif isinstance(e, KeyError):
+        return {"error": f"Missing input feature: {e}", "status": 400}
+    elif isinstance(e, ValueError):
+        return {"error": f"Invalid input value: {e}", "status": 400}
+    else:
+        print(f"Error during {name} advisory stage: {e}")
+        return {"error": f"Failed to recommend {name}", "status": 500}
+    return {**payload, "status": status}
+
+def needs_weather(name, data):
+    return any(data.get(field) is None for field in ADVISORY_WEATHER_FIELDS[name])
+
+def weather_filled(name, data, weather):
+    """`data` with the inputs the client left out taken from the weather, and the keys filled."""
+    missing = {field: key for field, key in ADVISORY_WEATHER_FIELDS[name].items() if data.get(field) is None}
+    filled = {field: weather[key] for field, key in missing.items() if weather.get(key) is not None}
+    return {**data, **filled}, sorted(filled)
+
+@app.route('/field_advisory', methods=['POST'])
+def handle_field_advisory():
+    started = time.perf_counter()
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    lat, lon, city = data.get('lat'), data.get('lon'), data.get('city')
+    has_location = (lat is not None and lon is not None) or bool(city)
+    parts = {name: data.get(name) for name in ('crop', 'fertilizer', 'chat') if data.get(name) is not None}
+    for name, part in parts.items():
+        if not isinstance(part, dict):
+            return jsonify({"error": f"'{name}' must be a JSON object"}), 400
+    if not has_location and not parts:
+        return jsonify({"error": "Send a location (lat, lon or city) and/or 'crop', 'fertilizer' or 'chat' inputs"}), 400
+
+    pool = get_advisory_pool()
+    results, timings, filled = {}, {}, {}
+    pending = {} # stage -> (future, submitted at, timeout)
+
+    def submit(name, timeout, fn, *args):
+        pending[name] = (pool.submit(timed_stage, fn, *args), time.perf_counter(), timeout)
+
+    def collect(name):
+        future, submitted, timeout = pending.pop(name)
+        try:
+            result, finished = future.result(timeout=max(0.0, submitted + timeout - time.perf_counter()))
+        except FutureTimeout:
+            future.cancel() # Still queued: never starts. Running: finishes within its own bound (see above)
+            results[name] = {"error": f"Timed out after {timeout:g}s", "status": 504}
+            finished = time.perf_counter()
+        except Exception as e:
+            results[name] = advisory_stage_error(name, e)
+            finished = time.perf_counter()
+        else:
+            if name in ('crop', 'fertilizer'):
+                prediction, timing = result
+                record_inference_timing(name, timing)
+                result = {f"recommended_{name}": prediction}
+            results[name] = result
+        timings[name] = round((finished - submitted) * 1000, 2)
+        metrics.observe_stage('advisory', name, finished - submitted)
+
+    # --- start every stage that can start now ---
+    if has_location:
+        submit('weather', ADVISORY_WEATHER_TIMEOUT, advisory_weather, lat, lon, city)
+
+    models = {'crop': (crop_models, infer_crop), 'fertilizer': (fert_models, infer_fertilizer)}
+    waiting = [] # Models that need the weather for some inputs
+    for name, (slot, infer) in models.items():
+        if name not in parts:
+            continue
+        loaded = use_model(slot) # Pinned here: the request context doesn't reach the advisory threads
+        if loaded is None or (name == 'crop' and len(CROP_FULL_FEATURE_NAMES) != 25):
+            results[name] = {"error": f"{name.capitalize()} Recommendation model is not loaded.", "status": 500}
+        elif has_location and needs_weather(name, parts[name]):
+            waiting.append((name, loaded, infer))
+        else:
+            submit(name, ADVISORY_MODEL_TIMEOUT, advisory_model, name, loaded, infer, parts[name])
 
+    if 'chat' in parts:
+        if not GOOGLE_API_KEY:
+            results['chat'] = {"error": "Chatbot API key not configured.", "status": 503}
+        else:
+            try:
+                plan = plan_chat(parts['chat'])
+            except ValueError as e:
+                payload, status = chat_plan_error(e)
+                results['chat'] = {**payload, "status": status}
+            else:
+                if plan.cached_answer is not None:
+                    results['chat'] = chat_reply(plan, plan.cached_answer, cached=True)
+                else:
+                    submit('chat', ADVISORY_CHAT_TIMEOUT, partial(ask_gemini, plan, **stage_request_options(ADVISORY_CHAT_TIMEOUT)))
+
+    # --- weather first: the models waiting on it start as soon as it is in ---
+    if 'weather' in pending:
+        collect('weather')
+    weather = results.get('weather', {})
+    for name, loaded, infer in waiting:
+        if 'error' in weather:
+            fields = ", ".join(sorted(ADVISORY_WEATHER_FIELDS[name]))
+            results[name] = {"error": f"Weather unavailable to fill {fields}; send them in '{name}'", "status": 424}
+            continue
+        parts[name], filled[name] = weather_filled(name, parts[name], weather)
+        submit(name, ADVISORY_MODEL_TIMEOUT, advisory_model, name, loaded, infer, parts[name])
+
+    for name in sorted(pending, key=lambda name: pending[name][1] + pending[name][2]): # Earliest deadline first
+        collect(name)
+
+    response = dict(results)
+    if filled:
+        response["filled_from_weather"] = filled
+    response["partial"] = any("error" in result for result in results.values())
+    timings["total"] = round((time.perf_counter() - started) * 1000, 2)
+    response["timings_ms"] = timings
+    # 200 with per-stage errors; only a request where every stage failed is an error as a whole
+    status = 200 if any("error" not in result for result in results.values()) else 502
+    return jsonify(response), status
+
+@app.route('/get_weather/stats', methods=['GET'])
+def handle_weather_cache_stats():
+    return jsonify(weather_cache.stats())
+
+@app.route('/sarthi_ai_chat/stats', methods=['GET'])
+def handle_chat_session_stats():
+    return jsonify({"sessions": chat_sessions.stats(), "faq_cache": faq_cache.stats()})
+
+@app.route('/inference_stats', methods=['GET'])
+def handle_inference_stats():
+    # Queue wait vs execution time, rejections and queue depth per model
+    return jsonify(inference.stats())
+
+@app.route('/upstream_stats', methods=['GET'])
+def handle_upstream_stats():
+    # Latency percentiles, retries and circuit state per outbound upstream
+    return jsonify(upstream_stats())
+
+# --- METRICS (see metrics.py) ---
+# Request counts/latency per route and stage timers are recorded as they happen; cache,
+# queue and circuit-breaker numbers are read from their stats() when /metrics is scraped.
+def cache_metrics():
+    caches = {
+        "prediction": prediction_cache.stats(),
+        "weather": weather_cache.stats(),
+        "faq": faq_cache.stats(),
+        "chat_session": chat_sessions.stats(),
+    }
+    hits = {
+        "prediction": lambda s: s["hits"] + s["disk_hits"],
+        "weather": lambda s: s["hits"] + s["stale_hits"],
+        "faq": lambda s: s["exact_hits"] + s["similar_hits"],
+        "chat_session": lambda s: s["hits"],
+    }
+    lookups, ratios, entries = [], [], []
+    for name, stats in caches.items():
+        hit_count, miss_count = hits[name](stats), stats["misses"]
+        lookups += [({"cache": name, "result": "hit"}, hit_count), ({"cache": name, "result": "miss"}, miss_count)]
+        ratios.append(({"cache": name}, hit_count / (hit_count + miss_count) if hit_count + miss_count else 0.0))
+        entries.append(({"cache": name}, stats.get("entries", stats.get("sessions", 0))))
+    return [
+        ("fasal_cache_lookups_total", "counter", "Cache lookups by result.", lookups),
+        ("fasal_cache_hit_ratio", "gauge", "Hits / lookups since the process started.", ratios),
+        ("fasal_cache_entries", "gauge", "Entries currently held in memory.", entries),
+    ]
+
+def inference_metrics():
+    queues = inference.stats()["models"]
+    return [
+        ("fasal_inference_running", "gauge", "Model calls running now.",
+         [({"model": m}, q["running"]) for m, q in queues.items()]),
+        ("fasal_inference_waiting", "gauge", "Model calls waiting in the queue now.",
+         [({"model": m}, q["waiting"]) for m, q in queues.items()]),
+        ("fasal_inference_rejected_total", "counter", "Requests turned away by a model queue.",
+         [({"model": m, "reason": "queue_full"}, q["rejected"]) for m, q in queues.items()] +
+         [({"model": m, "reason": "timeout"}, q["timeouts"]) for m, q in queues.items()]),
+    ]
+
+def upstream_metrics():
+    upstreams = upstream_stats()
+    return [
+        ("fasal_upstream_circuit_open", "gauge", "1 while the upstream's circuit breaker is not closed.",
+         [({"upstream": name}, int(s["circuit"] != "closed")) for name, s in upstreams.items()]),
+        ("fasal_upstream_retries_total", "counter", "Retried upstream calls.",
+         [({"upstream": name}, s["retries"]) for name, s in upstreams.items()]),
+    ]
+
+def model_metrics():
+    versions = [(name, slot.current) for name, slot in model_registry.slots.items() if slot.current is not None]
+    return [
+        ("fasal_model_info", "gauge", "Model version currently serving (value is always 1).",
+         [({"model": name, "version": loaded.version, "fingerprint": loaded.fingerprint}, 1) for name, loaded in versions]),
+        ("fasal_model_loaded_timestamp_seconds", "gauge", "When the serving model version was swapped in.",
+         [({"model": name}, loaded.loaded_at) for name, loaded in versions]),
+    ]
+
+metrics.registry.add_collector(cache_metrics)
+metrics.registry.add_collector(inference_metrics)
+metrics.registry.add_collector(upstream_metrics)
+metrics.registry.add_collector(model_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def handle_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+# --- MODEL ADMIN (see model_registry.py) ---
+# ADMIN_SECRET enables these endpoints (header `X-Fasal-Admin: <secret>`). A reload only swaps
+# the model in the worker that served it; write MODEL_MANIFEST to roll out to every worker.
+ADMIN_SECRET = os.getenv('ADMIN_SECRET') or None
+
+def require_admin_secret():
+    if ADMIN_SECRET is None:
+        return jsonify({"error": "Not found"}), 404
+    if not hmac.compare_digest(request.headers.get('X-Fasal-Admin', '').encode(), ADMIN_SECRET.encode()):
+        return jsonify({"error": "Forbidden"}), 403
+    return None
+
+@app.route('/admin/models', methods=['GET'])
+def handle_model_status():
+    denied = require_admin_secret()
+    if denied: return denied
+    return jsonify({"pid": os.getpid(), **model_registry.status()})
+
+@app.route('/admin/models/<name>/reload', methods=['POST'])
+def handle_model_reload(name):
+    # Body (all optional): {"version": "2025-06", "paths": {"model": "..."}, "wait": false}
+    denied = require_admin_secret()
+    if denied: return denied
+    slot = model_registry.slots.get(name)
+    if slot is None:
+        return jsonify({"error": f"Unknown model '{name}'", "models": sorted(model_registry.slots)}), 404
+    data = request.get_json(silent=True) or {}
+    paths = data.get('paths') or {}
+    unknown = sorted(set(paths) - set(slot.paths))
+    if unknown:
+        return jsonify({"error": f"Unknown file keys {unknown}; {name} has {sorted(slot.paths)}"}), 400
+    paths = {**slot.paths, **paths}
+    # The artifacts folder is optional (joblib files are the fallback)
+    missing = sorted(path for key, path in paths.items() if key != 'artifacts' and not os.path.exists(path))
+    if missing:
+        return jsonify({"error": f"Files not found: {missing}"}), 400
+    version = data.get('version')
+    if data.get('wait'):
+        try:
+            slot.load(paths, version)
+        except Exception as e:
+            return jsonify({"error": f"Reload failed, previous version still serving: {e}", **slot.status()}), 500
+        return jsonify(slot.status())
+    if not slot.reload_async(paths, version):
+        return jsonify({"error": f"A {name} model reload is already running"}), 409
+    return jsonify({"status": "loading", "pid": os.getpid(), **slot.status()}), 202
+
+startup_report.mark("chat + weather setup")
+
+
+# --- 10. APP FACTORY (used by gunicorn, see gunicorn.conf.py) ---
+# Loads every model once. With gunicorn's preload_app this runs in the master process and
+# the workers share the loaded models copy-on-write. TFLite interpreters own native threads,
+# so under preload they are built per worker after fork (see post_fork in gunicorn.conf.py).
+PRELOAD_MASTER = os.getenv('FASAL_PRELOAD_MASTER', '0') == '1' # Set by gunicorn.conf.py
+models_loaded = False
+models_loaded_lock = threading.Lock()
+
+for slot in model_registry.slots.values():
+    slot.listeners.append(on_model_swap)
+
+def load_initial_model(slot):
+    # A model that fails to load stays empty (its routes answer 500/503) until a reload works
+    try:
+        slot.load()
     except Exception as e:
-        print(f"Error during detailed weather fetch: {e}")
-        return jsonify({"error": "Failed to fetch detailed weather data"}), 500
+        print(f"Error loading {slot.name} model: {e}")
+
+def load_models():
+    global models_loaded
+    with models_loaded_lock:
+        if models_loaded: return
+        model_registry.check_manifest(load=False) # Versions/files from MODEL_MANIFEST, if set
+        load_initial_model(crop_models)
+        startup_report.mark("crop recommendation model")
+        load_initial_model(fert_models)
+        startup_report.mark("fertilizer model")
+        if inference.processes and not PRELOAD_MASTER:
+            # Forked after the models are loaded and before any disease interpreter threads exist
+            inference.start()
+            startup_report.mark("inference processes")
+        if DISEASE_EAGER_LOAD and not PRELOAD_MASTER:
+            load_initial_model(disease_models)
+            startup_report.mark("disease model (eager)")
+        if not PRELOAD_MASTER:
+            model_registry.start_watcher() # A thread, so per worker (post_fork under preload)
+        models_loaded = True
+        startup_report.report()
+
+def create_app():
+    load_models()
+    return app
+
+app = create_app()
 
 # if __name__ == '__main__':
 #     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,242 @@
+"""Compact, versioned on-disk layout for the sklearn models (export + loader).
+
+    python artifacts.py export            (from fasal_sarthi_backend/, after retraining)
+
+writes artifacts/crop/ and artifacts/fertilizer/, each a manifest.json plus .npy files:
+  - numeric parameters (the fertilizer forest flattened as in tree_engine.CompiledForest,
+    the crop scaler's mean/scale) are plain .npy arrays, memory-mapped read-only at load,
+    so every gunicorn worker shares the same page-cache pages instead of unpickling copies
+  - feature columns and encoder classes are JSON lists in the manifest
+  - the crop stacking ensemble has no flat form and stays a joblib file
+
+The manifest records the sha256 of every joblib file it was exported from. The app loads a
+model from here when its manifest is present, of a known format version and still matches
+those joblib files; otherwise (or with MODEL_ARTIFACTS_DIR='') it falls back to joblib.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+
+FORMAT = 'fasal-sarthi-artifacts'
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# --- LIGHTWEIGHT STAND-INS FOR SKLEARN OBJECTS ---
+class LabelDecoder:
+    # What the app uses of a fitted LabelEncoder: classes_ and inverse_transform
+    def __init__(self, classes):
+        self.classes_ = np.asarray(classes)
+
+    def inverse_transform(self, y):
+        return self.classes_.take(np.asarray(y, dtype=np.intp))
+
+
+class ScalerParams:
+    # What CropFeatureEncoder reads from a fitted StandardScaler
+    def __init__(self, mean, scale, with_mean=True, with_std=True, feature_names=None):
+        self.mean_ = mean
+        self.scale_ = scale
+        self.with_mean = with_mean
+        self.with_std = with_std
+        if feature_names is not None:
+            self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+
+    def transform(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if self.with_mean:
+            X = X - self.mean_
+        if self.with_std:
+            X = X / self.scale_
+        return X
+
+
+class LazyJoblib:
+    """A joblib model loaded on its first predict() (e.g. the sklearn forest, only needed for
+    big bulk chunks), so workers that never see one don't pay for unpickling it."""
+    def __init__(self, path, mmap_mode=None, on_load=None):
+        self.path = path
+        self.mmap_mode = mmap_mode
+        self.on_load = on_load # Called with the model once loaded (e.g. to set n_jobs)
+        self.model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.model is not None
+
+    def get(self):
+        if self.model is None:
+            with self._lock:
+                if self.model is None:
+                    import joblib
+                    start = time.perf_counter()
+                    model = joblib.load(self.path, mmap_mode=self.mmap_mode)
+                    if self.on_load is not None:
+                        self.on_load(model)
+                    self.model = model
+                    print(f"Loaded {self.path} on first use in {time.perf_counter() - start:.2f}s")
+        return self.model
+
+    def predict(self, X):
+        return self.get().predict(X)
+
+
+# --- LOADING ---
+class ModelArtifacts:
+    def __init__(self, directory, manifest, mmap=True):
+        self.directory = directory
+        self.manifest = manifest
+        self.lists = manifest.get('lists', {})
+        self.params = manifest.get('params', {})
+        # np.load of a .npy with mmap_mode maps it without reading it
+        self.arrays = {
+            name: np.load(os.path.join(directory, filename), mmap_mode='r' if mmap else None, allow_pickle=False)
+            for name, filename in manifest.get('arrays', {}).items()
+        }
+
+    @property
+    def label(self):
+        return f"{self.directory} (format v{self.manifest['format_version']}, exported {self.manifest.get('created_at')})"
+
+
+def open_artifacts(directory, model, sources, mmap=True):
+    """ModelArtifacts for `model` in `directory`, or None (with the reason printed) if the
+    layout is missing, of another format version or stale against `sources` (key -> joblib path)."""
+    if not directory:
+        return None
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != FORMAT or manifest.get('model') != model:
+            print(f"Warning: {path} is not a {model} artifact manifest; loading joblib files.")
+            return None
+        if manifest.get('format_version') != FORMAT_VERSION:
+            print(f"Warning: {path} has format version {manifest.get('format_version')} (expected {FORMAT_VERSION}); loading joblib files.")
+            return None
+        for key, source in manifest.get('sources', {}).items():
+            current = sources.get(key)
+            # Only joblib files that are deployed can be checked (an artifacts-only deploy is fine)
+            if current and os.path.exists(current) and file_sha256(current) != source['sha256']:
+                print(f"Warning: {current} changed since {directory} was exported; loading joblib files (re-run `python artifacts.py export`).")
+                return None
+        return ModelArtifacts(directory, manifest, mmap)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: Could not read model artifacts in {directory}: {e}; loading joblib files.")
+        return None
+
+
+# --- EXPORT ---
+def write_artifacts(directory, model, arrays, lists, params, sources):
+    # Written to a sibling temp folder and renamed into place, so a running app never sees half of it
+    tmp = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(array), allow_pickle=False)
+    manifest = {
+        "format": FORMAT,
+        "format_version": FORMAT_VERSION,
+        "model": model,
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "sources": {key: {"file": os.path.basename(path), "sha256": file_sha256(path)} for key, path in sources.items()},
+        "arrays": {name: f"{name}.npy" for name in arrays},
+        "lists": lists,
+        "params": params,
+    }
+    with open(os.path.join(tmp, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    old = f"{directory}.old-{os.getpid()}"
+    if os.path.exists(directory):
+        os.rename(directory, old)
+    os.rename(tmp, directory)
+    shutil.rmtree(old, ignore_errors=True)
+    size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    print(f"Exported {model} to {directory} ({size / 1e6:.2f} MB)")
+
+
+def export_fertilizer(directory, model_path, columns_path, encoder_path):
+    import joblib
+    from tree_engine import compile_forest
+    forest = joblib.load(model_path)
+    compiled = compile_forest(forest, "fertilizer forest") # Verified against sklearn here, once
+    if compiled is None:
+        raise SystemExit("The fertilizer forest could not be compiled; keep serving it from joblib.")
+    write_artifacts(
+        directory, 'fertilizer',
+        arrays={
+            'feature': compiled.feature, 'threshold': compiled.threshold, 'children': compiled.children,
+            'value': compiled.value, 'roots': compiled.roots,
+        },
+        lists={
+            'forest_classes': compiled.classes_.tolist(),
+            'columns': [str(c) for c in joblib.load(columns_path)],
+            'label_classes': joblib.load(encoder_path).classes_.tolist(),
+        },
+        params={'max_depth': compiled.max_depth, 'n_features_in': compiled.n_features_in_, 'n_trees': compiled.n_trees},
+        sources={'model': model_path, 'columns': columns_path, 'encoder': encoder_path},
+    )
+
+
+def export_crop(directory, scaler_path, encoder_path):
+    import joblib
+    scaler = joblib.load(scaler_path)
+    names = getattr(scaler, 'feature_names_in_', None)
+    n_features = scaler.n_features_in_
+    # mean_ / scale_ are None when with_mean / with_std is off: store the identity instead
+    mean = scaler.mean_ if scaler.mean_ is not None else np.zeros(n_features)
+    scale = scaler.scale_ if scaler.scale_ is not None else np.ones(n_features)
+    write_artifacts(
+        directory, 'crop',
+        arrays={'scaler_mean': np.asarray(mean, dtype=np.float64), 'scaler_scale': np.asarray(scale, dtype=np.float64)},
+        lists={
+            'scaler_features': [str(n) for n in names] if names is not None else None,
+            'label_classes': joblib.load(encoder_path).classes_.tolist(),
+        },
+        params={'with_mean': bool(getattr(scaler, 'with_mean', True)), 'with_std': bool(getattr(scaler, 'with_std', True))},
+        sources={'scaler': scaler_path, 'encoder': encoder_path},
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the sklearn models to the compact artifact layout.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    export = sub.add_parser('export', help='Write <out>/crop and <out>/fertilizer from the joblib files')
+    export.add_argument('--out', default=os.getenv('MODEL_ARTIFACTS_DIR') or 'artifacts')
+    export.add_argument('--only', choices=['crop', 'fertilizer'], action='append')
+    export.add_argument('--crop-scaler', default='scaler_final.joblib')
+    export.add_argument('--crop-encoder', default='encoder_final.joblib')
+    export.add_argument('--fert-model', default='random_forest_model.joblib')
+    export.add_argument('--fert-columns', default='model_columns.joblib')
+    export.add_argument('--fert-encoder', default='label_encoder.joblib')
+    args = parser.parse_args()
+
+    only = set(args.only or ['crop', 'fertilizer'])
+    os.makedirs(args.out, exist_ok=True)
+    if 'crop' in only:
+        export_crop(os.path.join(args.out, 'crop'), args.crop_scaler, args.crop_encoder)
+    if 'fertilizer' in only:
+        export_fertilizer(os.path.join(args.out, 'fertilizer'), args.fert_model, args.fert_columns, args.fert_encoder)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,377 @@
+"""ASGI entry point: async /get_weather and /sarthi_ai_chat, everything else via Flask.
+
+The two I/O-bound routes are served natively on the event loop with non-blocking httpx
+calls (same caches, sessions, circuit breakers and JSON contracts as app.py), so thousands
+of slow Gemini/OWM calls can be in flight without tying up a thread each. Every other route
+(and any request the async handlers don't recognise, e.g. a non-JSON body, which Flask
+answers with its usual error) runs the unchanged Flask app in a bounded thread pool, so
+CPU-bound model inference never blocks the event loop. Their request bodies are handed to
+Flask as it reads them, so NDJSON bulk uploads are still processed incrementally.
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers 2
+
+ASGI_WSGI_THREADS: threads running Flask routes (model inference) per worker.
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from werkzeug.exceptions import ClientDisconnected
+
+import app as backend
+import metrics
+from http_client import get_async_client
+
+ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', str(max(4, 2 * (os.cpu_count() or 1)))))
+ASGI_SPOOL_BYTES = 1024 * 1024 # Request bodies above this are spooled to a temp file
+
+wsgi_executor = ThreadPoolExecutor(max_workers=ASGI_WSGI_THREADS, thread_name_prefix='wsgi')
+# Max simultaneous upstream connections per worker (extra calls wait for a free connection)
+HTTP_ASYNC_MAX_CONNECTIONS = int(os.getenv('HTTP_ASYNC_MAX_CONNECTIONS', '200'))
+gemini_async = get_async_client('gemini', max_connections=HTTP_ASYNC_MAX_CONNECTIONS)
+owm_async = get_async_client('openweathermap', max_connections=HTTP_ASYNC_MAX_CONNECTIONS)
+
+
+# --- REQUEST / RESPONSE HELPERS ---
+async def read_body(receive):
+    body = tempfile.SpooledTemporaryFile(max_size=ASGI_SPOOL_BYTES)
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        body.write(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    body.seek(0)
+    return body
+
+class ReceiveStream(io.RawIOBase):
+    # wsgi.input for a Flask thread: pulls body chunks from the ASGI receive() only as the app
+    # reads them (never buffers the whole body). A disconnect mid-body is a 400, like werkzeug's own.
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._chunk = memoryview(b'')
+        self._more = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._chunk and self._more:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message['type'] == 'http.disconnect':
+                self._more = False
+                raise ClientDisconnected()
+            self._chunk = memoryview(message.get('body', b''))
+            self._more = message.get('more_body', False)
+        n = min(len(buffer), len(self._chunk))
+        buffer[:n] = self._chunk[:n]
+        self._chunk = self._chunk[n:]
+        return n
+
+async def until_disconnect(receive):
+    # Once the body is read, the next message is http.disconnect when the client goes away
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+def header(scope, name):
+    name = name.encode('latin-1')
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+def json_request_data(scope, body):
+    # The body as a dict if Flask's request.json would accept it, else None (let Flask answer)
+    content_type = (header(scope, 'content-type') or '').split(';')[0].strip().lower()
+    if content_type != 'application/json' and not (content_type.startswith('application/') and content_type.endswith('+json')):
+        return None
+    try:
+        data = json.loads(body.read())
+    except ValueError:
+        return None
+    finally:
+        body.seek(0)
+    return data if isinstance(data, dict) else None
+
+def cors_headers(scope):
+    # Same headers flask_cors adds with its defaults
+    origin = header(scope, 'origin')
+    if origin:
+        return [(b'access-control-allow-origin', origin.encode('latin-1')), (b'vary', b'Origin')]
+    return [(b'access-control-allow-origin', b'*')]
+
+async def send_json(scope, send, payload, status=200, headers=None):
+    # Byte-for-byte what Flask's jsonify produces (sorted keys, compact, trailing newline)
+    body = (json.dumps(payload, sort_keys=True, separators=(',', ':')) + '\n').encode('utf-8')
+    response_headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    response_headers += [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in (headers or {}).items()]
+    await send({'type': 'http.response.start', 'status': status, 'headers': response_headers + cors_headers(scope)})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def start_sse(scope, send):
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream; charset=utf-8'),
+        (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no'),
+    ] + cors_headers(scope)})
+
+async def send_sse(send, payload, event=None, more_body=True):
+    await send({'type': 'http.response.body', 'body': backend.sse_event(payload, event).encode('utf-8'), 'more_body': more_body})
+
+async def run_blocking_if(blocking, func, *args):
+    # Session store calls hit SQLite when CHAT_SESSION_DB is set; keep those off the event loop
+    if blocking:
+        return await asyncio.to_thread(func, *args)
+    return func(*args)
+
+
+# --- ASYNC /get_weather ---
+async def handle_get_weather(scope, data, send, receive):
+    city = data.get('city')
+    lat = data.get('lat')
+    lon = data.get('lon')
+
+    if (lat is None or lon is None) and not city:
+        return await send_json(scope, send, {"error": "City name or coordinates (lat, lon) are required"}, 400)
+
+    async def fetch():
+        response = await owm_async.get(backend.OWM_API_URL, params=params)
+        return backend.parse_weather_response(response.json())
+
+    try:
+        params, key = backend.weather_request(lat, lon, city)
+        payload, status = await backend.weather_cache.aget_or_fetch(key, fetch)
+        await send_json(scope, send, payload, status)
+    except Exception as e:
+        payload, status, headers = backend.weather_error(e)
+        await send_json(scope, send, payload, status, headers)
+
+
+# --- ASYNC /sarthi_ai_chat ---
+def wants_chat_stream(scope, data):
+    # Same opt-in rules as app.wants_chat_stream
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return (data.get('stream') is True
+            or query.get('stream', [None])[0] == '1'
+            or 'text/event-stream' in (header(scope, 'accept') or ''))
+
+async def handle_chat(scope, data, send, receive):
+    if not backend.GOOGLE_API_KEY:
+        return await send_json(scope, send, {"error": "Chatbot API key not configured."}, 503)
+
+    blocking = bool(backend.chat_sessions.db_path)
+    try:
+        plan = await run_blocking_if(blocking, backend.plan_chat, data)
+    except ValueError as e:
+        payload, status = backend.chat_plan_error(e)
+        return await send_json(scope, send, payload, status)
+    stream = wants_chat_stream(scope, data)
+
+    if plan.cached_answer is not None:
+        reply = await run_blocking_if(blocking, backend.chat_reply, plan, plan.cached_answer, True)
+        if not stream:
+            return await send_json(scope, send, reply)
+        await start_sse(scope, send)
+        await send_sse(send, {"text": reply["response"]})
+        return await send_sse(send, reply, event="done", more_body=False)
+
+    headers = {"Content-Type": "application/json"}
+    if stream:
+        # Stops reading from Gemini (closing its stream) as soon as the client disconnects
+        streaming = asyncio.ensure_future(stream_chat(scope, send, plan, headers, blocking))
+        watcher = asyncio.ensure_future(until_disconnect(receive))
+        try:
+            await asyncio.wait({streaming, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            watcher.cancel()
+            if not streaming.done():
+                streaming.cancel()
+                print("Chat client disconnected; closed the Gemini stream.")
+            await asyncio.gather(streaming, return_exceptions=True)
+        return
+
+    try:
+        response = await gemini_async.post(backend.GEMINI_API_URL, headers=headers, data=plan.body.encode('utf-8'))
+        if response.status_code != 200:
+            raise backend.google_api_error(response)
+        bot_response = backend.extract_bot_response(response.json())
+        reply = await run_blocking_if(blocking, backend.chat_reply, plan, bot_response)
+        await send_json(scope, send, reply)
+    except Exception as e:
+        payload, status, headers = backend.chat_error(e)
+        await send_json(scope, send, payload, status, headers)
+
+async def stream_chat(scope, send, plan, headers, blocking):
+    await start_sse(scope, send)
+    pieces = []
+    try:
+        response = await gemini_async.post(backend.GEMINI_STREAM_URL, headers=headers,
+                                           data=plan.body.encode('utf-8'), stream=True)
+        try:
+            if response.status_code != 200:
+                await response.aread()
+                raise backend.google_api_error(response)
+            async for line in response.aiter_lines():
+                for text in backend.gemini_sse_texts(line):
+                    pieces.append(text)
+                    await send_sse(send, {"text": text})
+        finally:
+            await response.aclose()
+        done = await run_blocking_if(blocking, backend.chat_reply, plan, "".join(pieces) if pieces else None)
+        if not pieces:
+            await send_sse(send, {"text": done["response"]})
+        await send_sse(send, done, event="done", more_body=False)
+    except Exception as e:
+        print(f"Error during streamed chat generation: {e}")
+        await send_sse(send, {"error": f"Failed to generate AI response: {e}"}, event="error", more_body=False)
+
+
+# --- WSGI BRIDGE (all other routes) ---
+# Runs the Flask app on one pool thread per request (like a gthread worker) and relays the
+# response chunks to the event loop through a small queue, so streamed responses (NDJSON,
+# SSE) keep streaming and a slow client applies backpressure to the generator.
+def build_environ(scope, body):
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    server = scope.get('server') or ('localhost', 80)
+    environ['SERVER_NAME'], environ['SERVER_PORT'] = server[0], str(server[1] or 80)
+    client = scope.get('client')
+    if client:
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = client[0], str(client[1])
+    for raw_name, raw_value in scope['headers']:
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_TYPE' or name == 'CONTENT_LENGTH':
+            environ[name] = value
+            continue
+        key = 'HTTP_' + name
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    if 'CONTENT_LENGTH' not in environ:
+        environ['wsgi.input_terminated'] = True # Chunked upload: read body to its end
+    return environ
+
+async def call_wsgi(scope, body, send):
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue(maxsize=16)
+    closed = threading.Event()
+    response_start = {}
+    end = object()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(chunks.put(item), loop).result()
+
+    def start_response(status, headers, exc_info=None):
+        response_start['status'] = int(status.split(' ', 1)[0])
+        response_start['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+        return lambda data: put(bytes(data))
+
+    def run_app():
+        try:
+            result = backend.app(build_environ(scope, body), start_response)
+            try:
+                for chunk in result:
+                    if closed.is_set(): break
+                    if chunk: put(bytes(chunk))
+            finally:
+                if hasattr(result, 'close'): result.close()
+            put(end)
+        except BaseException as e:
+            put(e)
+        finally:
+            body.close()
+
+    loop.run_in_executor(wsgi_executor, run_app)
+    started = False
+    finished = False
+    try:
+        while True:
+            item = await chunks.get()
+            if isinstance(item, BaseException):
+                finished = True
+                raise item
+            if not started:
+                await send({'type': 'http.response.start', 'status': response_start['status'], 'headers': response_start['headers']})
+                started = True
+            if item is end:
+                finished = True
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+            await send({'type': 'http.response.body', 'body': item, 'more_body': True})
+    finally:
+        if not finished:
+            # Client went away: stop the generator and unblock its thread
+            closed.set()
+            while not chunks.empty() or not finished:
+                item = await chunks.get()
+                finished = item is end or isinstance(item, BaseException)
+
+
+# --- ASGI APP ---
+ASYNC_ROUTES = {
+    ('POST', '/get_weather'): handle_get_weather,
+    ('POST', '/sarthi_ai_chat'): handle_chat,
+}
+
+async def observe_request(handler, scope, data, send, receive):
+    # Same request metrics the Flask routes record (see record_request_metrics in app.py)
+    started = time.perf_counter() if metrics.timing_enabled() else None
+
+    async def send_observed(message):
+        if message['type'] == 'http.response.start':
+            metrics.observe_request(scope['path'], scope['method'], message['status'],
+                                    time.perf_counter() - started if started is not None else None)
+        await send(message)
+
+    return await handler(scope, data, send_observed, receive)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await gemini_async.aclose()
+            await owm_async.aclose()
+            wsgi_executor.shutdown(wait=False)
+            backend.inference.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    handler = ASYNC_ROUTES.get((scope['method'], scope['path']))
+    if handler is None:
+        body = ReceiveStream(receive, asyncio.get_running_loop()) # Unbuffered: read() returns what has arrived
+        return await call_wsgi(scope, body, send)
+
+    body = await read_body(receive)
+    data = json_request_data(scope, body)
+    if data is not None:
+        body.close()
+        return await observe_request(handler, scope, data, send, receive)
+    await call_wsgi(scope, body, send)
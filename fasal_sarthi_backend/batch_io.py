@@ -0,0 +1,154 @@
+import csv
+import io
+import json
+import shutil
+import tempfile
+
+
+# --- HELPERS FOR BULK (MANY ROWS PER REQUEST) ENDPOINTS ---
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/json-lines')
+CSV_CONTENT_TYPES = ('text/csv', 'application/csv')
+
+
+def parse_batch_rows(body, content_type):
+    """Parse a bulk request body into a list of rows.
+
+    Accepts a JSON array (or {"plots": [...]} / {"rows": [...]}), CSV with a header line,
+    or NDJSON (one JSON object per line). Returns a list where each item is either a dict
+    or a ValueError for a line that could not be parsed, so callers can report per-row
+    errors in input order. Raises ValueError if the body as a whole is unusable.
+    """
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    text = body.decode('utf-8-sig') if isinstance(body, bytes) else body
+
+    if content_type in CSV_CONTENT_TYPES:
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames:
+            raise ValueError("CSV body has no header line")
+        return [{k.strip(): v.strip() for k, v in row.items() if k is not None and v is not None} for row in reader]
+
+    if content_type in NDJSON_CONTENT_TYPES:
+        return [parse_ndjson_line(line) for line in text.splitlines() if line.strip()]
+
+    # Default: JSON
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise ValueError(f"Body is not valid JSON: {e}")
+    if isinstance(data, dict):
+        data = data.get('plots', data.get('rows'))
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array of rows (or an object with a 'plots' list)")
+    return data
+
+
+def parse_ndjson_line(line):
+    if isinstance(line, ValueError): # Already this row's error (see iter_ndjson_lines)
+        return line
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return ValueError(f"Invalid JSON line: {e}")
+
+
+NDJSON_MAX_LINE_BYTES = 1024 * 1024
+
+
+def decode_ndjson_line(line):
+    try:
+        return line.decode('utf-8-sig')
+    except UnicodeDecodeError as e:
+        return ValueError(f"Line is not valid UTF-8: {e}")
+
+
+def iter_ndjson_lines(stream, chunk_size=64 * 1024, max_line_bytes=NDJSON_MAX_LINE_BYTES):
+    # Yield decoded lines from a binary stream without reading the whole body into memory.
+    # A line that is not UTF-8 or longer than max_line_bytes is yielded as a ValueError (that
+    # row's error) and the rest continues; an oversized line is dropped as it arrives, so at
+    # most max_line_bytes + chunk_size bytes are held at once.
+    pending = b''
+    skipping = False # Inside an oversized line: drop everything up to its newline
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            if skipping:
+                skipping = False # The end of the oversized line
+            elif len(line) > max_line_bytes:
+                yield ValueError(f"Line longer than {max_line_bytes} bytes")
+            elif line.strip():
+                yield decode_ndjson_line(line)
+        if len(pending) > max_line_bytes:
+            if not skipping:
+                yield ValueError(f"Line longer than {max_line_bytes} bytes")
+                skipping = True
+            pending = b''
+    if pending.strip() and not skipping:
+        yield decode_ndjson_line(pending)
+
+
+def iter_chunks(items, chunk_size):
+    # Group any iterable into lists of at most chunk_size items
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# --- IMAGE UPLOADS (bulk disease scans) ---
+ZIP_CONTENT_TYPES = ('application/zip', 'application/x-zip-compressed', 'application/x-zip')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+
+def is_zip(file_storage):
+    # By content, not name: phones and share sheets often drop or change extensions
+    head = file_storage.stream.read(4)
+    file_storage.stream.seek(0)
+    return head == b'PK\x03\x04'
+
+
+def spool_stream(stream, max_memory=8 * 1024 * 1024, chunk_size=64 * 1024):
+    # Copy a request body into a seekable file (ZIP needs to seek to its central directory),
+    # kept in memory up to max_memory and on disk beyond that
+    spooled = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    shutil.copyfileobj(stream, spooled, chunk_size)
+    spooled.seek(0)
+    return spooled
+
+
+def zip_image_members(archive):
+    """Image entries of an open ZipFile in archive order (folders, macOS metadata and dotfiles skipped)."""
+    members = []
+    for info in archive.infolist():
+        name = info.filename
+        base = name.rsplit('/', 1)[-1]
+        if info.is_dir() or name.startswith('__MACOSX/') or base.startswith('.'):
+            continue
+        if base.lower().endswith(IMAGE_EXTENSIONS):
+            members.append(info)
+    return members
+
+
+def read_upload(file_storage, max_bytes):
+    data = file_storage.stream.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError(f"Image too large, max is {max_bytes} bytes")
+    return data
+
+
+def read_zip_member(archive, info, max_bytes):
+    # The size in the header can lie (zip bombs): never decompress more than max_bytes + 1
+    if info.file_size > max_bytes:
+        raise ValueError(f"Image too large ({info.file_size} bytes), max is {max_bytes}")
+    with archive.open(info) as f:
+        data = f.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise ValueError(f"Image too large, max is {max_bytes} bytes")
+    return data
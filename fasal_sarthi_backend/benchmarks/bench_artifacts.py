@@ -0,0 +1,117 @@
+"""Crop/fertilizer model loading: joblib files vs the compact artifact layout (artifacts.py).
+
+Imports app.py in a fresh process once per path (MODEL_ARTIFACTS_DIR='' for joblib) and
+reports each model's load time (the slot loader alone and the startup phase around it), the
+RSS each phase added, the import total and the process RSS. The same sample requests are
+predicted on both paths (including a bulk-sized fertilizer chunk) and must match.
+
+Run from fasal_sarthi_backend/ after `python artifacts.py export`:
+    python benchmarks/bench_artifacts.py --json artifacts.json
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+
+from bench_utils import BACKEND_DIR, add_output_args, crop_request, fertilizer_request, finish, run_metadata
+
+PHASES = {'crop': 'crop recommendation model', 'fertilizer': 'fertilizer model'}
+
+
+def run_worker(seed, rows):
+    # In the child: import the app (loads the models), then predict the sample requests
+    import time
+    start = time.perf_counter()
+    import app as backend
+    from artifacts import LabelDecoder
+    from startup_report import current_rss_mb, peak_rss_mb
+    import_seconds = time.perf_counter() - start
+
+    phases, previous_rss = {}, None
+    for phase in backend.startup_report.phases:
+        phases[phase['phase']] = {"seconds": phase['seconds'], "rss_added_mb": round(phase['rss_mb'] - (previous_rss or phase['rss_mb']), 1)}
+        previous_rss = phase['rss_mb']
+    models = {}
+    for name, slot in (('crop', backend.crop_models), ('fertilizer', backend.fert_models)):
+        loaded = slot.current
+        models[name] = {
+            "load_ms": round(loaded.load_seconds * 1000, 1) if loaded else None,
+            "startup_phase_ms": round(phases.get(PHASES[name], {}).get('seconds', 0.0) * 1000, 1),
+            "startup_phase_rss_added_mb": phases.get(PHASES[name], {}).get('rss_added_mb'),
+            "from_artifacts": bool(loaded and isinstance(loaded.model.label_encoder, LabelDecoder)),
+        }
+    rss = current_rss_mb()
+
+    rng = random.Random(seed)
+    crop_rows = [crop_request(rng) for _ in range(200)]
+    fert_rows = [fertilizer_request(rng) for _ in range(rows)]
+    crop = backend.crop_models.current.model
+    predictions = {
+        "crop": backend.infer_crop(crop.feature_encoder.encode_rows(crop_rows)[0]),
+        "fertilizer_single": [backend.infer_fertilizer(backend.fert_models.current.model.feature_encoder.encode(r))[0] for r in fert_rows[:200]],
+        "fertilizer_bulk": [r.get("recommended_fertilizer") for r in backend.predict_fertilizer_chunk(fert_rows, 0, backend.fert_models.current)],
+    }
+    backend.inference.shutdown()
+    return {
+        "import_seconds": round(import_seconds, 3),
+        "rss_after_import_mb": round(rss, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "models": models,
+        "predictions": predictions,
+    }
+
+
+def measure(mode, args):
+    env = dict(os.environ, MODEL_ARTIFACTS_DIR='' if mode == 'joblib' else args.artifacts_dir)
+    cmd = [sys.executable, os.path.abspath(__file__), '--worker', '--seed', str(args.seed), '--rows', str(args.rows)]
+    proc = subprocess.run(cmd, capture_output=True, text=True, env=env, cwd=args.model_dir or BACKEND_DIR)
+    lines = [line for line in proc.stdout.splitlines() if line.startswith('BENCH_JSON ')]
+    if proc.returncode != 0 or not lines:
+        print(f"{mode}: failed\n{proc.stdout[-2000:]}\n{proc.stderr[-2000:]}")
+        return None
+    return json.loads(lines[-1][len('BENCH_JSON '):])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model-dir', help='Folder with the model files (default: the backend folder)')
+    parser.add_argument('--artifacts-dir', default='artifacts', help='Relative to --model-dir (default artifacts)')
+    parser.add_argument('--repeat', type=int, default=3, help='Fresh processes per path; the fastest is kept (default 3)')
+    parser.add_argument('--rows', type=int, default=3000, help='Fertilizer rows in the bulk parity check (default 3000)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    add_output_args(parser)
+    args = parser.parse_args()
+
+    if args.worker:
+        sys.path.insert(0, BACKEND_DIR)
+        print('BENCH_JSON ' + json.dumps(run_worker(args.seed, args.rows)))
+        return 0
+
+    results, predictions = {}, {}
+    for mode in ('joblib', 'artifacts'):
+        runs = [run for run in (measure(mode, args) for _ in range(max(1, args.repeat))) if run is not None]
+        if not runs:
+            return 1
+        best = min(runs, key=lambda run: run["import_seconds"])
+        predictions[mode] = best.pop("predictions")
+        results[mode] = best
+        print(f"{mode}: import {best['import_seconds']:.2f}s, RSS {best['rss_after_import_mb']:.0f} MB")
+        for name, stats in best["models"].items():
+            print(f"  {name:<11} load {stats['load_ms']:>8.1f} ms  startup phase {stats['startup_phase_ms']:>8.1f} ms  "
+                  f"+{stats['startup_phase_rss_added_mb']} MB  from artifacts: {stats['from_artifacts']}")
+
+    if not results['artifacts']['models']['fertilizer']['from_artifacts']:
+        print(f"Note: the artifacts path loaded joblib files; run `python artifacts.py export` in {args.model_dir or BACKEND_DIR}.")
+    mismatches = {key: sum(a != b for a, b in zip(predictions['joblib'][key], predictions['artifacts'][key]))
+                  for key in predictions['joblib']}
+    print(f"Prediction mismatches between paths: {mismatches}")
+    results["mismatches"] = mismatches
+    code = finish(args, {"meta": run_metadata(args), "results": results})
+    return 1 if any(mismatches.values()) else code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Compare the old pandas encoding of /recommend_crop with the numpy CropFeatureEncoder.
+
+Checks that both produce the same 25-column feature rows (and the same predictions when
+the stacking model is available), then times both paths.
+
+Run from fasal_sarthi_backend/:  python benchmarks/bench_crop_features.py [--rows 2000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR) # Model paths in app.py are relative
+
+import app as backend # noqa: E402
+
+crop = backend.crop_models.current.model if backend.crop_models.current is not None else None
+
+
+def legacy_encode(data):
+    # The per-request pandas path /recommend_crop used before CropFeatureEncoder
+    input_df = pd.DataFrame(columns=backend.CROP_FULL_FEATURE_NAMES, index=[0]).fillna(0.0)
+    numerical_values_dict = {}
+    for feature_name in backend.CROP_NUMERICAL_FEATURES:
+        if feature_name not in data: raise KeyError(f"Missing: {feature_name}")
+        value = float(data[feature_name])
+        input_df.loc[0, feature_name] = value
+        numerical_values_dict[feature_name] = value
+    numerical_df_for_scaling = pd.DataFrame([numerical_values_dict], columns=backend.CROP_NUMERICAL_FEATURES)
+    input_df[backend.CROP_NUMERICAL_FEATURES] = crop.scaler.transform(numerical_df_for_scaling)
+    for prefix, key in (('soil_type_', 'soil_type'), ('irrigation_type_', 'irrigation_type'), ('previous_crop_', 'previous_crop')):
+        col = f'{prefix}{data[key]}'
+        if col in input_df.columns:
+            input_df.loc[0, col] = 1.0
+        elif key != 'previous_crop':
+            raise ValueError(f"Unknown/Unsupported {key}: {data[key]}")
+    return input_df[backend.CROP_FULL_FEATURE_NAMES]
+
+
+def random_requests(n, seed=0):
+    rng = np.random.default_rng(seed)
+    crops = backend.POSSIBLE_PREVIOUS_CROPS + ['Bajra'] # 'Bajra' exercises the all-zeros 'Other' case
+    rows = []
+    for _ in range(n):
+        rows.append({
+            'soil_ph': round(rng.uniform(4.5, 8.5), 2),
+            'nitrogen_kg_ha': round(rng.uniform(50, 350), 1),
+            'phosphorus_kg_ha': round(rng.uniform(10, 90), 1),
+            'potassium_kg_ha': round(rng.uniform(60, 300), 1),
+            'annual_rainfall_mm': round(rng.uniform(300, 1800), 1),
+            'avg_temp_c': round(rng.uniform(15, 38), 1),
+            'avg_humidity_pct': round(rng.uniform(25, 90), 1),
+            'soil_type': str(rng.choice(backend.POSSIBLE_SOIL_TYPES)),
+            'irrigation_type': str(rng.choice(backend.POSSIBLE_IRRIGATION_TYPES)),
+            'previous_crop': str(rng.choice(crops)),
+        })
+    return rows
+
+
+def time_per_call(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000)
+    args = parser.parse_args()
+
+    if crop is None:
+        print("Crop model could not be loaded; nothing to benchmark.")
+        return 1
+    requests_data = random_requests(args.rows)
+
+    # 1. Same features
+    legacy = np.vstack([legacy_encode(d).to_numpy(dtype=np.float64) for d in requests_data])
+    fast = np.vstack([crop.feature_encoder.encode(d) for d in requests_data])
+    max_diff = float(np.abs(legacy - fast).max())
+    print(f"Feature rows compared: {len(requests_data)}, max abs difference: {max_diff:.3e}")
+
+    # 2. Same predictions (only if the stacking model file is present)
+    model = crop.stacking
+    if model is not None:
+        legacy_pred = model.predict(pd.DataFrame(legacy, columns=backend.CROP_FULL_FEATURE_NAMES))
+        fast_pred = model.predict(fast)
+        mismatches = int((legacy_pred != fast_pred).sum())
+        print(f"Predictions compared: {len(fast_pred)}, mismatches: {mismatches}")
+    else:
+        mismatches = 0
+        print(f"Stacking model '{backend.CROP_MODEL_STACKING_PATH}' not found; skipped prediction comparison.")
+
+    # 3. Timings (encoding only, then encoding + single-row predict)
+    sample = requests_data[:min(len(requests_data), 500)]
+    print(f"pandas encode : {time_per_call(legacy_encode, sample):8.1f} us/request")
+    print(f"numpy encode  : {time_per_call(crop.feature_encoder.encode, sample):8.1f} us/request")
+    if model is not None:
+        sample = sample[:100]
+        print(f"pandas + predict: {time_per_call(lambda d: model.predict(legacy_encode(d)), sample):8.1f} us/request")
+        print(f"numpy + predict : {time_per_call(lambda d: model.predict(crop.feature_encoder.encode(d)), sample):8.1f} us/request")
+
+    return 0 if max_diff == 0.0 and mismatches == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+"""Disease-model variants (quantize_model.py): accuracy vs latency vs memory.
+
+Each variant runs in its own process, over the same images, through the serving code path
+(ImagePreprocessor + pooled interpreter + output dequantization). Reported per variant:
+top-1 agreement with the float model, top-1 accuracy when images sit in folders named after
+a class (e.g. images/Corn__Blight/1.jpg; other folders count for agreement only), p50/p95 of
+the invoke and of decode+preprocess+invoke, load time, model file size and RSS.
+
+Recommends the fastest variant (p50 invoke) whose agreement with float is at least
+100 - --tolerance percent (and whose accuracy, if labelled, is within --tolerance points of float).
+
+Run from fasal_sarthi_backend/:
+    python benchmarks/bench_disease_variants.py --images ./leaf_photos --tolerance 1 --json variants.json
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_utils import BACKEND_DIR, add_output_args, finish, run_metadata, summarize
+
+sys.path.insert(0, BACKEND_DIR)
+from interpreter_pool import VARIANTS, variant_path # noqa: E402
+from quantize_model import list_images # noqa: E402
+
+
+def class_names():
+    # CLASS_NAMES from app.py without importing it (that would load every model)
+    with open(os.path.join(BACKEND_DIR, 'app.py'), encoding='utf-8') as f:
+        for node in ast.parse(f.read()).body:
+            if isinstance(node, ast.Assign) and any(getattr(t, 'id', None) == 'CLASS_NAMES' for t in node.targets):
+                return ast.literal_eval(node.value)
+    return []
+
+
+def run_variant(model_path, image_paths, num_threads, repeat):
+    """Worker process body: returns per-image top-1 indices, latencies and memory."""
+    import numpy as np
+    from interpreter_pool import InterpreterPool, dequantize, load_interpreter_class
+    from preprocessing import ImagePreprocessor
+    from startup_report import current_rss_mb, peak_rss_mb
+
+    interpreter_class = load_interpreter_class()
+    base_rss = current_rss_mb()
+    pool = InterpreterPool(interpreter_class, model_path, size=1, num_threads=num_threads, warmup=True)
+    loaded_rss = current_rss_mb()
+    preprocessor = ImagePreprocessor(pool.input_details()[0])
+    output_detail = pool.output_details()[0]
+    images = []
+    for path in image_paths:
+        with open(path, 'rb') as f:
+            images.append(f.read())
+
+    top1, invoke, end_to_end = [], [], []
+    with pool.checkout() as interpreter:
+        input_index = interpreter.get_input_details()[0]['index']
+        output_index = output_detail['index']
+        for attempt in range(repeat):
+            for image_bytes in images:
+                start = time.perf_counter()
+                tensor = preprocessor.preprocess(image_bytes)
+                invoke_start = time.perf_counter()
+                interpreter.set_tensor(input_index, tensor)
+                interpreter.invoke()
+                predictions = dequantize(interpreter.get_tensor(output_index), output_detail)
+                end = time.perf_counter()
+                invoke.append(end - invoke_start)
+                end_to_end.append(end - start)
+                if attempt == 0:
+                    top1.append(int(np.argmax(predictions[0])))
+    return {
+        "top1": top1,
+        "invoke": invoke,
+        "end_to_end": end_to_end,
+        "load_s": pool.load_seconds,
+        "input_dtype": np.dtype(pool.input_details()[0]['dtype']).name,
+        "model_rss_mb": loaded_rss - base_rss,
+        "rss_mb": current_rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def measure(variant, model_path, image_list, args):
+    # Fresh process per variant so RSS is not shared between models
+    cmd = [sys.executable, os.path.abspath(__file__), '--worker', model_path, '--image-list', image_list,
+           '--num-threads', str(args.num_threads), '--repeat', str(args.repeat)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        print(f"  {variant}: failed\n{proc.stderr[-2000:]}")
+        return None
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', help='Folder of leaf photos (class-named subfolders for accuracy)')
+    parser.add_argument('--model', default=os.getenv('TFLITE_MODEL_PATH', os.path.join(BACKEND_DIR, 'FasalSarthi_Full_Model.tflite')),
+                        help='Float model; variants are looked up next to it')
+    parser.add_argument('--variants', default=','.join(VARIANTS), help='Comma-separated (missing files are skipped)')
+    parser.add_argument('--limit', type=int, default=0, help='Use at most this many images (default all)')
+    parser.add_argument('--repeat', type=int, default=1, help='Timed passes over the images (default 1)')
+    parser.add_argument('--num-threads', type=int, default=int(os.getenv('DISEASE_NUM_THREADS', str(os.cpu_count() or 1))))
+    parser.add_argument('--tolerance', type=float, default=1.0, help='Allowed top-1 drop vs float, in percent (default 1)')
+    parser.add_argument('--worker', metavar='MODEL', help=argparse.SUPPRESS)
+    parser.add_argument('--image-list', help=argparse.SUPPRESS)
+    add_output_args(parser)
+    args = parser.parse_args()
+
+    if args.worker:
+        with open(args.image_list, encoding='utf-8') as f:
+            image_paths = json.load(f)
+        print(json.dumps(run_variant(args.worker, image_paths, args.num_threads, args.repeat)))
+        return 0
+    if not args.images:
+        parser.error('--images is required')
+
+    image_paths = list_images(args.images)[:args.limit or None]
+    if not image_paths:
+        parser.error(f'no images found in {args.images}')
+    names = class_names()
+    labels = [os.path.basename(os.path.dirname(path)) for path in image_paths]
+    labels = [names.index(label) if label in names else None for label in labels]
+    labelled = sum(label is not None for label in labels)
+    print(f"{len(image_paths)} image(s), {labelled} labelled, {args.num_threads} thread(s)")
+
+    variants = [v.strip() for v in args.variants.split(',') if v.strip()]
+    if 'float' not in variants:
+        variants.insert(0, 'float') # The reference for agreement
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(image_paths, f)
+        image_list = f.name
+
+    results, reference = {}, None
+    try:
+        for variant in variants:
+            path = variant_path(args.model, variant)
+            if not os.path.exists(path):
+                print(f"  {variant}: {path} not found; skipped")
+                continue
+            run = measure(variant, path, image_list, args)
+            if run is None:
+                continue
+            if variant == 'float':
+                reference = run["top1"]
+            stats = {
+                "file_mb": round(os.path.getsize(path) / 1e6, 2),
+                "input_dtype": run["input_dtype"],
+                "load_ms": round(run["load_s"] * 1000, 1),
+                "invoke": summarize(run["invoke"]),
+                "end_to_end": summarize(run["end_to_end"]),
+                "model_rss_mb": round(run["model_rss_mb"], 1),
+                "peak_rss_mb": round(run["peak_rss_mb"], 1),
+            }
+            if reference is not None:
+                stats["agreement_pct"] = round(100.0 * sum(a == b for a, b in zip(run["top1"], reference)) / len(reference), 2)
+            if labelled:
+                stats["accuracy_pct"] = round(100.0 * sum(p == l for p, l in zip(run["top1"], labels) if l is not None) / labelled, 2)
+            results[variant] = stats
+            print(f"  {variant:<8} {stats['file_mb']:>7.2f} MB  invoke p50 {stats['invoke']['p50_ms']:>8.2f} ms  "
+                  f"p95 {stats['invoke']['p95_ms']:>8.2f} ms  end-to-end p95 {stats['end_to_end']['p95_ms']:>8.2f} ms  "
+                  f"model RSS {stats['model_rss_mb']:>6.1f} MB  agreement {stats.get('agreement_pct', '-')}%  "
+                  f"accuracy {stats.get('accuracy_pct', '-')}%")
+    finally:
+        os.remove(image_list)
+
+    if 'float' not in results:
+        print("Float model not measured; no recommendation.")
+        return 1
+    float_accuracy = results['float'].get('accuracy_pct')
+    eligible = [
+        variant for variant, stats in results.items()
+        if stats['agreement_pct'] >= 100.0 - args.tolerance
+        and (float_accuracy is None or stats['accuracy_pct'] >= float_accuracy - args.tolerance)
+    ]
+    best = min(eligible, key=lambda variant: results[variant]['invoke']['p50_ms'])
+    print(f"Recommended: DISEASE_MODEL_VARIANT={best} (fastest within {args.tolerance}% of float top-1)")
+    return finish(args, {"meta": run_metadata(args), "results": results, "recommended": best})
+
+
+if __name__ == '__main__':
+    sys.exit(main())
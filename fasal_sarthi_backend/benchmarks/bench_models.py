@@ -0,0 +1,129 @@
+"""Microbenchmarks for the model paths: crop, fertilizer and disease (per stage).
+
+Times each stage call by call and reports p50/p95/p99 (microseconds), calls per second and
+the process's peak RSS. Models that can't be loaded are skipped.
+
+Run from fasal_sarthi_backend/:
+    python benchmarks/bench_models.py --json before.json
+    python benchmarks/bench_models.py --compare before.json     (exit code 1 on regressions)
+
+--model-dir points at a folder holding the .joblib/.tflite files (default: this backend).
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import warnings
+
+import numpy as np
+
+from bench_utils import (BACKEND_DIR, add_backend_to_path, add_output_args, crop_request, fertilizer_request,
+                         finish, run_metadata, summarize)
+
+
+def bench(name, fn, items, results, warmup=3):
+    """Call fn(item) for every item, timing each call."""
+    for item in items[:warmup]:
+        fn(item)
+    durations = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        durations.append(time.perf_counter() - start)
+    stats = summarize(durations, scale=1e6, unit='us')
+    stats["calls_per_s"] = round(len(durations) / sum(durations), 1)
+    results[name] = stats
+    print(f"  {name:<34} p50 {stats['p50_us']:>10.1f} us   p95 {stats['p95_us']:>10.1f} us   "
+          f"p99 {stats['p99_us']:>10.1f} us   {stats['calls_per_s']:>10.1f}/s")
+
+
+def bench_crop(backend, rng, n, batch_rows, results):
+    if backend.crop_models.current is None:
+        print("Crop model not loaded; skipped.")
+        return
+    print("Crop recommendation:")
+    crop = backend.crop_models.current.model
+    requests_data = [crop_request(rng) for _ in range(n)]
+    rows = [crop.feature_encoder.encode(d) for d in requests_data]
+    encoded = [crop.stacking.predict(row) for row in rows]
+    bench("crop.encode", crop.feature_encoder.encode, requests_data, results)
+    bench("crop.predict", crop.stacking.predict, rows, results)
+    bench("crop.inverse_transform", crop.label_encoder.inverse_transform, encoded, results)
+    bench("crop.request", lambda d: backend.infer_crop(crop.feature_encoder.encode(d)), requests_data, results)
+    matrices = [crop.feature_encoder.encode_rows([crop_request(rng) for _ in range(batch_rows)])[0] for _ in range(3)]
+    bench(f"crop.predict_batch_{batch_rows}", backend.infer_crop, matrices, results, warmup=1)
+
+
+def bench_fertilizer(backend, rng, n, batch_rows, results):
+    if backend.fert_models.current is None:
+        print("Fertilizer model not loaded; skipped.")
+        return
+    print("Fertilizer recommendation:")
+    loaded = backend.fert_models.current
+    fert = loaded.model
+    requests_data = [fertilizer_request(rng) for _ in range(n)]
+    rows = [fert.feature_encoder.encode(d) for d in requests_data]
+    encoded = [backend.predict_fertilizer(row, fert) for row in rows]
+    bench("fertilizer.encode", fert.feature_encoder.encode, requests_data, results)
+    if fert.compiled is not None:
+        bench("fertilizer.predict_compiled", fert.compiled.predict, rows, results)
+    if fert.forest is not None:
+        bench("fertilizer.predict_sklearn", fert.forest.predict, rows, results)
+    bench("fertilizer.inverse_transform", fert.label_encoder.inverse_transform, encoded, results)
+    bench("fertilizer.request", lambda d: backend.infer_fertilizer(fert.feature_encoder.encode(d)), requests_data, results)
+    chunks = [[fertilizer_request(rng) for _ in range(batch_rows)] for _ in range(3)]
+    bench(f"fertilizer.batch_{batch_rows}", lambda rows: list(backend.predict_fertilizer_chunk(rows, 0, loaded)), chunks, results, warmup=1)
+
+
+def bench_disease(backend, image_path, n, results):
+    disease = backend.disease_models.get()
+    if disease is None:
+        print("Disease model not loaded; skipped.")
+        return
+    print("Disease detection:")
+    image_bytes = open(image_path, 'rb').read()
+    preprocessor = disease.model.preprocessor
+    img = preprocessor.load_image(image_bytes)
+    tensor = preprocessor.preprocess_image(img).copy()
+    images = [image_bytes] * n
+    bench("disease.load_image", preprocessor.load_image, images, results)
+    bench("disease.preprocess_image", preprocessor.preprocess_image, [img] * n, results)
+    bench("disease.invoke_1", backend.run_disease_batch, [tensor] * n, results)
+    batch = np.concatenate([tensor] * 8, axis=0)
+    bench("disease.invoke_8", backend.run_disease_batch, [batch] * max(3, n // 8), results)
+    bench("disease.request", lambda b: backend.run_disease_batch(preprocessor.preprocess(b)), images, results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=500, help='Calls per single-request benchmark (default 500)')
+    parser.add_argument('--batch-rows', type=int, default=2000, help='Rows per batch benchmark (default 2000)')
+    parser.add_argument('--disease-iterations', type=int, default=50)
+    parser.add_argument('--image', default=os.path.join(BACKEND_DIR, 'corn_blight.jpeg'))
+    parser.add_argument('--model-dir', help='Folder with the model files (default: the backend folder)')
+    parser.add_argument('--only', choices=['crop', 'fertilizer', 'disease'], action='append')
+    parser.add_argument('--seed', type=int, default=0)
+    add_output_args(parser)
+    args = parser.parse_args()
+    args.image = os.path.abspath(args.image)
+
+    add_backend_to_path(args.model_dir)
+    warnings.filterwarnings('ignore', category=UserWarning) # sklearn feature-name / TF deprecation noise
+    import app as backend
+    from startup_report import peak_rss_mb
+
+    rng = random.Random(args.seed)
+    results = {}
+    only = set(args.only or ['crop', 'fertilizer', 'disease'])
+    if 'crop' in only: bench_crop(backend, rng, args.iterations, args.batch_rows, results)
+    if 'fertilizer' in only: bench_fertilizer(backend, rng, args.iterations, args.batch_rows, results)
+    if 'disease' in only: bench_disease(backend, args.image, args.disease_iterations, results)
+    results["process"] = {"peak_rss_mb": round(peak_rss_mb(), 1)}
+    print(f"Peak RSS: {results['process']['peak_rss_mb']} MB")
+    backend.inference.shutdown()
+    return finish(args, {"meta": run_metadata(args), "results": results})
+
+
+if __name__ == '__main__':
+    sys.exit(main())
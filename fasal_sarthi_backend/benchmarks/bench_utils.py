@@ -0,0 +1,188 @@
+"""Shared helpers for the benchmark scripts: percentiles, RSS, JSON results and comparison."""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values: return None
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100.0 * len(sorted_values)))]
+
+
+def summarize(seconds, scale=1000.0, unit='ms'):
+    """p50/p95/p99/mean/max of a list of durations (in seconds), converted with `scale`."""
+    values = sorted(seconds)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        f"p50_{unit}": round(percentile(values, 50) * scale, 3),
+        f"p95_{unit}": round(percentile(values, 95) * scale, 3),
+        f"p99_{unit}": round(percentile(values, 99) * scale, 3),
+        f"mean_{unit}": round(sum(values) / len(values) * scale, 3),
+        f"max_{unit}": round(values[-1] * scale, 3),
+    }
+
+
+def process_rss_mb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return 0.0
+
+
+def process_tree(pid):
+    # pid plus all descendants (Linux /proc), e.g. a gunicorn master and its workers
+    pids, todo = [], [pid]
+    while todo:
+        current = todo.pop()
+        pids.append(current)
+        try:
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    todo.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def tree_rss_mb(pid):
+    """Total RSS of a process and its children (shared pages are counted once per process)."""
+    return sum(process_rss_mb(p) for p in process_tree(pid))
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=BACKEND_DIR, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_metadata(args):
+    return {
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+    }
+
+
+def save_json(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Results saved to {path}")
+
+
+def flatten(results, prefix=''):
+    # {"a": {"b": 1}} -> {"a.b": 1}, numbers only (used to line up two runs)
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+# Compared between runs (p99/max are too noisy on short runs to gate on)
+LOWER_IS_BETTER = ('p50_ms', 'p95_ms', 'p50_us', 'p95_us', 'peak_rss_mb')
+HIGHER_IS_BETTER = ('calls_per_s', 'throughput_rps')
+
+
+def compare(old_path, new_results, threshold_pct=10.0):
+    """Print metrics that moved by more than threshold_pct against an earlier JSON run.
+
+    Returns the number of regressions (latency/RSS up or throughput down beyond the threshold).
+    """
+    with open(old_path) as f:
+        old = flatten(json.load(f).get("results", {}))
+    new = flatten(new_results.get("results", {}))
+    regressions = 0
+    print(f"\nCompared with {old_path} (threshold {threshold_pct:.0f}%):")
+    for name in sorted(set(old) & set(new)):
+        before, after = old[name], new[name]
+        if not before: continue
+        if name.endswith(LOWER_IS_BETTER):
+            worse = after > before
+        elif name.endswith(HIGHER_IS_BETTER):
+            worse = after < before
+        else:
+            continue
+        change = (after - before) / abs(before) * 100.0
+        if abs(change) < threshold_pct: continue
+        regressions += int(worse)
+        print(f"  {'REGRESSION' if worse else 'improved  '} {name}: {before} -> {after} ({change:+.1f}%)")
+    if not regressions:
+        print("  no regressions")
+    return regressions
+
+
+def add_output_args(parser):
+    parser.add_argument('--json', metavar='PATH', help='Save results as JSON')
+    parser.add_argument('--compare', metavar='PATH', help='Earlier JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Percent change reported by --compare (default 10)')
+
+
+def finish(args, results):
+    # Save / compare; exit code 1 when --compare finds regressions
+    if args.json:
+        save_json(args.json, results)
+    if args.compare:
+        return 1 if compare(args.compare, results, threshold_pct=args.threshold) else 0
+    return 0
+
+
+def add_backend_to_path(model_dir=None):
+    # Make `import app` work from benchmarks/ and load models from model_dir (paths in app.py are relative)
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(model_dir or BACKEND_DIR)
+
+
+# --- SAMPLE REQUEST BODIES (valid for the shipped models) ---
+SOIL_TYPES = ['Black (Vertisol)', 'Laterite', 'Loamy', 'Red', 'Sandy']
+IRRIGATION_TYPES = ['Drip', 'Groundwater', 'Mixed', 'Rainfed', 'Sprinkler']
+PREVIOUS_CROPS = ['Dal', 'Fallow', 'Ganna', 'Makka', 'Moongfali', 'Rice', 'Sarson', 'Wheat']
+FERT_SOIL_TYPES = ['Black', 'Clayey', 'Loamy', 'Red', 'Sandy']
+FERT_CROP_TYPES = ['Barley', 'Cotton', 'Ground Nuts', 'Maize', 'Millets', 'Oil seeds', 'Paddy', 'Pulses', 'Sugarcane', 'Tobacco', 'Wheat']
+
+
+def crop_request(rng):
+    return {
+        'soil_ph': round(rng.uniform(4.5, 8.5), 2),
+        'nitrogen_kg_ha': round(rng.uniform(50, 350), 1),
+        'phosphorus_kg_ha': round(rng.uniform(10, 90), 1),
+        'potassium_kg_ha': round(rng.uniform(60, 300), 1),
+        'annual_rainfall_mm': round(rng.uniform(300, 1800), 1),
+        'avg_temp_c': round(rng.uniform(15, 38), 1),
+        'avg_humidity_pct': round(rng.uniform(25, 90), 1),
+        'soil_type': rng.choice(SOIL_TYPES),
+        'irrigation_type': rng.choice(IRRIGATION_TYPES),
+        'previous_crop': rng.choice(PREVIOUS_CROPS),
+    }
+
+
+def fertilizer_request(rng):
+    return {
+        'Temparature': rng.randint(20, 40),
+        'Humidity': rng.randint(30, 75),
+        'Moisture': rng.randint(25, 65),
+        'Nitrogen': rng.randint(0, 45),
+        'Potassium': rng.randint(0, 20),
+        'Phosphorous': rng.randint(0, 45),
+        'Soil_Type': rng.choice(FERT_SOIL_TYPES),
+        'Crop_Type': rng.choice(FERT_CROP_TYPES),
+    }
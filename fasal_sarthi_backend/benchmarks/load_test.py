@@ -0,0 +1,305 @@
+"""Offline load test: drives every backend route at set concurrency levels.
+
+Starts the stub upstreams (stub_upstreams.py, configurable latency) and the backend pointed
+at them, then for each concurrency level and route runs closed-loop clients for --duration
+seconds. Reports p50/p95/p99 latency, throughput, status codes and the server's peak RSS
+(master + workers + inference processes), and can save/compare JSON results.
+
+Run from fasal_sarthi_backend/:
+    python benchmarks/load_test.py --server gunicorn --concurrency 1,8,32 --json before.json
+    python benchmarks/load_test.py --server uvicorn --routes get_weather,sarthi_ai_chat --upstream-latency-ms 800
+    python benchmarks/load_test.py --url http://127.0.0.1:5000 --compare before.json
+
+--env KEY=VALUE (repeatable) passes settings to the server, e.g. --env INFERENCE_PROCESSES=2.
+"""
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import requests
+
+from bench_utils import (BACKEND_DIR, add_output_args, crop_request, fertilizer_request, finish, run_metadata,
+                         summarize, tree_rss_mb)
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# --- REQUESTS PER ROUTE ---
+# Each builder returns requests.request kwargs for call number `n`. Inputs vary per call so
+# the prediction/FAQ caches don't turn the test into a cache benchmark (see --cache-hits).
+class RouteBuilders:
+    def __init__(self, image_bytes, weather_locations, cache_hits):
+        self.image_bytes = image_bytes
+        self.weather_locations = weather_locations
+        self.cache_hits = cache_hits
+
+    def home(self, rng, n):
+        return {'method': 'GET', 'path': '/'}
+
+    def predict_disease(self, rng, n):
+        # Bytes after the JPEG end marker change the cache key without changing the image
+        image = self.image_bytes if self.cache_hits else self.image_bytes + b'bench-%d-%d' % (n, rng.getrandbits(32))
+        return {'method': 'POST', 'path': '/predict_disease', 'files': {'file': ('leaf.jpeg', image, 'image/jpeg')}}
+
+    def predict_disease_bulk(self, rng, n):
+        # One field visit: 24 photos in one request
+        files = [('file', (f'leaf{i}.jpeg', self.predict_disease(rng, n)['files']['file'][1], 'image/jpeg')) for i in range(24)]
+        return {'method': 'POST', 'path': '/predict_disease/bulk', 'files': files}
+
+    def recommend_crop(self, rng, n):
+        return {'method': 'POST', 'path': '/recommend_crop', 'json': crop_request(rng)}
+
+    def recommend_crop_batch(self, rng, n):
+        return {'method': 'POST', 'path': '/recommend_crop/batch', 'json': [crop_request(rng) for _ in range(100)]}
+
+    def recommend_fertilizer(self, rng, n):
+        return {'method': 'POST', 'path': '/recommend_fertilizer', 'json': fertilizer_request(rng)}
+
+    def recommend_fertilizer_batch(self, rng, n):
+        body = "\n".join(json.dumps(fertilizer_request(rng)) for _ in range(500))
+        return {'method': 'POST', 'path': '/recommend_fertilizer/batch', 'data': body,
+                'headers': {'Content-Type': 'application/x-ndjson'}}
+
+    def get_weather(self, rng, n):
+        # Farms spread over `weather_locations` ~1 km cache buckets
+        spot = rng.randrange(self.weather_locations)
+        return {'method': 'POST', 'path': '/get_weather', 'json': {'lat': 20.0 + spot * 0.05, 'lon': 78.0 + (spot % 7) * 0.05}}
+
+    def sarthi_ai_chat(self, rng, n):
+        # Only opening questions are answered from the FAQ cache, so a prior turn forces a Gemini call
+        history = [] if self.cache_hits else [{'role': 'user', 'message': 'नमस्ते'}, {'role': 'model', 'message': 'नमस्ते! पूछिए।'}]
+        message = f"गेहूं में कौन सी खाद डालें? ({n})"
+        return {'method': 'POST', 'path': '/sarthi_ai_chat', 'json': {'message': message, 'history': history}}
+
+    def sarthi_ai_chat_stream(self, rng, n):
+        kwargs = self.sarthi_ai_chat(rng, n)
+        kwargs['path'] += '?stream=1'
+        return kwargs
+
+    def field_advisory(self, rng, n):
+        # One advisory screen: weather fills the crop/fertilizer temperature and humidity
+        crop, fert = crop_request(rng), fertilizer_request(rng)
+        for key in ('avg_temp_c', 'avg_humidity_pct'): crop.pop(key)
+        for key in ('Temparature', 'Humidity'): fert.pop(key)
+        body = {**self.get_weather(rng, n)['json'], 'crop': crop, 'fertilizer': fert,
+                'chat': self.sarthi_ai_chat(rng, n)['json']}
+        return {'method': 'POST', 'path': '/field_advisory', 'json': body}
+
+    def metrics(self, rng, n):
+        return {'method': 'GET', 'path': '/metrics'}
+
+
+ROUTES = ['home', 'predict_disease', 'predict_disease_bulk', 'recommend_crop', 'recommend_crop_batch', 'recommend_fertilizer',
+          'recommend_fertilizer_batch', 'get_weather', 'sarthi_ai_chat', 'sarthi_ai_chat_stream', 'field_advisory', 'metrics']
+
+
+def send(session, base_url, kwargs, timeout):
+    kwargs = dict(kwargs)
+    url = base_url + kwargs.pop('path')
+    response = session.request(kwargs.pop('method'), url, timeout=timeout, **kwargs)
+    response.content # Read the whole body (streamed routes included)
+    return response.status_code
+
+
+def run_level(base_url, builder, concurrency, duration, timeout, seed):
+    """Closed loop: `concurrency` clients send back-to-back requests for `duration` seconds."""
+    latencies, statuses = [], Counter()
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(k):
+        rng = random.Random(seed * 1000 + k)
+        session = requests.Session()
+        n = 0
+        while time.perf_counter() < deadline:
+            kwargs = builder(rng, k * 1_000_000 + n)
+            start = time.perf_counter()
+            try:
+                status = send(session, base_url, kwargs, timeout)
+            except requests.RequestException as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - start
+            n += 1
+            with lock:
+                latencies.append(elapsed)
+                statuses[str(status)] += 1
+        session.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(k,), daemon=True) for k in range(concurrency)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    wall = time.perf_counter() - started
+
+    stats = summarize(latencies)
+    ok = sum(count for status, count in statuses.items() if status.isdigit() and int(status) < 400)
+    stats["throughput_rps"] = round(ok / wall, 2)
+    stats["errors"] = sum(statuses.values()) - ok
+    stats["status_counts"] = dict(statuses)
+    return stats
+
+
+class RSSSampler:
+    """Samples the total RSS of the server's process tree in the background; keeps the peak."""
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak_mb = 0.0
+        self._stop.clear()
+        if self.pid:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, tree_rss_mb(self.pid))
+            self._stop.wait(self.interval)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self.peak_mb = max(self.peak_mb, tree_rss_mb(self.pid))
+        return False
+
+
+# --- PROCESSES UNDER TEST ---
+def start_process(cmd, env=None, cwd=None, log_path=None):
+    log = open(log_path, 'w') if log_path else subprocess.DEVNULL
+    return subprocess.Popen(cmd, env=env, cwd=cwd, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def stop_process(process):
+    if process is None or process.poll() is not None: return
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def wait_until_up(url, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Process exited with code {process.returncode} while starting ({url})")
+        try:
+            requests.get(url, timeout=2)
+            return
+        except requests.RequestException:
+            time.sleep(0.5)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def server_command(kind, port, workers):
+    if kind == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', '-c', os.path.join(BACKEND_DIR, 'gunicorn.conf.py'),
+                '--pythonpath', BACKEND_DIR, 'app:create_app()']
+    if kind == 'uvicorn':
+        return [sys.executable, '-m', 'uvicorn', '--app-dir', BACKEND_DIR, 'asgi:app',
+                '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers), '--no-access-log']
+    if kind == 'flask':
+        return [sys.executable, '-c', f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    raise ValueError(kind)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='Test an already running backend instead of starting one')
+    parser.add_argument('--server', choices=['gunicorn', 'uvicorn', 'flask'], default='gunicorn')
+    parser.add_argument('--server-pid', type=int, help='With --url: PID whose process tree RSS is sampled')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--workers', type=int, default=2, help='WEB_CONCURRENCY / uvicorn --workers (default 2)')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help='Extra server environment')
+    parser.add_argument('--model-dir', help='Folder with the model files, used as the server cwd (default: backend folder)')
+    parser.add_argument('--concurrency', default='1,8,32', help='Comma-separated client counts (default 1,8,32)')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per route and level (default 10)')
+    parser.add_argument('--routes', default=','.join(ROUTES), help=f"Comma-separated subset of: {', '.join(ROUTES)}")
+    parser.add_argument('--timeout', type=float, default=60.0, help='Client timeout per request (default 60)')
+    parser.add_argument('--cache-hits', action='store_true', help='Repeat identical images/questions (measure cache hits)')
+    parser.add_argument('--weather-locations', type=int, default=200)
+    parser.add_argument('--image', default=os.path.join(BACKEND_DIR, 'corn_blight.jpeg'))
+    parser.add_argument('--stub-port', type=int, default=8099)
+    parser.add_argument('--upstream-latency-ms', type=float, default=300.0)
+    parser.add_argument('--gemini-latency-ms', type=float, help='Gemini stub latency (default: --upstream-latency-ms)')
+    parser.add_argument('--upstream-jitter-ms', type=float, default=50.0)
+    parser.add_argument('--upstream-fail-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    add_output_args(parser)
+    args = parser.parse_args()
+
+    routes = [r.strip() for r in args.routes.split(',') if r.strip()]
+    unknown = set(routes) - set(ROUTES)
+    if unknown: parser.error(f"unknown routes: {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(',')]
+    with open(args.image, 'rb') as f:
+        builders = RouteBuilders(f.read(), args.weather_locations, args.cache_hits)
+
+    stub = server = None
+    base_url, server_pid = args.url, args.server_pid
+    try:
+        if not base_url:
+            stub_cmd = [sys.executable, os.path.join(BENCH_DIR, 'stub_upstreams.py'), '--port', str(args.stub_port),
+                        '--latency-ms', str(args.upstream_latency_ms), '--jitter-ms', str(args.upstream_jitter_ms),
+                        '--fail-rate', str(args.upstream_fail_rate)]
+            if args.gemini_latency_ms is not None:
+                stub_cmd += ['--gemini-latency-ms', str(args.gemini_latency_ms)]
+            stub = start_process(stub_cmd)
+            wait_until_up(f"http://127.0.0.1:{args.stub_port}/_stub", stub, 30)
+            env = dict(os.environ, PORT=str(args.port), WEB_CONCURRENCY=str(args.workers),
+                       OWM_API_KEY='stub', GOOGLE_API_KEY='stub',
+                       OWM_API_URL=f"http://127.0.0.1:{args.stub_port}/data/2.5/weather",
+                       GEMINI_API_BASE=f"http://127.0.0.1:{args.stub_port}")
+            env.update(item.split('=', 1) for item in args.env)
+            env['PYTHONPATH'] = os.pathsep.join(filter(None, [BACKEND_DIR, env.get('PYTHONPATH')]))
+            log_path = os.path.join(tempfile.gettempdir(), f'fasal_load_test_{args.server}.log')
+            server = start_process(server_command(args.server, args.port, args.workers), env=env,
+                                   cwd=args.model_dir or BACKEND_DIR, log_path=log_path)
+            base_url, server_pid = f"http://127.0.0.1:{args.port}", server.pid
+            print(f"Started {args.server} (pid {server.pid}, log {log_path}) against stub upstreams "
+                  f"({args.upstream_latency_ms:.0f}±{args.upstream_jitter_ms:.0f} ms)")
+        wait_until_up(base_url + '/', server, 180)
+
+        # Warm-up: one call per route (lazy model loads, connection pools)
+        warm_rng = random.Random(args.seed)
+        for route in routes:
+            send(requests, base_url, getattr(builders, route)(warm_rng, -1), args.timeout)
+
+        results = {}
+        sampler = RSSSampler(server_pid)
+        for concurrency in levels:
+            level = results[f"c{concurrency}"] = {}
+            with sampler:
+                for route in routes:
+                    stats = level[route] = run_level(base_url, getattr(builders, route), concurrency,
+                                                     args.duration, args.timeout, args.seed)
+                    print(f"c={concurrency:<4} {route:<28} p50 {stats.get('p50_ms', 0):>9.1f} ms  "
+                          f"p95 {stats.get('p95_ms', 0):>9.1f} ms  p99 {stats.get('p99_ms', 0):>9.1f} ms  "
+                          f"{stats['throughput_rps']:>8.1f} req/s  errors {stats['errors']}")
+            if server_pid:
+                level["server_peak_rss_mb"] = round(sampler.peak_mb, 1)
+                print(f"c={concurrency:<4} server peak RSS {sampler.peak_mb:.0f} MB")
+    finally:
+        stop_process(server)
+        stop_process(stub)
+
+    return finish(args, {"meta": run_metadata(args), "results": results})
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""Local stand-in for OpenWeatherMap and the Gemini API, for load and failure testing.
+
+Serves the endpoints app.py calls (weather, generateContent and streamGenerateContent
+with alt=sse), with configurable latency and failure rate:
+
+    python benchmarks/stub_upstreams.py --port 8099 --latency-ms 150 --fail-rate 0.1
+
+(--gemini-latency-ms sets a separate latency for Gemini, which is usually much slower than OWM)
+
+then start the backend against it:
+
+    OWM_API_URL=http://127.0.0.1:8099/data/2.5/weather \\
+    GEMINI_API_BASE=http://127.0.0.1:8099 python app.py   (or gunicorn)
+
+Runtime knobs can be changed without a restart: POST /_stub {"latency_ms": 0, "fail_rate": 1}.
+GET /_stub returns the request counters.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CONFIG = {"latency_ms": 100.0, "gemini_latency_ms": None, "jitter_ms": 20.0, "fail_rate": 0.0, "fail_status": 503,
+          "stream_chunks": 5, "chunk_interval_ms": 100.0}
+COUNTS = {"weather": 0, "gemini": 0, "failed": 0}
+LOCK = threading.Lock()
+
+
+def weather_payload(query):
+    lat = float(query.get('lat', ['23.26'])[0])
+    lon = float(query.get('lon', ['77.41'])[0])
+    now = int(time.time())
+    return {
+        "cod": 200,
+        "name": query.get('q', ["Stub City"])[0],
+        "coord": {"lat": lat, "lon": lon},
+        "main": {"temp": 28.5, "feels_like": 30.1, "temp_min": 27.0, "temp_max": 31.0, "humidity": 62, "pressure": 1008},
+        "wind": {"speed": 3.2, "deg": 240},
+        "weather": [{"description": "scattered clouds", "icon": "03d"}],
+        "clouds": {"all": 40},
+        "visibility": 8000,
+        "sys": {"country": "IN", "sunrise": now - 6 * 3600, "sunset": now + 6 * 3600},
+        "timezone": 19800,
+    }
+
+
+def gemini_payload(body):
+    contents = body.get('contents') or [{}]
+    last = (contents[-1].get('parts') or [{}])[0].get('text', '')
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": f"(stub) आपने पूछा: {last[:200]}"}]}}]}
+
+
+def gemini_stream_pieces(body, n_pieces):
+    text = gemini_payload(body)["candidates"][0]["content"]["parts"][0]["text"]
+    size = max(1, -(-len(text) // max(1, n_pieces)))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive, like the real upstreams
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, payload, content_type='application/json'):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_sse(self, pieces):
+        # Chunked SSE like Gemini's alt=sse: one partial candidate per event
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i, piece in enumerate(pieces):
+            if i: time.sleep(CONFIG["chunk_interval_ms"] / 1000.0)
+            event = {"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]}}]}
+            data = f"data: {json.dumps(event, ensure_ascii=False)}\r\n\r\n".encode('utf-8')
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.flush()
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _simulate(self, counter):
+        with LOCK:
+            COUNTS[counter] += 1
+            latency, jitter = CONFIG["latency_ms"], CONFIG["jitter_ms"]
+            if counter == "gemini" and CONFIG["gemini_latency_ms"] is not None:
+                latency = CONFIG["gemini_latency_ms"]
+            fail = random.random() < CONFIG["fail_rate"]
+            if fail: COUNTS["failed"] += 1
+        time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)) / 1000.0)
+        if fail:
+            self._send(CONFIG["fail_status"], {"error": {"message": "stub failure"}})
+        return fail
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/_stub':
+            with LOCK:
+                return self._send(200, {"config": CONFIG, "counts": COUNTS})
+        if url.path.endswith('/weather'):
+            if self._simulate("weather"): return
+            return self._send(200, weather_payload(parse_qs(url.query)))
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self._read_json()
+        if url.path == '/_stub':
+            with LOCK:
+                CONFIG.update({k: v for k, v in body.items() if k in CONFIG})
+                return self._send(200, {"config": CONFIG})
+        if ':generateContent' in url.path:
+            if self._simulate("gemini"): return
+            return self._send(200, gemini_payload(body))
+        if ':streamGenerateContent' in url.path:
+            if self._simulate("gemini"): return
+            return self._send_sse(gemini_stream_pieces(body, int(CONFIG["stream_chunks"])))
+        self._send(404, {"error": "not found"})
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024 # Default backlog of 5 drops connections under load tests
+
+
+def serve(host='127.0.0.1', port=8099):
+    server = StubServer((host, port), StubHandler)
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency-ms', type=float, default=CONFIG["latency_ms"])
+    parser.add_argument('--jitter-ms', type=float, default=CONFIG["jitter_ms"])
+    parser.add_argument('--fail-rate', type=float, default=CONFIG["fail_rate"])
+    parser.add_argument('--fail-status', type=int, default=CONFIG["fail_status"])
+    parser.add_argument('--gemini-latency-ms', type=float, default=None)
+    parser.add_argument('--stream-chunks', type=int, default=CONFIG["stream_chunks"])
+    parser.add_argument('--chunk-interval-ms', type=float, default=CONFIG["chunk_interval_ms"])
+    args = parser.parse_args()
+    CONFIG.update(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, fail_rate=args.fail_rate, fail_status=args.fail_status,
+                  gemini_latency_ms=args.gemini_latency_ms, stream_chunks=args.stream_chunks,
+                  chunk_interval_ms=args.chunk_interval_ms)
+
+    server = serve(args.host, args.port)
+    print(f"Stub OWM + Gemini listening on http://{args.host}:{args.port} "
+          f"(latency {args.latency_ms:.0f}±{args.jitter_ms:.0f} ms, fail rate {args.fail_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,163 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+SESSION_ID_RE = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+
+def estimate_tokens(text):
+    # Rough count without a tokenizer: Gemini averages ~3-4 chars per token for English and
+    # fewer for Devanagari, so len/3 errs on the side of a smaller window
+    return max(1, len(text) // 3)
+
+
+def gemini_content(role, text):
+    return {"role": role, "parts": [{"text": text}]}
+
+
+# --- ONE CONVERSATION ---
+# Holds only the turns inside the token budget (older turns drop off the front) plus the
+# serialized JSON of `{"contents": [system prompt, window...` so a request just appends
+# the new message instead of re-serializing the whole conversation.
+class ChatSession:
+    def __init__(self, session_id, system_prompt, token_budget):
+        self.session_id = session_id
+        self.system_json = json.dumps({"parts": [{"text": system_prompt}]}, ensure_ascii=False)
+        self.token_budget = token_budget
+        self.turns = [] # [(role, text, tokens)] oldest first, all within the budget
+        self.window_tokens = 0
+        self.last_row_id = 0 # Newest SQLite row already applied (for sharing across workers)
+        self.updated_at = time.time()
+        self._prefix = None
+
+    def append(self, role, text):
+        tokens = estimate_tokens(text)
+        self.turns.append((role, text, tokens))
+        self.window_tokens += tokens
+        dropped = False
+        while len(self.turns) > 1 and self.window_tokens > self.token_budget:
+            self.window_tokens -= self.turns.pop(0)[2]
+            dropped = True
+        if dropped or self._prefix is None:
+            self._prefix = None
+        else:
+            self._prefix += ", " + json.dumps(gemini_content(role, text), ensure_ascii=False)
+        self.updated_at = time.time()
+
+    def prefix(self):
+        if self._prefix is None:
+            parts = [self.system_json]
+            parts.extend(json.dumps(gemini_content(role, text), ensure_ascii=False) for role, text, _ in self.turns)
+            self._prefix = '{"contents": [' + ", ".join(parts)
+        return self._prefix
+
+    def request_body(self, user_message):
+        """Serialized Gemini request: cached prefix + the new user message."""
+        return self.prefix() + ", " + json.dumps(gemini_content("user", user_message), ensure_ascii=False) + "]}"
+
+
+# --- SESSION STORE ---
+# In-memory LRU of ChatSession objects keyed by the client's session_id, with an idle TTL.
+# With db_path set, every turn is also written to SQLite, so sessions survive restarts and
+# all gunicorn workers see the same conversation (each worker catches up on rows it missed).
+class ChatSessionStore:
+    def __init__(self, system_prompt, token_budget=2000, max_sessions=10000, ttl_seconds=21600, db_path=None):
+        self.system_prompt = system_prompt
+        self.token_budget = int(token_budget)
+        self.max_sessions = int(max_sessions)
+        self.ttl = float(ttl_seconds)
+        self.db_path = db_path or None
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_pid = None
+        self._writes = 0 # Expired SQLite rows are deleted every 1000 writes
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.max_sessions > 0
+
+    # SQLite connection is opened lazily per process (never inherited across fork)
+    def _connection(self):
+        if self._db is None or self._db_pid != os.getpid():
+            db = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS chat_turns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                text TEXT NOT NULL,
+                created_at REAL NOT NULL)""")
+            db.execute("CREATE INDEX IF NOT EXISTS chat_turns_session ON chat_turns (session_id, id)")
+            self._db, self._db_pid = db, os.getpid()
+        return self._db
+
+    def _load_rows(self, session):
+        # Newest rows first, stopping well past what the token budget could hold
+        rows = self._connection().execute(
+            "SELECT id, role, text FROM chat_turns WHERE session_id = ? AND id > ? AND created_at > ? "
+            "ORDER BY id DESC LIMIT 200",
+            (session.session_id, session.last_row_id, time.time() - self.ttl)).fetchall()
+        for row_id, role, text in reversed(rows):
+            session.append(role, text)
+            session.last_row_id = row_id
+
+    def get(self, session_id):
+        """Return (session, is_new). Expired or unknown ids give a fresh, empty session."""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and now - session.updated_at > self.ttl:
+                del self._sessions[session_id]
+                session = None
+            if session is None:
+                session = ChatSession(session_id, self.system_prompt, self.token_budget)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                self.misses += 1
+            else:
+                self._sessions.move_to_end(session_id)
+                self.hits += 1
+            if self.db_path:
+                self._load_rows(session)
+            return session, not session.turns
+
+    def seed(self, session, history):
+        # First request of a session from a client that still sends its local history
+        with self._lock:
+            for role, text in history:
+                self._append(session, role, text)
+
+    def add_exchange(self, session, user_message, bot_response):
+        with self._lock:
+            self._append(session, "user", user_message)
+            self._append(session, "model", bot_response)
+
+    def _append(self, session, role, text):
+        session.append(role, text)
+        if self.db_path:
+            cursor = self._connection().execute(
+                "INSERT INTO chat_turns (session_id, role, text, created_at) VALUES (?, ?, ?, ?)",
+                (session.session_id, role, text, time.time()))
+            session.last_row_id = cursor.lastrowid
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                self._connection().execute("DELETE FROM chat_turns WHERE created_at < ?", (time.time() - self.ttl,))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "hits": self.hits,
+                "misses": self.misses,
+                "token_budget": self.token_budget,
+                "backend": "sqlite" if self.db_path else "memory",
+            }
@@ -0,0 +1,94 @@
+import numpy as np
+
+
+# --- PRECOMPILED FEATURE ENCODER FOR /recommend_crop ---
+# Built once at load time from CROP_FULL_FEATURE_NAMES and the fitted StandardScaler.
+# Encodes a request straight into a float64 row of the model's 25 columns:
+#   - numerical features are scaled with the scaler's mean_/scale_ as one numpy op
+#     (same arithmetic as StandardScaler.transform),
+#   - soil_type / irrigation_type / previous_crop are looked up in dicts that map the
+#     raw value to its one-hot column index.
+# No pandas DataFrame is created per request.
+class CropFeatureEncoder:
+    SOIL_PREFIX = 'soil_type_'
+    IRRIGATION_PREFIX = 'irrigation_type_'
+    PREVIOUS_CROP_PREFIX = 'previous_crop_'
+
+    def __init__(self, feature_names, numerical_features, scaler):
+        self.feature_names = list(feature_names)
+        self.numerical_features = list(numerical_features)
+        self.n_features = len(self.feature_names)
+        self.numerical_index = np.array([self.feature_names.index(f) for f in self.numerical_features])
+
+        n_num = len(self.numerical_features)
+        mean = getattr(scaler, 'mean_', None)
+        scale = getattr(scaler, 'scale_', None)
+        self.mean = np.asarray(mean, dtype=np.float64) if mean is not None and getattr(scaler, 'with_mean', True) else np.zeros(n_num)
+        self.scale = np.asarray(scale, dtype=np.float64) if scale is not None and getattr(scaler, 'with_std', True) else np.ones(n_num)
+
+        self.soil_index = self._prefix_index(self.SOIL_PREFIX)
+        self.irrigation_index = self._prefix_index(self.IRRIGATION_PREFIX)
+        self.previous_crop_index = self._prefix_index(self.PREVIOUS_CROP_PREFIX)
+
+    def _prefix_index(self, prefix):
+        return {name[len(prefix):]: i for i, name in enumerate(self.feature_names) if name.startswith(prefix)}
+
+    def encode(self, data, out=None):
+        """Encode one request dict into a (1, n_features) row.
+
+        Raises KeyError for missing fields and ValueError for bad values, with the
+        same messages the endpoint has always returned.
+        """
+        row = np.zeros((1, self.n_features), dtype=np.float64) if out is None else out
+        self.encode_into(data, row[0])
+        return row
+
+    def encode_rows(self, rows):
+        """Encode many request dicts into one (n_rows, n_features) matrix.
+
+        Returns (matrix, errors) where errors maps row position -> the exception raised for
+        that row; those rows are left as zeros and must not be sent to the model.
+        """
+        matrix = np.zeros((len(rows), self.n_features), dtype=np.float64)
+        errors = {}
+        for i, data in enumerate(rows):
+            try:
+                if not isinstance(data, dict): raise ValueError("Each plot must be a JSON object")
+                self.encode_into(data, matrix[i], warn_unknown=False)
+            except (KeyError, ValueError, TypeError) as e:
+                matrix[i] = 0.0
+                errors[i] = e
+        return matrix, errors
+
+    def encode_into(self, data, row, warn_unknown=True):
+        # row: 1-D view of length n_features, assumed zeroed by the caller
+        values = np.empty(len(self.numerical_features), dtype=np.float64)
+        for i, feature_name in enumerate(self.numerical_features):
+            if feature_name not in data: raise KeyError(f"Missing: {feature_name}")
+            values[i] = float(data[feature_name])
+        # float() also parses "nan"/"inf" (and JSON NaN/Infinity), which the scaler would pass on to the model
+        finite = np.isfinite(values)
+        if not finite.all(): raise ValueError(f"{self.numerical_features[int(np.argmin(finite))]} must be a finite number")
+        row[self.numerical_index] = (values - self.mean) / self.scale
+
+        soil_type = data.get('soil_type') # e.g., 'Black (Vertisol)'
+        if not soil_type: raise KeyError("Missing: soil_type")
+        col = self.soil_index.get(soil_type)
+        if col is None: raise ValueError(f"Unknown/Unsupported soil_type: {soil_type}")
+        row[col] = 1.0
+
+        irrigation_type = data.get('irrigation_type') # e.g., 'Groundwater'
+        if not irrigation_type: raise KeyError("Missing: irrigation_type")
+        col = self.irrigation_index.get(irrigation_type)
+        if col is None: raise ValueError(f"Unknown/Unsupported irrigation_type: {irrigation_type}")
+        row[col] = 1.0
+
+        previous_crop = data.get('previous_crop') # e.g., 'Wheat'
+        if not previous_crop: raise KeyError("Missing: previous_crop")
+        col = self.previous_crop_index.get(previous_crop)
+        if col is not None:
+            row[col] = 1.0
+        elif warn_unknown:
+            # Crops not in the model's feature list are treated as 'Other' (all zeros)
+            print(f"Warning: Received previous_crop '{previous_crop}' not in model features, treating as 'Other'.")
+        return row
@@ -0,0 +1,124 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+import numpy as np
+
+
+# --- MICRO-BATCHING ENGINE FOR DISEASE INFERENCE ---
+# Request threads submit one preprocessed image tensor (shape [1, H, W, 3]) and wait.
+# A background thread collects tensors for up to `max_wait_ms` (or until `max_batch_size`
+# are waiting), stacks them and runs ONE interpreter invoke for the whole batch.
+# With an interpreter pool, `num_workers` threads pull batches so several run in parallel.
+class DiseaseBatcher:
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=5, num_workers=1, name="disease-batcher",
+                 result_timeout=30.0):
+        # run_batch(batch_array) -> predictions array with one row per input row
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.num_workers = max(1, int(num_workers))
+        self.name = name
+        self.result_timeout = result_timeout # Default wait in predict(); None waits forever
+        self._queue = queue.Queue()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._closed = False
+        # Simple counters (useful for tuning the window)
+        self.batches_run = 0
+        self.items_run = 0
+
+    def start(self):
+        with self._start_lock:
+            self._start()
+
+    def _start(self):
+        if self._threads and all(t.is_alive() for t in self._threads):
+            return
+        self._stop_workers()
+        self._closed = False
+        # A fresh queue per generation, so new workers never take the old ones' stop sentinels
+        self._queue = queue.Queue()
+        self._threads = [
+            threading.Thread(target=self._worker, args=(self._queue,), name=f"{self.name}-{i}", daemon=True)
+            for i in range(self.num_workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def _stop_workers(self):
+        # Workers finish everything queued before their sentinel, then exit
+        for _ in self._threads:
+            self._queue.put(None)
+        self._threads = []
+
+    def stop(self):
+        """Stop the workers once queued tensors are served. Later submits raise RuntimeError."""
+        with self._start_lock:
+            self._closed = True
+            self._stop_workers()
+
+    def submit(self, tensor):
+        """Queue one [1, H, W, C] tensor. Returns a Future resolving to its prediction row."""
+        future = Future()
+        with self._start_lock:
+            if self._closed:
+                raise RuntimeError(f"{self.name} is stopped")
+            if not self._threads:
+                self._start()
+            self._queue.put((tensor, future))
+        return future
+
+    def predict(self, tensor, timeout=None):
+        """Blocking helper: submit and wait for this tensor's prediction row.
+        Waits at most `timeout` seconds (default: result_timeout), then raises TimeoutError."""
+        future = self.submit(tensor)
+        try:
+            return future.result(timeout=self.result_timeout if timeout is None else timeout)
+        except TimeoutError:
+            future.cancel() # Dropped from its batch if no worker picked it up yet
+            raise
+
+    def _collect_batch(self, work_queue, first_item):
+        # Returns (batch, stop): stop is True when the sentinel was taken while collecting
+        batch = [first_item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = work_queue.get(timeout=remaining) if remaining > 0 else work_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:  # stop() was called; finish what we have
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _worker(self, work_queue):
+        while True:
+            item = work_queue.get()
+            if item is None:
+                return
+            batch, stop = self._collect_batch(work_queue, item)
+            self._run(batch)
+            if stop:
+                return
+
+    def _run(self, batch):
+        # Skip requests whose caller already gave up
+        batch = [(tensor, future) for tensor, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            batch_array = np.concatenate([tensor for tensor, _ in batch], axis=0)
+            predictions = self.run_batch(batch_array)
+            for i, (_, future) in enumerate(batch):
+                future.set_result(predictions[i])
+            self.batches_run += 1
+            self.items_run += len(batch)
+        except Exception as e:
+            print(f"Error running disease batch of size {len(batch)}: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
@@ -0,0 +1,198 @@
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+
+# Zero-width joiners change how a conjunct is drawn, not what the word is
+_INVISIBLE = dict.fromkeys(map(ord, '\u200b\u200c\u200d\ufeff'))
+# Chandrabindu is often typed as anusvara (हूँ / हूं)
+_VARIANTS = str.maketrans({'\u0901': '\u0902'})
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_question(text):
+    """Canonical form of a chat question: NFC, no punctuation (incl. । and ॥), single spaces."""
+    text = unicodedata.normalize('NFC', str(text)).translate(_INVISIBLE).translate(_VARIANTS).casefold()
+    text = ''.join(' ' if unicodedata.category(ch)[0] in 'PSZ' else ch for ch in text)
+    return _SPACES.sub(' ', text).strip()
+
+
+# Words that change the advice when they differ, however similar the rest of the question is.
+# A near-duplicate hit needs exactly the same set of these (incl. common inflections).
+NEGATIONS = frozenset(normalize_question("""
+    नहीं नही न ना मत बिना मना
+    nahi nahin nhi mat not no dont don doesnt doesn didnt didn never without avoid
+""").split())
+ENTITIES = frozenset(normalize_question("""
+    गेहूं गेंहू गेहु धान चावल मक्का मक्के मकई बाजरा बाजरे ज्वार जौ रागी मडुआ चना चने मटर अरहर तुअर मूंग उड़द
+    मसूर सरसों सरसो राई सोयाबीन मूंगफली तिल सूरजमुखी अलसी कपास गन्ना गन्ने जूट आलू प्याज लहसुन टमाटर
+    मिर्च बैंगन भिंडी गोभी फूलगोभी पत्तागोभी पालक गाजर मूली खीरा लौकी कद्दू तरबूज खरबूजा केला केले आम
+    अमरूद पपीता अंगूर संतरा नींबू चाय कॉफी हल्दी अदरक धनिया जीरा मेथी
+    यूरिया डीएपी पोटाश एनपीके जिंक सल्फर जिप्सम गोबर वर्मीकम्पोस्ट कम्पोस्ट
+    wheat gehu gehun rice paddy dhan chawal maize corn makka bajra jowar millet barley jau ragi gram chana
+    chickpea pea peas matar arhar tur pigeonpea moong urad lentil masoor mustard sarson soybean soyabean
+    groundnut peanut sesame sunflower linseed cotton kapas sugarcane ganna jute potato aloo onion pyaz garlic
+    tomato chilli chili brinjal okra bhindi cabbage cauliflower spinach carrot radish cucumber banana mango
+    guava papaya grapes orange lemon tea coffee turmeric ginger coriander cumin
+    urea dap potash npk zinc sulphur sulfur gypsum compost
+""").split())
+_DIGITS = re.compile(r'\d')
+
+
+def key_tokens(normalized):
+    """Negation, crop/fertilizer and number words of a normalized question."""
+    return frozenset(w for w in normalized.split() if w in NEGATIONS or w in ENTITIES or _DIGITS.search(w))
+
+
+def char_ngrams(text, sizes=(2, 3, 4)):
+    # Character n-grams inside word boundaries (like sklearn's char_wb analyzer)
+    grams = Counter()
+    for word in text.split():
+        padded = f' {word} '
+        for n in sizes:
+            for i in range(max(1, len(padded) - n + 1)):
+                grams[padded[i:i + n]] += 1
+    return grams
+
+
+# --- FAQ ANSWER CACHE ---
+# Answers to first-turn questions, matched by exact normalized text. With a threshold below 1
+# a near-duplicate may also hit: cosine similarity of TF-IDF weighted character n-grams (word
+# order, spelling noise) of at least `threshold`, and only against entries with the same
+# key_tokens, since n-grams alone rate "wheat" vs "paddy" or a negated question as near-equal.
+# The inverted index only scores entries that share an informative n-gram with the question.
+# Entries expire after `ttl` and the least recently used is evicted beyond `max_entries`.
+class FAQCache:
+    TOP_CANDIDATES = 20
+    MIN_SIMILARITY = 0.95 # Lower thresholds hand out answers to different questions
+
+    def __init__(self, max_entries=2000, ttl_seconds=259200, threshold=1.0):
+        self.max_entries = int(max_entries)
+        self.ttl = float(ttl_seconds)
+        self.threshold = float(threshold)
+        if self.threshold < self.MIN_SIMILARITY:
+            print(f"Warning: FAQ cache similarity threshold {self.threshold} raised to {self.MIN_SIMILARITY}.")
+            self.threshold = self.MIN_SIMILARITY
+        self._entries = OrderedDict() # id -> (normalized, answer, grams, created_at, key tokens)
+        self._exact = {}              # normalized -> id
+        self._postings = {}           # gram -> set of ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _idf(self, gram):
+        n = len(self._entries)
+        return math.log((1 + n) / (1 + len(self._postings.get(gram, ())))) + 1.0
+
+    def _weights(self, grams):
+        weights = {g: tf * self._idf(g) for g, tf in grams.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        return weights, norm
+
+    def _remove(self, entry_id):
+        normalized, _, grams, _, _ = self._entries.pop(entry_id)
+        if self._exact.get(normalized) == entry_id:
+            del self._exact[normalized]
+        for gram in grams:
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids: del self._postings[gram]
+
+    def _expire(self, now):
+        while self._entries:
+            entry_id, entry = next(iter(self._entries.items()))
+            if now - entry[3] <= self.ttl: break
+            self._remove(entry_id)
+
+    def get(self, question):
+        """Cached answer for a question, or None. Returns (answer, similarity)."""
+        if not self.enabled: return None, 0.0
+        normalized = normalize_question(question)
+        if not normalized: return None, 0.0
+
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            entry_id = self._exact.get(normalized)
+            if entry_id is not None and now - self._entries[entry_id][3] > self.ttl:
+                self._remove(entry_id)
+                entry_id = None
+            if entry_id is not None:
+                self._entries.move_to_end(entry_id)
+                self.exact_hits += 1
+                return self._entries[entry_id][1], 1.0
+
+            if self.threshold >= 1.0: # Exact matches only
+                self.misses += 1
+                return None, 0.0
+            best_id, best_score = self._most_similar(char_ngrams(normalized), key_tokens(normalized))
+            if best_id is not None and best_score >= self.threshold and now - self._entries[best_id][3] <= self.ttl:
+                self._entries.move_to_end(best_id)
+                self.similar_hits += 1
+                return self._entries[best_id][1], best_score
+            self.misses += 1
+            return None, best_score
+
+    def _most_similar(self, grams, keys):
+        if not self._entries: return None, 0.0
+        query, query_norm = self._weights(grams)
+        # Accumulate dot products through the inverted index, skipping n-grams that occur in
+        # over half the entries (they carry little weight and would touch every entry)
+        common = max(2, len(self._entries) // 2)
+        dots = Counter()
+        for gram, weight in query.items():
+            ids = self._postings.get(gram)
+            if not ids or len(ids) > common: continue
+            for entry_id in ids:
+                if self._entries[entry_id][4] != keys: continue # Other crop, negation or number
+                dots[entry_id] += weight * self._entries[entry_id][2][gram] * self._idf(gram)
+
+        best_id, best_score = None, 0.0
+        for entry_id, _ in dots.most_common(self.TOP_CANDIDATES):
+            # Exact cosine (over all n-grams) for the best few candidates
+            entry_grams = self._entries[entry_id][2]
+            weights, norm = self._weights(entry_grams)
+            dot = sum(w * weights[g] for g, w in query.items() if g in weights)
+            score = dot / (query_norm * norm)
+            if score > best_score:
+                best_id, best_score = entry_id, score
+        return best_id, best_score
+
+    def put(self, question, answer):
+        if not self.enabled: return
+        normalized = normalize_question(question)
+        if not normalized: return
+        grams = char_ngrams(normalized)
+        with self._lock:
+            old_id = self._exact.get(normalized)
+            if old_id is not None:
+                self._remove(old_id)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (normalized, answer, grams, time.time(), key_tokens(normalized))
+            self._exact[normalized] = entry_id
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.similar_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "similar_hits": self.similar_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0,
+                "threshold": self.threshold,
+            }
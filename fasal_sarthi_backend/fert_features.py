@@ -0,0 +1,76 @@
+import numpy as np
+
+
+# --- VECTORIZED FEATURE ENCODER FOR /recommend_fertilizer ---
+# Built once from fert_model_columns (model_columns.joblib). Encodes a whole chunk of rows
+# into one float matrix: numerical columns are filled with one array assignment and the
+# Soil_Type_ / Crop_Type_ one-hot columns with one fancy-index assignment each.
+class FertilizerFeatureEncoder:
+    # Expected numerical features from model_columns.joblib (names as spelled in the dataset)
+    NUM_FEATURES = ['Temparature', 'Humidity', 'Moisture', 'Nitrogen', 'Potassium', 'Phosphorous']
+    SOIL_PREFIX = 'Soil_Type_'
+    CROP_PREFIX = 'Crop_Type_'
+
+    def __init__(self, model_columns):
+        self.columns = list(model_columns)
+        self.n_features = len(self.columns)
+        column_index = {name: i for i, name in enumerate(self.columns)}
+        # Numerical features the model actually has (a missing one in the input stays 0)
+        self.num_features = [f for f in self.NUM_FEATURES if f in column_index]
+        self.num_index = np.array([column_index[f] for f in self.num_features], dtype=np.intp)
+        self.soil_index = {name[len(self.SOIL_PREFIX):]: i for name, i in column_index.items() if name.startswith(self.SOIL_PREFIX)}
+        self.crop_index = {name[len(self.CROP_PREFIX):]: i for name, i in column_index.items() if name.startswith(self.CROP_PREFIX)}
+
+    def _row_columns(self, data):
+        # Returns (numerical values, soil column, crop column) or raises KeyError / ValueError
+        # with the same messages as the single-row endpoint
+        values = [float(data[feat]) if feat in data else 0.0 for feat in self.num_features]
+        finite = np.isfinite(values) # float() also parses "nan"/"inf" (and JSON NaN/Infinity)
+        if not finite.all(): raise ValueError(f"{self.num_features[int(np.argmin(finite))]} must be a finite number")
+
+        soil_type = data.get('Soil_Type')
+        crop_type = data.get('Crop_Type')
+        if not soil_type or not crop_type:
+             raise KeyError("Missing Soil_Type or Crop_Type in input")
+
+        soil_col = self.soil_index.get(soil_type)
+        if soil_col is None: raise ValueError(f"Unknown Soil_Type: {soil_type}")
+        crop_col = self.crop_index.get(crop_type)
+        if crop_col is None: raise ValueError(f"Unknown Crop_Type: {crop_type}")
+        return values, soil_col, crop_col
+
+    def encode(self, data):
+        """Encode one request dict into a (1, n_features) row (raises on bad input)."""
+        values, soil_col, crop_col = self._row_columns(data)
+        row = np.zeros((1, self.n_features), dtype=np.float64)
+        row[0, self.num_index] = values
+        row[0, soil_col] = 1.0
+        row[0, crop_col] = 1.0
+        return row
+
+    def encode_rows(self, rows):
+        """Encode a chunk of rows into (matrix of valid rows, positions of valid rows, errors).
+
+        errors maps the position in `rows` to the exception raised for that row.
+        """
+        numeric, soil_cols, crop_cols, valid, errors = [], [], [], [], {}
+        for i, data in enumerate(rows):
+            try:
+                if isinstance(data, Exception): raise data
+                if not isinstance(data, dict): raise ValueError("Each row must be a JSON object")
+                values, soil_col, crop_col = self._row_columns(data)
+            except (KeyError, ValueError, TypeError) as e:
+                errors[i] = e
+                continue
+            numeric.append(values)
+            soil_cols.append(soil_col)
+            crop_cols.append(crop_col)
+            valid.append(i)
+
+        matrix = np.zeros((len(valid), self.n_features), dtype=np.float64)
+        if valid:
+            positions = np.arange(len(valid))
+            matrix[:, self.num_index] = np.asarray(numeric, dtype=np.float64)
+            matrix[positions, soil_cols] = 1.0
+            matrix[positions, crop_cols] = 1.0
+        return matrix, valid, errors
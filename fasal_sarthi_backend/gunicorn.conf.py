@@ -0,0 +1,48 @@
+# Gunicorn config for Fasal Sarthi backend (used by the Procfile):
+#   gunicorn -c gunicorn.conf.py "app:create_app()"
+#
+# Preload mode (default): the app and all sklearn models are loaded ONCE in the master
+# process and forked into the workers, which share those pages copy-on-write. That lets
+# us run several workers in the RAM one worker used to need.
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+if preload_app:
+    # Read by app.py while it is imported in the master
+    os.environ['FASAL_PRELOAD_MASTER'] = '1'
+    # Memory-map numpy arrays from the joblib files (read-only, shared page cache)
+    os.environ.setdefault('MODEL_MMAP', '1')
+
+
+def when_ready(server):
+    if workers > 1 and not os.getenv('CHAT_SESSION_DB'):
+        # Chat sessions live in each worker's memory: a follow-up reaching another worker gets
+        # 409 session_expired and the frontend resends the conversation
+        server.log.warning(f"{workers} workers without CHAT_SESSION_DB: chat sessions are not shared between workers")
+    if preload_app:
+        # Move everything loaded so far into a permanent GC generation. Otherwise the
+        # collector in each worker writes to the headers of these objects and un-shares
+        # the pages that hold the models.
+        gc.freeze()
+        server.log.info(f"Preloaded app; {gc.get_freeze_count()} objects frozen for copy-on-write sharing")
+
+
+def post_fork(server, worker):
+    # TFLite interpreters start native threads, so they are never created in the master.
+    # With DISEASE_EAGER_LOAD=1 each worker builds and warms its own pool right after fork
+    # (the .tflite file itself is mmapped by TFLite and shared through the page cache).
+    # INFERENCE_PROCESSES > 0: each worker forks its own inference processes here, after the
+    # models are loaded and before the worker starts its request threads.
+    # Each worker also starts its own MODEL_MANIFEST watcher (model hot swaps).
+    if preload_app:
+        import app as backend
+        backend.inference.start()
+        if backend.DISEASE_EAGER_LOAD:
+            backend.load_initial_model(backend.disease_models)
+        backend.model_registry.start_watcher()
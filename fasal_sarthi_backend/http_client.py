@@ -0,0 +1,357 @@
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CircuitOpenError(Exception):
+    """Raised without touching the network while an upstream's circuit breaker is open."""
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is unavailable (circuit open, retry in {retry_after:.0f}s)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+# --- CIRCUIT BREAKER ---
+# closed: calls go through; `failure_threshold` consecutive failures open it.
+# open: calls fail fast with CircuitOpenError for `reset_timeout` seconds.
+# half-open: one trial call is let through; success closes, failure re-opens.
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = float(reset_timeout)
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now):
+        if self.opened_at is None:
+            return 'closed'
+        if now - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(now)
+            if state == 'closed':
+                return
+            if state == 'half-open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return
+            retry_after = max(1, math.ceil(self.reset_timeout - (now - self.opened_at)))
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def abandon_trial(self):
+        # The call ended without a verdict on the upstream (e.g. it was cancelled)
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.trial_in_flight:
+                    self.times_opened += 1
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+
+# --- PER-UPSTREAM LATENCY STATS ---
+class LatencyStats:
+    def __init__(self, window=1000):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.recent = deque(maxlen=window) # Latencies of the last `window` attempts, for percentiles
+        self.observer = None # Optional callable(seconds, error), e.g. a metrics histogram
+        self._lock = threading.Lock()
+
+    def record(self, seconds, error=False):
+        with self._lock:
+            self.count += 1
+            self.errors += int(error)
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self.recent.append(seconds)
+        if self.observer is not None:
+            self.observer(seconds, error)
+
+    def snapshot(self):
+        with self._lock:
+            recent = sorted(self.recent)
+            count, errors, retries = self.count, self.errors, self.retries
+            total, max_seconds = self.total_seconds, self.max_seconds
+
+        def percentile(p):
+            if not recent: return None
+            return round(recent[min(len(recent) - 1, int(p / 100.0 * len(recent)))] * 1000, 2)
+
+        return {
+            "requests": count,
+            "errors": errors,
+            "retries": retries,
+            "avg_ms": round(total / count * 1000, 2) if count else None,
+            "p50_ms": percentile(50),
+            "p95_ms": percentile(95),
+            "p99_ms": percentile(99),
+            "max_ms": round(max_seconds * 1000, 2) if count else None,
+        }
+
+
+# --- POOLED UPSTREAM CLIENT ---
+# One requests.Session per upstream host, so calls reuse keep-alive TCP/TLS connections
+# instead of a fresh handshake each time. Every call has a (connect, read) timeout, so a
+# slow upstream can't pin a worker forever. Connection errors, timeouts and 429/5xx
+# responses are retried with jittered exponential backoff, except that a non-idempotent
+# call (POST) is not retried after a read timeout: it may have been processed, and each
+# retry would hold the worker for another full read timeout. Any failed call, whatever the
+# exception, counts towards the circuit breaker. Sessions are created lazily per process
+# (nothing is shared across fork).
+class UpstreamClient:
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+    def __init__(self, name, connect_timeout=3.05, read_timeout=10.0, retries=2,
+                 backoff_base=0.2, backoff_max=2.0, pool_size=10,
+                 failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.timeout = (float(connect_timeout), float(read_timeout))
+        self.retries = max(0, int(retries))
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        self.pool_size = int(pool_size)
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.latency = LatencyStats()
+        self._session = None
+        self._session_pid = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None or self._session_pid != os.getpid():
+            with self._session_lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+                    self._session_pid = os.getpid()
+        return self._session
+
+    def backoff(self, attempt):
+        # "Full jitter": uniform in [0, min(max, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method, url, timeout=None, retries=None, **kwargs):
+        """Like requests.request, plus timeouts, retries and the circuit breaker.
+
+        Returns the final Response (which may still be an error status); raises
+        CircuitOpenError when failing fast, or the last requests exception.
+        """
+        self.breaker.before_call()
+        timeout = timeout or self.timeout
+        retries = self.retries if retries is None else retries
+        # Every exit records a verdict, or a half-open trial would stay "in flight" forever
+        try:
+            response = self._send(method, url, timeout, retries, kwargs)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.abandon_trial()
+            raise
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def can_retry(self, method, error):
+        if method.upper() in self.IDEMPOTENT_METHODS:
+            return isinstance(error, (requests.ConnectionError, requests.Timeout))
+        return isinstance(error, requests.ConnectionError) # Incl. ConnectTimeout, not ReadTimeout
+
+    def _send(self, method, url, timeout, retries, kwargs):
+        for attempt in range(retries + 1):
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except Exception as e:
+                self.latency.record(time.perf_counter() - start, error=True)
+                if attempt < retries and self.can_retry(method, e):
+                    self._sleep_before_retry(attempt)
+                    continue
+                raise
+            failed = response.status_code in self.RETRY_STATUSES
+            self.latency.record(time.perf_counter() - start, error=failed)
+            if failed and attempt < retries:
+                response.close()
+                self._sleep_before_retry(attempt, response.headers.get('Retry-After'))
+                continue
+            return response
+
+    def _sleep_before_retry(self, attempt, retry_after=None):
+        with self.latency._lock:
+            self.latency.retries += 1
+        delay = self.backoff(attempt)
+        if retry_after and retry_after.isdigit():
+            delay = min(self.backoff_max, max(delay, float(retry_after)))
+        time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        stats = self.latency.snapshot()
+        stats["circuit"] = self.breaker.state
+        stats["circuit_opened"] = self.breaker.times_opened
+        return stats
+
+
+# --- ASYNC CLIENT (ASGI mode, see asgi.py) ---
+# Same timeouts, retry policy, circuit breaker and latency stats as the sync client it wraps
+# (both count towards one upstream), but non-blocking on an httpx.AsyncClient pool.
+# httpx is imported only here, so the WSGI deployment doesn't load it.
+class AsyncUpstreamClient:
+    def __init__(self, sync_client, max_connections=100):
+        self.sync = sync_client
+        self.name = sync_client.name
+        self.max_connections = int(max_connections)
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import httpx
+            connect, read = self.sync.timeout
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(read, connect=connect),
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.sync.pool_size),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def request(self, method, url, stream=False, **kwargs):
+        """Async counterpart of UpstreamClient.request. With stream=True the caller must
+        close the returned response (await response.aclose())."""
+        sync = self.sync
+        sync.breaker.before_call()
+        if 'data' in kwargs:
+            kwargs['content'] = kwargs.pop('data')
+        # Every exit records a verdict (a cancelled call, e.g. client disconnect, only ends the trial)
+        try:
+            response = await self._send(method, url, stream, kwargs)
+        except Exception:
+            sync.breaker.record_failure()
+            raise
+        except BaseException:
+            sync.breaker.abandon_trial()
+            raise
+        if response.status_code >= 500:
+            sync.breaker.record_failure()
+        else:
+            sync.breaker.record_success()
+        return response
+
+    def can_retry(self, method, error):
+        import httpx
+        if method.upper() in self.sync.IDEMPOTENT_METHODS:
+            return isinstance(error, (httpx.TransportError, httpx.TimeoutException))
+        # Only failures before the request was sent (not read timeouts) for POST
+        return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+    async def _send(self, method, url, stream, kwargs):
+        sync = self.sync
+        retries = sync.retries
+        for attempt in range(retries + 1):
+            start = time.perf_counter()
+            try:
+                request = self.client.build_request(method, url, **kwargs)
+                response = await self.client.send(request, stream=stream)
+            except Exception as e:
+                sync.latency.record(time.perf_counter() - start, error=True)
+                if attempt < retries and self.can_retry(method, e):
+                    await self._sleep_before_retry(attempt)
+                    continue
+                raise
+            failed = response.status_code in sync.RETRY_STATUSES
+            sync.latency.record(time.perf_counter() - start, error=failed)
+            if failed and attempt < retries:
+                await response.aclose()
+                await self._sleep_before_retry(attempt, response.headers.get('Retry-After'))
+                continue
+            return response
+
+    async def _sleep_before_retry(self, attempt, retry_after=None):
+        with self.sync.latency._lock:
+            self.sync.latency.retries += 1
+        delay = self.sync.backoff(attempt)
+        if retry_after and retry_after.isdigit():
+            delay = min(self.sync.backoff_max, max(delay, float(retry_after)))
+        await asyncio.sleep(delay)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+
+# --- REGISTRY (one client per upstream name) ---
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(name, **kwargs):
+    """Return the shared client for `name`, creating it with kwargs on first use."""
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = _clients[name] = UpstreamClient(name, **kwargs)
+        return client
+
+_async_clients = {}
+
+def get_async_client(name, **kwargs):
+    """Async client sharing config, breaker and stats with get_client(name)."""
+    with _clients_lock:
+        client = _async_clients.get(name)
+        if client is None:
+            client = _async_clients[name] = AsyncUpstreamClient(_clients[name], **kwargs)
+        return client
+
+def all_stats():
+    with _clients_lock:
+        clients = list(_clients.values())
+    return {client.name: client.stats() for client in clients}
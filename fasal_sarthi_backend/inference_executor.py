@@ -0,0 +1,211 @@
+import math
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+from http_client import LatencyStats
+
+InferenceTiming = namedtuple('InferenceTiming', ['queue_seconds', 'exec_seconds'])
+
+
+class InferenceRejected(Exception):
+    """Raised instead of running a model call when its queue is full (429) or the wait is too long (503)."""
+    def __init__(self, model, status, retry_after, reason):
+        super().__init__(f"{model} model is busy ({reason}), retry in {retry_after}s")
+        self.model = model
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def _timed_call(fn, args):
+    # Runs in the worker process; execution time is measured there so IPC counts as queue time.
+    # Stage timings recorded by fn are returned too (the child's metrics are never scraped).
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start, metrics.drain_buffered()
+
+
+# --- PER-MODEL QUEUE (admission control) ---
+# At most `concurrency` calls of one model run at once and at most `max_depth` more wait for
+# a slot. A call arriving at a full queue is rejected immediately, and a waiting call gives
+# up after `max_wait` seconds, so a burst gets fast 429/503s instead of slowing everyone down.
+class ModelQueue:
+    def __init__(self, name, concurrency, max_depth, max_wait, offload):
+        self.name = name
+        self.concurrency = max(1, int(concurrency))
+        self.max_depth = max(0, int(max_depth))
+        self.max_wait = float(max_wait)
+        self.offload = offload
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.avg_exec = None # Moving average of execution time, for Retry-After
+        self._waiters = deque() # Waiting calls in arrival order (a freed slot goes to the oldest)
+        self.queue_stats = LatencyStats()
+        self.exec_stats = LatencyStats()
+        self._cond = threading.Condition()
+
+    def retry_after(self):
+        # Seconds until the calls ahead of a new one have likely drained
+        per_call = self.avg_exec if self.avg_exec is not None else 1.0
+        return max(1, math.ceil(per_call * (self.waiting + 1) / self.concurrency))
+
+    def acquire(self, max_wait=None):
+        # max_wait: a caller's own, shorter bound on the wait (never longer than the queue's)
+        with self._cond:
+            if self.running < self.concurrency and not self.waiting:
+                self.running += 1
+                return
+            if self.waiting >= self.max_depth:
+                self.rejected += 1
+                raise InferenceRejected(self.name, 429, self.retry_after(), "queue full")
+            self.waiting += 1
+            me = object()
+            self._waiters.append(me)
+            deadline = time.monotonic() + (self.max_wait if max_wait is None else min(max_wait, self.max_wait))
+            try:
+                # FIFO: otherwise a thread that just released its slot can take it straight back
+                while self.running >= self.concurrency or self._waiters[0] is not me:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise InferenceRejected(self.name, 503, self.retry_after(), "queue wait timed out")
+                    self._cond.wait(remaining)
+                self.running += 1
+            finally:
+                self.waiting -= 1
+                self._waiters.remove(me)
+                if self._waiters:
+                    self._cond.notify_all() # The next in line re-checks
+
+    def release(self, queue_seconds, exec_seconds, error=False):
+        with self._cond:
+            self.running -= 1
+            if exec_seconds is not None:
+                self.avg_exec = exec_seconds if self.avg_exec is None else 0.8 * self.avg_exec + 0.2 * exec_seconds
+            self._cond.notify_all()
+        self.queue_stats.record(queue_seconds, error)
+        if exec_seconds is not None:
+            self.exec_stats.record(exec_seconds, error)
+
+    def stats(self):
+        with self._cond:
+            state = {
+                "concurrency": self.concurrency,
+                "max_depth": self.max_depth,
+                "running": self.running,
+                "waiting": self.waiting,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "offload": self.offload,
+            }
+        for key, latency in (("queue_wait", self.queue_stats), ("execution", self.exec_stats)):
+            snapshot = latency.snapshot()
+            snapshot.pop("retries", None)
+            state[key] = snapshot
+        return state
+
+
+# --- INFERENCE EXECUTOR ---
+# Runs model calls behind their ModelQueue. With processes > 0, calls of offloaded models go
+# to a pool of forked worker processes that inherit the already loaded models (no pickling
+# of models, pages shared copy-on-write), so sklearn predict runs outside this process's GIL.
+# Functions sent to the pool must be module-level (pickled by reference).
+# The pool is only forked by start(), at startup while the process is single-threaded: forking
+# later, from a process with request/batcher/TFLite threads, can copy a lock held by one of
+# them into the child and deadlock it. A pool lost at runtime (a worker process died) is not
+# re-forked; that web worker runs the offloaded models in-process from then on.
+class InferenceExecutor:
+    def __init__(self, processes=0, initializer=None):
+        self.processes = max(0, int(processes))
+        self.initializer = initializer
+        self.queues = {}
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+    def add_model(self, name, concurrency, max_depth=32, max_wait=10.0, offload=True):
+        self.queues[name] = ModelQueue(name, concurrency, max_depth, max_wait, offload and self.processes > 0)
+        return self.queues[name]
+
+    def _get_pool(self):
+        # This process's pool, or None (never started here, lost, or inherited across fork)
+        with self._pool_lock:
+            return self._pool if self._pool_pid == os.getpid() else None
+
+    def start(self):
+        """Fork the worker processes now. Only call at startup, while this process is still
+        single-threaded (gunicorn post_fork, or app import without preload)."""
+        if self.processes <= 0: return
+        if threading.active_count() > 1:
+            print(f"Warning: forking inference processes with {threading.active_count()} threads running.")
+        start = time.perf_counter()
+        with self._pool_lock:
+            if self._pool_pid == os.getpid(): return
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context('fork'),
+                initializer=self.initializer,
+            )
+            self._pool_pid = os.getpid()
+            pool = self._pool
+        # ProcessPoolExecutor forks lazily: make it fork all workers now
+        list(pool.map(_timed_call, [time.sleep] * self.processes, [(0,)] * self.processes))
+        print(f"Inference process pool started ({self.processes} processes) in {time.perf_counter() - start:.2f}s")
+
+    def _discard_pool(self, pool):
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None # _pool_pid stays: start() won't fork again in this process
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, model, fn, *args, max_wait=None):
+        """Run fn(*args) for `model`. Returns (result, InferenceTiming); raises InferenceRejected.
+        max_wait caps the queue wait below the queue's own limit for this call."""
+        queue = self.queues[model]
+        queued_at = time.perf_counter()
+        queue.acquire(max_wait)
+        exec_seconds = None
+        error = True
+        try:
+            pool = self._get_pool() if queue.offload else None
+            if pool is not None:
+                try:
+                    result, exec_seconds, stages = pool.submit(_timed_call, fn, args).result()
+                    metrics.replay(stages)
+                except BrokenProcessPool:
+                    # A worker died (e.g. OOM-killed). Not re-forked from this multi-threaded
+                    # process: later calls run in-process
+                    print(f"Inference process pool broke while running {model}; running inference in-process from now on.")
+                    self._discard_pool(pool)
+                    raise InferenceRejected(model, 503, queue.retry_after(), "worker process died")
+            else:
+                started = time.perf_counter()
+                result = fn(*args)
+                exec_seconds = time.perf_counter() - started
+            error = False
+        finally:
+            total = time.perf_counter() - queued_at
+            queue_seconds = total - (exec_seconds or 0.0)
+            queue.release(queue_seconds, exec_seconds, error)
+        return result, InferenceTiming(queue_seconds, exec_seconds)
+
+    def stats(self):
+        pool_lost = self.processes > 0 and self._pool_pid == os.getpid() and self._pool is None
+        return {
+            "mode": "process" if self.processes and not pool_lost else "thread",
+            "processes": self.processes,
+            "pool_lost": pool_lost,
+            "models": {name: queue.stats() for name, queue in self.queues.items()},
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,100 @@
+import os
+import queue
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def load_interpreter_class():
+    # Prefer the small tflite_runtime (or its successor ai_edge_litert) wheel; only fall back to
+    # full TensorFlow, imported here on first use, so workers that never scan a leaf don't pay for it
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+# --- MODEL VARIANTS ---
+# Quantized builds of a model made by quantize_model.py sit next to it as <name>_<variant>.tflite
+VARIANTS = ('float', 'dynamic', 'float16', 'int8')
+
+
+def variant_path(model_path, variant):
+    if variant == 'float':
+        return model_path
+    root, ext = os.path.splitext(model_path)
+    return f"{root}_{variant}{ext}"
+
+
+def dequantize(values, detail):
+    # Integer (quantized) output tensor -> float32: (q - zero_point) * scale
+    if not np.issubdtype(values.dtype, np.integer):
+        return values
+    scale, zero_point = detail.get('quantization', (0.0, 0))
+    if not scale:
+        return values.astype(np.float32)
+    return (values.astype(np.float32) - zero_point) * np.float32(scale)
+
+
+# --- TFLITE INTERPRETER POOL ---
+# Holds N independent interpreters for the same model. A request (or batch) checks one out,
+# uses it exclusively and returns it, so N inferences can run in parallel on a multi-core box.
+# Each interpreter gets its own intra-op thread count (num_threads).
+class InterpreterPool:
+    def __init__(self, interpreter_class, model_path, size=1, num_threads=1, warmup=False):
+        self.model_path = model_path
+        self.size = max(1, int(size))
+        self.num_threads = max(1, int(num_threads))
+        self._available = queue.Queue()
+        self.interpreters = []
+        self.load_seconds = 0.0
+        self.batch_resize_supported = True # Set to False by the caller if the model refuses a dynamic batch dim
+
+        start = time.perf_counter()
+        for _ in range(self.size):
+            interpreter = interpreter_class(model_path=model_path, num_threads=self.num_threads)
+            interpreter.allocate_tensors() # IMPORTANT: Allocate memory
+            self.interpreters.append(interpreter)
+            self._available.put(interpreter)
+        self.load_seconds = time.perf_counter() - start
+
+        if warmup:
+            self.warmup()
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        try:
+            interpreter = self._available.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("No free TFLite interpreter in pool")
+        try:
+            yield interpreter
+        finally:
+            self._available.put(interpreter)
+
+    def input_details(self):
+        # Static details (dtype, quantization, H/W) are identical for every interpreter in the pool
+        return self.interpreters[0].get_input_details()
+
+    def output_details(self):
+        return self.interpreters[0].get_output_details()
+
+    def warmup(self):
+        # Run a dummy tensor through every interpreter so the first real request
+        # doesn't pay for lazy kernel / XNNPACK delegate initialisation
+        start = time.perf_counter()
+        for interpreter in self.interpreters:
+            input_detail = interpreter.get_input_details()[0]
+            dummy = np.zeros(input_detail['shape'], dtype=input_detail['dtype'])
+            interpreter.set_tensor(input_detail['index'], dummy)
+            interpreter.invoke()
+        print(f"Warmed up {self.size} TFLite interpreter(s) in {time.perf_counter() - start:.2f}s")
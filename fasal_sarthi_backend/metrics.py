@@ -0,0 +1,208 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# Prometheus text exposition (format 0.0.4) without the prometheus_client dependency.
+# Metrics live in each process: under gunicorn every worker keeps its own, so a scrape
+# through the load balancer sees one worker at a time (aggregate with sum() in queries).
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels: return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'): return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# --- METRIC TYPES ---
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {} # label values tuple -> value
+        self._lock = threading.Lock()
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for labelvalues, value in items:
+            yield self.name, tuple(zip(self.labelnames, labelvalues)), value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(labelvalues, (list(counts), total, count)) for labelvalues, (counts, total, count) in self._values.items()]
+        for labelvalues, (counts, total, count) in items:
+            labels = tuple(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield self.name + '_bucket', labels + (('le', _format_value(float(bound))),), cumulative
+            yield self.name + '_sum', labels, total
+            yield self.name + '_count', labels, count
+
+
+# --- REGISTRY ---
+# Metrics own their values; collectors are callables run at scrape time that read existing
+# stats (caches, queues, circuit breakers) and return [(name, kind, help, [(labels, value)])].
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        families = [(m.name, m.kind, m.documentation, m.samples()) for m in self.metrics]
+        for collector in self.collectors:
+            try:
+                for name, kind, documentation, samples in collector():
+                    families.append((name, kind, documentation,
+                                     ((name, tuple(sorted(labels.items())), value) for labels, value in samples)))
+            except Exception as e:
+                print(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+http_requests = registry.register(Counter(
+    'fasal_http_requests_total', 'HTTP requests by route, method and status.', ('route', 'method', 'status')))
+http_latency = registry.register(Histogram(
+    'fasal_http_request_duration_seconds', 'Time to produce the response (headers for streamed responses).', ('route', 'method')))
+stage_latency = registry.register(Histogram(
+    'fasal_stage_duration_seconds', 'Time spent in one processing stage of a request.', ('component', 'stage'), STAGE_BUCKETS))
+model_load = registry.register(Gauge(
+    'fasal_model_load_seconds', 'Seconds it took this process to load a model.', ('model',)))
+
+
+# --- TIMING ON/OFF ---
+# METRICS_TIMING=0 turns every timer into a shared no-op context (no clock reads); request
+# counters and scrape-time stats keep working.
+_timing = os.getenv('METRICS_TIMING', '1') == '1'
+_NO_TIMER = nullcontext()
+
+def timing_enabled():
+    return _timing
+
+def set_timing(enabled):
+    global _timing
+    _timing = bool(enabled)
+
+
+class _StageTimer:
+    __slots__ = ('component', 'stage', 'start')
+
+    def __init__(self, component, stage):
+        self.component = component
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe_stage(self.component, self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def stage(component, name):
+    """Context manager timing one stage, e.g. `with stage('crop', 'predict'):`."""
+    return _StageTimer(component, name) if _timing else _NO_TIMER
+
+
+# Inside a forked inference process observations are buffered and sent back to the parent
+# with the result (see inference_executor.py), since the child's registry is never scraped
+_buffered = None
+
+def buffer_stages():
+    global _buffered
+    _buffered = []
+
+def drain_buffered():
+    global _buffered
+    if _buffered is None: return None
+    samples, _buffered = _buffered, []
+    return samples
+
+def replay(samples):
+    for component, name, seconds in samples or ():
+        observe_stage(component, name, seconds)
+
+def observe_stage(component, name, seconds):
+    if not _timing: return
+    if _buffered is not None:
+        _buffered.append((component, name, seconds))
+        return
+    stage_latency.observe(seconds, component, name)
+
+def stage_observer(component, name):
+    # For code that already measures itself (LatencyStats.observer)
+    return lambda seconds, error=False: observe_stage(component, name, seconds)
+
+def observe_request(route, method, status, seconds=None):
+    http_requests.inc(route, method, str(status))
+    if seconds is not None:
+        http_latency.observe(seconds, route, method)
+
+def render():
+    return registry.render()
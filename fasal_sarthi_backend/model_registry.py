@@ -0,0 +1,297 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from prediction_cache import model_fingerprint
+
+
+def files_fingerprint(paths):
+    """Fingerprint of a model's files; for a single file it equals prediction_cache.model_fingerprint."""
+    fingerprints = [model_fingerprint(path) for _, path in sorted(paths.items())]
+    if len(fingerprints) == 1:
+        return fingerprints[0]
+    return hashlib.sha256(':'.join(fingerprints).encode('utf-8')).hexdigest()[:16]
+
+
+# --- ONE LOADED VERSION ---
+class ModelVersion:
+    def __init__(self, name, version, paths, model, fingerprint, load_seconds, warmup_seconds):
+        self.name = name
+        self.version = version
+        self.paths = dict(paths)
+        self.model = model # Whatever the slot's loader returned (namedtuple of model + encoders)
+        self.fingerprint = fingerprint
+        self.load_seconds = load_seconds
+        self.warmup_seconds = warmup_seconds
+        self.loaded_at = time.time()
+        self.refs = 0 # Requests currently pinned to this version
+        self.retired = False
+
+    def info(self):
+        return {
+            "version": self.version,
+            "fingerprint": self.fingerprint,
+            "paths": self.paths,
+            "loaded_at": self.loaded_at,
+            "load_seconds": round(self.load_seconds, 3),
+            "warmup_seconds": round(self.warmup_seconds, 3),
+            "in_flight": self.refs,
+        }
+
+
+# --- MODEL SLOT (one per model: disease, crop, fertilizer) ---
+# A new version is loaded and warmed up next to the current one, then swapped in under a lock.
+# Requests pin the version they started with (acquire/release), so in-flight requests finish on
+# the old version; it is closed (e.g. its batcher threads stopped) once the last one releases it.
+# A failed load or warm-up leaves the current version serving.
+class ModelSlot:
+    def __init__(self, name, paths, loader, warmup=None, close=None, lazy=False):
+        # loader(paths) -> model; warmup(model) runs sample inputs and raises if the output is wrong
+        self.name = name
+        self.paths = dict(paths)
+        self.loader = loader
+        self.warmup = warmup
+        self.close = close
+        self.lazy = lazy
+        self.configured_version = None # Version label for the first load (from the manifest)
+        self.current = None
+        self.error = None # Last load/warm-up error
+        self.loading = None # Version being loaded in the background
+        self.retired = [] # Swapped-out versions still pinned by requests
+        self.history = deque(maxlen=10)
+        self.listeners = [] # Called with the new ModelVersion after every swap
+        self.follow_versions = False # Set in forked inference processes (see get)
+        self.keep_retired = 0 # Idle retired versions kept loaded (1 in forked inference processes)
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock() # One load at a time per slot
+        self._first_load_lock = threading.Lock() # So two first requests don't both load a lazy slot
+
+    # --- loading ---
+    def load(self, paths=None, version=None, warm=True):
+        """Load, warm up and swap in a version (blocking). Returns it; raises if it failed."""
+        if paths is None:
+            paths, version = self.paths, version or self.configured_version
+        paths = dict(paths)
+        with self._load_lock:
+            fingerprint = files_fingerprint(paths)
+            version = version or fingerprint[:8]
+            print(f"Loading {self.name} model version {version} ...")
+            try:
+                start = time.perf_counter()
+                model = self.loader(paths)
+                load_seconds = time.perf_counter() - start
+                start = time.perf_counter()
+                if warm and self.warmup is not None:
+                    self.warmup(model)
+                warmup_seconds = time.perf_counter() - start
+            except Exception as e:
+                self.error = f"{version}: {e}"
+                self.history.appendleft({"version": version, "event": "failed", "error": str(e), "at": time.time()})
+                print(f"Loading {self.name} model version {version} failed: {e}")
+                raise
+            loaded = ModelVersion(self.name, version, paths, model, fingerprint, load_seconds, warmup_seconds)
+            self._swap(loaded)
+            print(f"{self.name} model version {version} live (load {load_seconds:.2f}s, warm-up {warmup_seconds:.2f}s).")
+            return loaded
+
+    def _swap(self, loaded):
+        with self._lock:
+            old = self.current
+            self.current = loaded
+            self.paths = loaded.paths
+            self.configured_version = None
+            self.error = None
+            if old is not None:
+                old.retired = True
+                self.retired.append(old)
+        self.history.appendleft({"version": loaded.version, "event": "swapped in", "at": loaded.loaded_at})
+        for listener in self.listeners:
+            listener(loaded)
+        if old is not None:
+            self._close_idle()
+
+    def reload_async(self, paths=None, version=None):
+        """Start a background load; returns False if one is already running for this slot."""
+        with self._lock:
+            if self.loading is not None:
+                return False
+            self.loading = version or 'pending'
+
+        def run():
+            try:
+                self.load(paths, version)
+            except Exception:
+                pass # Recorded in self.error / history
+            finally:
+                self.loading = None
+
+        threading.Thread(target=run, name=f"{self.name}-model-reload", daemon=True).start()
+        return True
+
+    def reset_after_fork(self, drop_models=False):
+        # Forked inference process: locks may have been held by threads that did not survive the
+        # fork, and models owning native threads (TFLite) are dropped and rebuilt lazily
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._first_load_lock = threading.Lock()
+        self.loading = None
+        # Swaps in the parent don't reach this process: load the versions calls ask for instead.
+        # Nothing pins versions here, so keep the previous one loaded while the parent still sends
+        # calls pinned to it (alternating old/new calls would otherwise reload from disk each time)
+        self.follow_versions = True
+        self.keep_retired = 1
+        if drop_models:
+            self.current = None
+            self.retired = []
+            self.error = None
+
+    # --- use ---
+    def get(self, version=None, paths=None):
+        """The current version (loading it first for lazy slots), or a pinned older `version`.
+
+        In a forked inference process a `version` it doesn't have (swapped in by the parent after
+        the fork) is loaded from `paths`, the files the parent loaded it from.
+        """
+        current = self.current
+        if version is not None and (current is None or current.version != version):
+            with self._lock:
+                for old in self.retired:
+                    if old.version == version:
+                        return old
+            if self.follow_versions and paths is not None:
+                with self._first_load_lock:
+                    if self.current is None or self.current.version != version:
+                        self.load(paths, version, warm=False) # Raises if it fails: never a stale answer
+                return self.current
+        if current is None and self.lazy and self.error is None:
+            with self._first_load_lock:
+                if self.current is None and self.error is None:
+                    try:
+                        self.load(warm=False) # The first request warms it, as before the registry
+                    except Exception:
+                        return None
+            current = self.current
+        return current
+
+    def acquire(self):
+        """Pin the current version for one request; pair with release()."""
+        if self.get() is None:
+            return None
+        with self._lock:
+            loaded = self.current # Re-read: a swap may have happened since get()
+            loaded.refs += 1
+        return loaded
+
+    def release(self, loaded):
+        with self._lock:
+            loaded.refs -= 1
+        if loaded.retired:
+            self._close_idle()
+
+    def _close_idle(self):
+        with self._lock:
+            idle = [old for old in self.retired if old.refs <= 0]
+            if self.keep_retired:
+                idle = idle[:-self.keep_retired] # The most recently retired stay loaded
+            self.retired = [old for old in self.retired if old not in idle]
+        for old in idle:
+            if self.close is not None:
+                try:
+                    self.close(old.model)
+                except Exception as e:
+                    print(f"Closing {self.name} model version {old.version} failed: {e}")
+            print(f"{self.name} model version {old.version} retired.")
+
+    def status(self):
+        with self._lock:
+            return {
+                "current": self.current.info() if self.current else None,
+                "configured_paths": self.paths,
+                "loading": self.loading,
+                "lazy": self.lazy,
+                "error": self.error,
+                "retired_in_flight": [old.info() for old in self.retired],
+                "history": list(self.history),
+            }
+
+
+# --- REGISTRY ---
+# MODEL_MANIFEST: optional JSON file naming the version and files of each model, e.g.
+#   {"crop": {"version": "2025-06", "paths": {"model": "models/crop_v2.joblib", ...}}}
+# Every worker polls it and hot-swaps a model whose entry changed, so one file write rolls a
+# retrained model out to all gunicorn workers (the admin reload endpoint only reaches one).
+class ModelRegistry:
+    def __init__(self, manifest_path=None, watch_interval=10.0):
+        self.slots = {}
+        self.manifest_path = manifest_path
+        self.watch_interval = float(watch_interval)
+        self._manifest_mtime = None
+        self._applied = {} # model -> manifest entry last applied
+        self._watcher_pid = None
+
+    def register(self, slot):
+        self.slots[slot.name] = slot
+        return slot
+
+    def read_manifest(self):
+        with open(self.manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if not isinstance(manifest, dict):
+            raise ValueError("model manifest must be a JSON object")
+        return manifest
+
+    def apply_manifest(self, manifest, load=True):
+        """Reload (in the background) every model whose manifest entry changed since last time.
+        With load=False, or for a lazy model not loaded yet, only the paths/version are set."""
+        changed = []
+        for name, entry in manifest.items():
+            slot = self.slots.get(name)
+            if slot is None or not isinstance(entry, dict) or entry == self._applied.get(name):
+                continue
+            paths = {**slot.paths, **entry.get('paths', {})}
+            self._applied[name] = entry
+            if load and slot.current is not None:
+                slot.reload_async(paths, entry.get('version'))
+            else:
+                slot.paths = paths
+                slot.configured_version = entry.get('version')
+            changed.append(name)
+        return changed
+
+    def check_manifest(self, load=True):
+        if not self.manifest_path:
+            return []
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except OSError:
+            return []
+        if mtime == self._manifest_mtime:
+            return []
+        self._manifest_mtime = mtime
+        try:
+            return self.apply_manifest(self.read_manifest(), load)
+        except (OSError, ValueError) as e:
+            print(f"Could not apply model manifest {self.manifest_path}: {e}")
+            return []
+
+    def start_watcher(self):
+        """Poll the manifest from a daemon thread (once per process; call after fork)."""
+        if not self.manifest_path or self.watch_interval <= 0 or self._watcher_pid == os.getpid():
+            return
+        self._watcher_pid = os.getpid()
+
+        def watch():
+            while True:
+                time.sleep(self.watch_interval)
+                self.check_manifest()
+
+        threading.Thread(target=watch, name='model-manifest-watcher', daemon=True).start()
+
+    def status(self):
+        return {
+            "manifest": self.manifest_path,
+            "models": {name: slot.status() for name, slot in self.slots.items()},
+        }
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+
+def content_hash(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def average_hash(img, hash_size=8):
+    # Perceptual (average) hash of the image: same photo re-encoded / re-compressed by a
+    # messaging app usually keeps the same 64-bit hash even though the bytes differ
+    small = img.convert('L').resize((hash_size, hash_size), Image.BOX)
+    pixels = np.asarray(small, dtype=np.float32)
+    bits = (pixels > pixels.mean()).flatten()
+    value = int(''.join('1' if b else '0' for b in bits), 2)
+    return f"phash-{value:0{hash_size * hash_size // 4}x}"
+
+
+def model_fingerprint(model_path):
+    # Changes whenever the model file is swapped (path, size or modification time)
+    try:
+        stat = os.stat(model_path)
+        raw = f"{os.path.abspath(model_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    except OSError:
+        raw = os.path.abspath(model_path)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+
+# --- RESULT CACHE FOR DISEASE PREDICTIONS ---
+# In-memory LRU with a TTL, optionally backed by a directory on disk that every gunicorn
+# worker on the box can read/write. Entries are namespaced by the model fingerprint, so
+# changing TFLITE_MODEL_PATH (or the file behind it) never serves stale predictions.
+class PredictionCache:
+    def __init__(self, max_entries=1024, ttl_seconds=3600, disk_dir=None, disk_max_entries=10000):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl = float(ttl_seconds)
+        self.disk_dir = disk_dir
+        self.disk_max_entries = int(disk_max_entries)
+        self.fingerprint = None
+        self._entries = OrderedDict() # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._puts_since_prune = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def set_model_fingerprint(self, fingerprint):
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                if self.fingerprint is not None:
+                    print(f"Disease model changed ({self.fingerprint} -> {fingerprint}), clearing prediction cache.")
+                self._entries.clear()
+                self.fingerprint = fingerprint
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, self.fingerprint or 'default', key[-2:], f"{key}.json")
+
+    def get(self, key):
+        if not self.enabled or key is None:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key] # Expired
+
+        value = self._disk_get(key, now)
+        with self._lock:
+            if value is not None:
+                self.disk_hits += 1
+                self._store(key, value, now)
+            else:
+                self.misses += 1
+        return value
+
+    def put(self, key, value, fingerprint=None):
+        # fingerprint: model that produced value; dropped if the model was swapped meanwhile
+        if not self.enabled or key is None:
+            return
+        if fingerprint is not None and fingerprint != self.fingerprint:
+            return
+        now = time.time()
+        with self._lock:
+            self._store(key, value, now)
+        self._disk_put(key, value, now)
+
+    def _store(self, key, value, stored_at):
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if now - record.get('stored_at', 0) > self.ttl:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return record.get('value')
+
+    def _disk_put(self, key, value, now):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file then rename, so other workers never read half a file
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'stored_at': now, 'value': value}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Could not write prediction cache entry to disk: {e}")
+            return
+
+        self._puts_since_prune += 1
+        if self._puts_since_prune >= 100:
+            self._puts_since_prune = 0
+            self._prune_disk()
+
+    def _prune_disk(self):
+        # Keep the on-disk cache bounded: drop the oldest files (and other model versions)
+        root = self.disk_dir
+        current = os.path.join(root, self.fingerprint or 'default')
+        files = []
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if not dirpath.startswith(current):
+                    files.append((0, path)) # Old model version, always prune
+                    continue
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+        files.sort()
+        stale = [p for mtime, p in files if mtime == 0]
+        current_files = [f for f in files if f[0] != 0]
+        excess = len(current_files) - self.disk_max_entries
+        if excess > 0:
+            stale.extend(p for _, p in current_files[:excess])
+        for path in stale:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,77 @@
+import io
+import threading
+
+import numpy as np
+from PIL import Image
+
+from metrics import stage
+
+
+# --- SINGLE-PASS IMAGE PREPROCESSING FOR THE DISEASE MODEL ---
+# Phone photos are 3-12 MP. Instead of decode -> convert -> resize -> img_to_array ->
+# expand_dims -> astype -> /255 (several full-size float copies), we:
+#   1. ask the JPEG decoder for a downscaled image (PIL draft mode, DCT scaling),
+#   2. resize straight to the model's H x W,
+#   3. copy the uint8 pixels into a reusable [1, H, W, 3] buffer of the model's dtype
+#      and normalise it in place.
+class ImagePreprocessor:
+    def __init__(self, input_detail):
+        input_shape = input_detail['shape'] # e.g., [1, 300, 300, 3]
+        self.target_height = int(input_shape[1])
+        self.target_width = int(input_shape[2])
+        self.dtype = np.dtype(input_detail['dtype']) # e.g., np.float32 or np.uint8
+        input_scale, input_zero_point = input_detail.get('quantization', (1.0, 0)) # Default for float models
+        # Same rule as the original handler: only a float32 model with (1.0, 0) is scaled to 0-1,
+        # uint8 (quantized) models take raw 0-255 pixels
+        self.normalize = self.dtype == np.float32 and input_scale == 1.0 and input_zero_point == 0
+        # Quantized (int8/uint8) inputs: the float model sees raw 0-255 pixels (TFLite reports
+        # (0.0, 0) for float inputs), so each pixel value maps to round(p / scale + zero_point).
+        # Precomputed for all 256 values; for uint8 with (1.0, 0) that is the raw pixel, as before.
+        self.lut = None
+        if np.issubdtype(self.dtype, np.integer) and input_scale:
+            info = np.iinfo(self.dtype)
+            levels = np.round(np.arange(256) / input_scale + input_zero_point)
+            self.lut = np.clip(levels, info.min, info.max).astype(self.dtype)
+        self._local = threading.local()
+
+    def _buffer(self):
+        # One buffer per thread: request threads never share it. Anything that keeps the tensor
+        # past the call (the micro-batcher queue, the bulk decode pool) gets a copy
+        buf = getattr(self._local, 'buf', None)
+        if buf is None:
+            buf = np.empty((1, self.target_height, self.target_width, 3), dtype=self.dtype)
+            self._local.buf = buf
+        return buf
+
+    def load_image(self, image_bytes):
+        with stage('disease', 'decode'):
+            img = Image.open(io.BytesIO(image_bytes))
+            # JPEG only: decode at the smallest 1/2, 1/4 or 1/8 scale still >= target size
+            img.draft('RGB', (self.target_width, self.target_height))
+            img.load()
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+        with stage('disease', 'resize'):
+            if img.size != (self.target_width, self.target_height):
+                img = img.resize((self.target_width, self.target_height))
+        return img
+
+    def preprocess(self, image_bytes):
+        """Return a [1, H, W, 3] tensor ready for set_tensor.
+
+        The array is this thread's reusable buffer; it is overwritten by the next call on
+        the same thread, so copy it if it has to outlive the current request.
+        """
+        return self.preprocess_image(self.load_image(image_bytes))
+
+    def preprocess_image(self, img):
+        # Same as preprocess(), for an image already returned by load_image()
+        with stage('disease', 'normalize'):
+            buf = self._buffer()
+            if self.lut is not None:
+                np.take(self.lut, np.asarray(img), out=buf[0])
+                return buf
+            np.copyto(buf[0], np.asarray(img), casting='unsafe')
+            if self.normalize:
+                buf /= np.float32(255.0)
+        return buf
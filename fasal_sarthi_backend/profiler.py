@@ -0,0 +1,240 @@
+import cProfile
+import hmac
+import io
+import itertools
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+# Opt-in profiling of live requests. A request is profiled when it carries
+# `X-Fasal-Profile: <PROFILE_SECRET>` (header only, so the secret stays out of access logs) or is picked by
+# PROFILE_SAMPLE_RATE. Finished profiles go into a ring buffer of the last PROFILE_BUFFER_SIZE
+# and are read back from the /admin/profiles endpoints (same secret). Without PROFILE_SECRET
+# nothing is registered, so requests pay nothing at all.
+#
+# Two modes:
+# - "cprofile": deterministic, every Python call in the request thread (pstats output).
+#   Slows the profiled request down noticeably; exact call counts.
+# - "sample": a background thread snapshots the request thread's stack every
+#   PROFILE_INTERVAL_MS (collapsed stacks for flamegraph.pl / speedscope). Low overhead and
+#   sees time in C code (PIL resize, TFLite invoke) attributed to the calling Python line.
+HEADER = 'X-Fasal-Profile'
+MODES = ('cprofile', 'sample')
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _collapse(frame, max_depth=128):
+    # Root-first "a;b;c" as used by collapsed-stack / flamegraph tools
+    names = []
+    while frame is not None and len(names) < max_depth:
+        names.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+# --- STACK SAMPLER ---
+# One daemon thread per process samples every thread that currently has a profile open, so
+# concurrent profiled requests share it. It only runs while at least one profile is open.
+class StackSampler:
+    def __init__(self, interval):
+        self.interval = interval
+        self._targets = {} # thread id -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread = None
+        self._pid = None
+
+    def _ensure_thread(self):
+        # Started lazily and again after a fork (threads do not survive it)
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+            self._thread.start()
+
+    def add(self, thread_id):
+        with self._lock:
+            self._targets[thread_id] = Counter()
+            self._ensure_thread()
+            self._wakeup.notify()
+
+    def remove(self, thread_id):
+        with self._lock:
+            return self._targets.pop(thread_id, Counter())
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                while not self._targets:
+                    self._wakeup.wait()
+                thread_ids = list(self._targets)
+            frames = sys._current_frames()
+            stacks = {tid: _collapse(frames[tid]) for tid in thread_ids if tid != me and tid in frames}
+            del frames
+            with self._lock:
+                for tid, stack in stacks.items():
+                    counts = self._targets.get(tid)
+                    if counts is not None:
+                        counts[stack] += 1
+            time.sleep(self.interval)
+
+
+# --- ONE REQUEST'S PROFILE ---
+class ActiveProfile:
+    __slots__ = ('profiler', 'id', 'mode', 'route', 'method', 'reason', 'started_at', 'start', 'thread_id', '_cprofile')
+
+    def __init__(self, profiler, profile_id, mode, route, method, reason):
+        self.profiler = profiler
+        self.id = profile_id
+        self.mode = mode
+        self.route = route
+        self.method = method
+        self.reason = reason
+        self.started_at = time.time()
+        self.thread_id = threading.get_ident()
+        self._cprofile = None
+        if mode == 'cprofile':
+            try:
+                self._cprofile = cProfile.Profile()
+                self._cprofile.enable()
+            except Exception:
+                profiler._cprofile_lock.release()
+                raise
+        else:
+            profiler.sampler.add(self.thread_id)
+        self.start = time.perf_counter()
+
+    def stop(self, status):
+        """Stop profiling and store the result in the ring buffer (under self.id)."""
+        duration = time.perf_counter() - self.start
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self.profiler._cprofile_lock.release()
+            self._cprofile.create_stats()
+            data = self._cprofile.stats
+        else:
+            data = dict(self.profiler.sampler.remove(self.thread_id))
+        self.profiler._store({
+            "id": self.id,
+            "route": self.route,
+            "method": self.method,
+            "status": status,
+            "mode": self.mode,
+            "reason": self.reason,
+            "started_at": self.started_at,
+            "duration_ms": round(duration * 1000, 2),
+        }, data)
+
+
+class RequestProfiler:
+    def __init__(self, secret=None, sample_rate=0.0, mode='sample', buffer_size=20, interval=0.005):
+        self.secret = secret or None
+        self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+        self.mode = mode if mode in MODES else 'sample'
+        self.sampler = StackSampler(interval)
+        self.profiles = deque(maxlen=max(1, int(buffer_size)))
+        self.started = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # Python 3.12+ allows only one active cProfile per process; a second concurrent
+        # request falls back to the sampler instead of failing
+        self._cprofile_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.secret is not None
+
+    def authorized(self, headers):
+        if not self.enabled: return False
+        # Constant-time compare, so response timing doesn't leak how much of the secret matched
+        return hmac.compare_digest(headers.get(HEADER, '').encode(), self.secret.encode())
+
+    def should_profile(self, headers):
+        """Why this request should be profiled ('requested' / 'sampled'), or None."""
+        if self.authorized(headers):
+            return 'requested'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sampled'
+        return None
+
+    def start(self, route, method, reason, mode=None):
+        mode = mode if mode in MODES else self.mode
+        if mode == 'cprofile' and not self._cprofile_lock.acquire(blocking=False):
+            mode = 'sample'
+        with self._lock:
+            self.started += 1
+            profile_id = next(self._ids)
+        return ActiveProfile(self, profile_id, mode, route, method, reason)
+
+    def _store(self, summary, data):
+        with self._lock:
+            self.profiles.append((summary, data))
+
+    def get(self, profile_id):
+        with self._lock:
+            for summary, data in self.profiles:
+                if summary["id"] == profile_id:
+                    return summary, data
+        return None, None
+
+    def summaries(self):
+        with self._lock:
+            return [dict(summary) for summary, _ in reversed(self.profiles)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "mode": self.mode,
+                "sample_rate": self.sample_rate,
+                "started": self.started,
+                "stored": len(self.profiles),
+                "buffer_size": self.profiles.maxlen,
+            }
+
+
+# --- OUTPUT FORMATS ---
+def as_collapsed(mode, data):
+    """Collapsed stacks ("a;b;c count" per line). cProfile data only has caller->callee edges,
+    so for it each line is one edge weighted by its own time in microseconds."""
+    if mode == 'sample':
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(data.items(), key=lambda kv: -kv[1]))
+    lines = []
+    for (filename, lineno, name), (_, _, _, _, callers) in data.items():
+        callee = f"{name} ({os.path.basename(filename)}:{lineno})"
+        for (c_file, c_line, c_name), (_, _, tottime, _) in callers.items():
+            weight = int(tottime * 1e6)
+            if weight:
+                lines.append((f"{c_name} ({os.path.basename(c_file)}:{c_line});{callee}", weight))
+    return ''.join(f"{stack} {weight}\n" for stack, weight in sorted(lines, key=lambda kv: -kv[1]))
+
+
+def as_pstats(data):
+    # Same bytes pstats.Stats.dump_stats() writes: load with pstats.Stats(path) or snakeviz
+    return marshal.dumps(data)
+
+
+def as_text(mode, data, limit=40, sort='cumulative'):
+    if mode == 'sample':
+        total = sum(data.values()) or 1
+        leaves = Counter()
+        for stack, count in data.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        lines = [f"{total} samples; innermost frames:"]
+        lines += [f"{count / total * 100:6.1f}%  {count:6d}  {leaf}" for leaf, count in leaves.most_common(limit)]
+        return '\n'.join(lines) + '\n'
+    stream = io.StringIO()
+    stats = pstats.Stats(stream=stream)
+    stats.stats = data
+    stats.get_top_level_stats()
+    stats.sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
@@ -0,0 +1,111 @@
+"""Build quantized variants of the disease model for DISEASE_MODEL_VARIANT.
+
+Writes <output>_<variant>.tflite next to the float model (see interpreter_pool.variant_path):
+  dynamic  - int8 weights, float activations (no calibration data needed)
+  float16  - float16 weights, about half the size; runs as float32 on most CPUs
+  int8     - int8 weights and activations, calibrated on --calibration-dir images.
+             Input/output stay float32 unless --int8-io (then uint8, handled by the backend)
+
+Needs full TensorFlow (not tflite-runtime). Run from fasal_sarthi_backend/:
+    python quantize_model.py FasalSarthi_Full_Model.keras --calibration-dir ./leaf_photos
+    python benchmarks/bench_disease_variants.py --images ./leaf_photos   (then pick one)
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+from interpreter_pool import VARIANTS, variant_path
+from preprocessing import ImagePreprocessor
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+
+def list_images(folder):
+    paths = []
+    for root, _, files in os.walk(folder):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(paths)
+
+
+def representative_dataset(input_shape, folder, size, seed=0):
+    # Calibration inputs go through the serving preprocessing: the float .tflite model reports
+    # quantization (0.0, 0) for its input, so it is fed raw 0-255 pixels as float32
+    _, height, width, _ = input_shape
+    preprocessor = ImagePreprocessor({'shape': [1, height, width, 3], 'dtype': np.float32, 'quantization': (0.0, 0)})
+    paths = list_images(folder)
+    if not paths:
+        raise SystemExit(f"No images found in {folder}")
+    random.Random(seed).shuffle(paths)
+    paths = paths[:size]
+    print(f"Calibrating on {len(paths)} image(s) from {folder}")
+
+    def generate():
+        for path in paths:
+            with open(path, 'rb') as f:
+                yield [preprocessor.preprocess(f.read()).copy()]
+
+    return generate
+
+
+def load_source(path):
+    """(input shape, converter factory) for a .keras/.h5 file or a SavedModel folder."""
+    import tensorflow as tf
+    if os.path.isdir(path):
+        signature = tf.saved_model.load(path).signatures['serving_default']
+        input_shape = list(signature.structured_input_signature[1].values())[0].shape
+        return tuple(input_shape), lambda: tf.lite.TFLiteConverter.from_saved_model(path)
+    model = tf.keras.models.load_model(path, compile=False)
+    return tuple(model.input_shape), lambda: tf.lite.TFLiteConverter.from_keras_model(model)
+
+
+def convert(make_converter, variant, calibration=None, int8_io=False):
+    import tensorflow as tf
+    converter = make_converter() # A fresh converter per variant (they keep their settings)
+    if variant != 'float':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == 'int8':
+        converter.representative_dataset = calibration
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        if int8_io:
+            converter.inference_input_type = tf.uint8
+            converter.inference_output_type = tf.uint8
+    return converter.convert()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source', help='Trained model: .keras / .h5 file or SavedModel folder')
+    parser.add_argument('--output', default='FasalSarthi_Full_Model.tflite', help='Float model path; variants are written next to it')
+    parser.add_argument('--variants', default='dynamic,float16,int8', help=f"Comma-separated, from {','.join(VARIANTS)}")
+    parser.add_argument('--calibration-dir', help='Leaf photos used to calibrate the int8 variant (required for int8)')
+    parser.add_argument('--calibration-size', type=int, default=200, help='Max calibration images (default 200)')
+    parser.add_argument('--int8-io', action='store_true', help='int8 variant takes uint8 pixels and returns uint8 scores')
+    args = parser.parse_args()
+
+    variants = [v.strip() for v in args.variants.split(',') if v.strip()]
+    unknown = [v for v in variants if v not in VARIANTS]
+    if unknown:
+        parser.error(f"unknown variant(s) {unknown}; choose from {VARIANTS}")
+    if 'int8' in variants and not args.calibration_dir:
+        parser.error("the int8 variant needs --calibration-dir")
+
+    input_shape, make_converter = load_source(args.source)
+    calibration = representative_dataset(input_shape, args.calibration_dir, args.calibration_size) if 'int8' in variants else None
+    for variant in variants:
+        path = variant_path(args.output, variant)
+        start = time.perf_counter()
+        data = convert(make_converter, variant, calibration, args.int8_io)
+        with open(path, 'wb') as f:
+            f.write(data)
+        print(f"{variant:<8} -> {path} ({len(data) / 1e6:.1f} MB, {time.perf_counter() - start:.1f}s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+
+def current_rss_mb():
+    # Resident set size of this process right now (Linux /proc), else peak RSS
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb():
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+# --- STARTUP TIME / MEMORY REPORT ---
+# app.py calls mark() after each import/model-loading phase and report() at the end,
+# so every worker's log shows where startup seconds and MB go.
+class StartupReport:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = []
+        self._last = self.start
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append({
+            "phase": phase,
+            "seconds": round(now - self._last, 3),
+            "rss_mb": round(current_rss_mb(), 1),
+        })
+        self._last = now
+
+    def total_seconds(self):
+        return round(self._last - self.start, 3)
+
+    def as_dict(self):
+        return {
+            "total_seconds": self.total_seconds(),
+            "rss_mb": round(current_rss_mb(), 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "phases": self.phases,
+        }
+
+    def report(self):
+        print(f"Startup report (pid {os.getpid()}): {self.total_seconds():.2f}s, RSS {current_rss_mb():.0f} MB")
+        for p in self.phases:
+            print(f"  {p['phase']:<32} {p['seconds']:>7.3f}s  RSS {p['rss_mb']:>7.1f} MB")
+
+
+if __name__ == '__main__':
+    # Measure a cold import of app.py in a fresh interpreter (what each gunicorn worker pays):
+    #   python startup_report.py            (from fasal_sarthi_backend/)
+    code = (
+        "import time, json; t = time.perf_counter(); import app; "
+        "from startup_report import current_rss_mb, peak_rss_mb; "
+        "print('STARTUP_JSON ' + json.dumps({'import_seconds': time.perf_counter() - t, "
+        "'rss_mb': current_rss_mb(), 'peak_rss_mb': peak_rss_mb(), "
+        "'tensorflow_imported': 'tensorflow' in __import__('sys').modules}))"
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    lines = [line for line in result.stdout.splitlines() if line.startswith('STARTUP_JSON ')]
+    if result.returncode != 0 or not lines:
+        print(result.stdout)
+        print(result.stderr)
+        sys.exit(1)
+    print(lines[-1][len('STARTUP_JSON '):])
@@ -1,44 +1,58 @@
-import requests
+import argparse
 import os
+import time
+
+import requests
 
 # --- Configuration ---
-# Your live Render backend URL
-url = "https://fasal-sarthi-backend.onrender.com/predict_disease"
+# Backend URL: --url, else the FASAL_BACKEND_URL environment variable, else the live Render backend
+# (e.g. python test_backend.py --url http://127.0.0.1:5000 for a local server)
+DEFAULT_URL = os.getenv('FASAL_BACKEND_URL', "https://fasal-sarthi-backend.onrender.com")
+# Test image: --image, else corn_blight.jpeg next to this script
+DEFAULT_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corn_blight.jpeg")
 
-# Full path to your test image file on your computer
-# IMPORTANT: Replace with the correct path to your image
-# image_path = r"\corn_blight.jpeg"
-image_path = r"C:\Users\rouna\OneDrive\Desktop\minor projecr\fasal_sarthi_backend\corn_blight.jpeg"
+parser = argparse.ArgumentParser(description="Send one leaf image to /predict_disease and print the response.")
+parser.add_argument('--url', default=DEFAULT_URL, help=f"Backend base URL (default {DEFAULT_URL})")
+parser.add_argument('--image', default=DEFAULT_IMAGE, help="Image file to upload")
+parser.add_argument('--timeout', type=float, default=120, help="Seconds to wait (Render cold starts are slow)")
+parser.add_argument('--repeat', type=int, default=1, help="Send the image this many times and print each latency")
+args = parser.parse_args()
+
+url = args.url.rstrip('/') + "/predict_disease"
+image_path = args.image
 
 # --- Check if image exists ---
 if not os.path.exists(image_path):
     print(f"ERROR: Image file not found at: {image_path}")
 else:
     print(f"Found image file: {image_path}")
-    # --- Prepare the file for upload ---
-    files = {'file': (os.path.basename(image_path), open(image_path, 'rb'), 'image/jpeg')}
-    #                   ^ Key must be 'file'         ^ Open in binary read mode
+    with open(image_path, 'rb') as f:
+        image_bytes = f.read()
 
-    # --- Send the request ---
-    try:
-        print(f"Sending POST request to {url}...")
-        response = requests.post(url, files=files, timeout=120) # Added timeout
+    for attempt in range(args.repeat):
+        # --- Prepare the file for upload ---
+        files = {'file': (os.path.basename(image_path), image_bytes, 'image/jpeg')}
+        #                   ^ Key must be 'file'
 
-        # --- Print the response ---
-        print(f"\nStatus Code: {response.status_code}")
+        # --- Send the request ---
         try:
-            # Try to print JSON response if successful
-            print("Response JSON:")
-            print(response.json())
-        except requests.exceptions.JSONDecodeError:
-            # Print raw text if not JSON (e.g., HTML error page)
-            print("Response Text (Not JSON):")
-            print(response.text)
-
-    except requests.exceptions.RequestException as e:
-        print(f"\nREQUEST FAILED: {e}")
-
-    finally:
-        # Close the file handle (important)
-        if 'file' in files:
-             files['file'][1].close()
\ No newline at end of file
+            print(f"Sending POST request to {url}...")
+            start = time.perf_counter()
+            response = requests.post(url, files=files, timeout=args.timeout)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            # --- Print the response ---
+            print(f"\nStatus Code: {response.status_code} ({elapsed_ms:.0f} ms)")
+            if response.headers.get('Server-Timing'):
+                print(f"Server-Timing: {response.headers['Server-Timing']}")
+            try:
+                # Try to print JSON response if successful
+                print("Response JSON:")
+                print(response.json())
+            except requests.exceptions.JSONDecodeError:
+                # Print raw text if not JSON (e.g., HTML error page)
+                print("Response Text (Not JSON):")
+                print(response.text)
+
+        except requests.exceptions.RequestException as e:
+            print(f"\nREQUEST FAILED: {e}")
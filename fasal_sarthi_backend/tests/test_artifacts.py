@@ -0,0 +1,87 @@
+import json
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+import artifacts
+from artifacts import LabelDecoder, ScalerParams, export_crop, open_artifacts
+
+FEATURES = ['soil_ph', 'nitrogen_kg_ha', 'annual_rainfall_mm']
+CROPS = ['Maize', 'Rice', 'Wheat']
+
+
+@pytest.fixture
+def crop_export(tmp_path):
+    rng = np.random.default_rng(0)
+    scaler = StandardScaler().fit(pd.DataFrame(rng.random((20, 3)) * [14, 300, 2000], columns=FEATURES))
+    sources = {'scaler': str(tmp_path / 'scaler.joblib'), 'encoder': str(tmp_path / 'encoder.joblib')}
+    joblib.dump(scaler, sources['scaler'])
+    joblib.dump(LabelEncoder().fit(CROPS), sources['encoder'])
+    directory = str(tmp_path / 'artifacts' / 'crop')
+    os.makedirs(os.path.dirname(directory))
+    export_crop(directory, sources['scaler'], sources['encoder'])
+    return directory, sources, scaler
+
+
+def test_loaded_arrays_are_memory_mapped(crop_export):
+    directory, sources, scaler = crop_export
+    loaded = open_artifacts(directory, 'crop', sources)
+    mean = loaded.arrays['scaler_mean']
+    assert isinstance(mean, np.memmap) and not mean.flags.writeable
+    np.testing.assert_array_equal(mean, scaler.mean_)
+    assert not isinstance(open_artifacts(directory, 'crop', sources, mmap=False).arrays['scaler_mean'], np.memmap)
+
+
+def test_stand_ins_match_the_sklearn_objects(crop_export):
+    directory, sources, scaler = crop_export
+    loaded = open_artifacts(directory, 'crop', sources)
+    params = ScalerParams(loaded.arrays['scaler_mean'], loaded.arrays['scaler_scale'],
+                          loaded.params['with_mean'], loaded.params['with_std'], loaded.lists['scaler_features'])
+    X = np.array([[6.5, 120.0, 900.0], [7.0, 40.0, 300.0]])
+    np.testing.assert_allclose(params.transform(X), scaler.transform(pd.DataFrame(X, columns=FEATURES)))
+    assert list(params.feature_names_in_) == FEATURES
+    assert LabelDecoder(loaded.lists['label_classes']).inverse_transform([2, 0]).tolist() == ['Wheat', 'Maize']
+
+
+def test_changed_source_file_falls_back_to_joblib(crop_export, capsys):
+    directory, sources, _ = crop_export
+    joblib.dump(LabelEncoder().fit(CROPS + ['Cotton']), sources['encoder'])
+    assert open_artifacts(directory, 'crop', sources) is None
+    assert 'changed since' in capsys.readouterr().out
+
+
+def test_missing_source_file_is_not_checked(crop_export):
+    # An artifacts-only deploy has no joblib files to compare against
+    directory, sources, _ = crop_export
+    os.remove(sources['encoder'])
+    assert open_artifacts(directory, 'crop', sources) is not None
+
+
+def test_other_format_version_or_model_is_ignored(crop_export):
+    directory, sources, _ = crop_export
+    assert open_artifacts(directory, 'fertilizer', sources) is None
+    path = os.path.join(directory, artifacts.MANIFEST)
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    manifest['format_version'] = artifacts.FORMAT_VERSION + 1
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    assert open_artifacts(directory, 'crop', sources) is None
+
+
+def test_missing_or_unset_directory(tmp_path):
+    assert open_artifacts('', 'crop', {}) is None
+    assert open_artifacts(str(tmp_path / 'nowhere'), 'crop', {}) is None
+
+
+def test_re_export_replaces_the_directory(crop_export):
+    directory, sources, _ = crop_export
+    with open(os.path.join(directory, 'leftover.npy'), 'wb'):
+        pass
+    export_crop(directory, sources['scaler'], sources['encoder'])
+    assert sorted(os.listdir(directory)) == [artifacts.MANIFEST, 'scaler_mean.npy', 'scaler_scale.npy']
+    assert os.listdir(os.path.dirname(directory)) == ['crop']
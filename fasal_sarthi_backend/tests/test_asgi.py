@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import asgi
+import app as backend
+
+FERT_ROW = {'Temparature': 30, 'Humidity': 50, 'Moisture': 40, 'Nitrogen': 10, 'Potassium': 5, 'Phosphorous': 5,
+            'Soil_Type': 'Loamy', 'Crop_Type': 'Wheat'}
+
+
+def http_scope(path, content_type='application/json'):
+    return {'type': 'http', 'method': 'POST', 'path': path, 'query_string': b'',
+            'headers': [(b'content-type', content_type.encode()), (b'origin', b'https://app.example')]}
+
+
+def test_weather_request_error_is_a_json_response(monkeypatch):
+    def bad_request(lat, lon, city):
+        raise ValueError("could not convert string to float: 'abc'")
+    monkeypatch.setattr(backend, 'weather_request', bad_request)
+
+    async def scenario():
+        messages = [{'type': 'http.request', 'body': json.dumps({'lat': 'abc', 'lon': 73}).encode()}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await asgi.app(http_scope('/get_weather'), receive, send)
+        return sent
+
+    start, body = asyncio.run(scenario())
+    headers = dict(start['headers'])
+    assert start['status'] == 500
+    assert headers[b'content-type'] == b'application/json'
+    assert headers[b'access-control-allow-origin'] == b'https://app.example'
+    assert json.loads(body['body']) == {"error": "Failed to fetch detailed weather data"}
+
+
+def test_ndjson_body_is_read_incrementally(monkeypatch):
+    monkeypatch.setattr(backend, 'FERT_BATCH_CHUNK_SIZE', 2)
+    lines = [json.dumps(FERT_ROW).encode() + b'\n' for _ in range(6)]
+    events = []
+
+    async def scenario():
+        async def receive():
+            await asyncio.sleep(0.01)
+            events.append('received')
+            return {'type': 'http.request', 'body': lines.pop(0), 'more_body': bool(lines)}
+
+        async def send(message):
+            if message['type'] == 'http.response.body' and message.get('body'):
+                events.append('sent')
+                results.extend(json.loads(line) for line in message['body'].splitlines())
+
+        await asgi.app(http_scope('/recommend_fertilizer/batch', 'application/x-ndjson'), receive, send)
+
+    results = []
+    asyncio.run(scenario())
+    # Each chunk of 2 rows is answered before the rest of the body is read
+    assert events == ['received', 'received', 'sent'] * 3
+    assert [r['index'] for r in results] == list(range(6))
+    assert all('recommended_fertilizer' in r for r in results)
+
+
+class EndlessGeminiStream:
+    status_code = 200
+
+    def __init__(self):
+        self.closed = False
+
+    async def aiter_lines(self):
+        while True:
+            await asyncio.sleep(0.01)
+            yield 'data: ' + json.dumps({'candidates': [{'content': {'parts': [{'text': 'more '}]}}]})
+
+    async def aclose(self):
+        self.closed = True
+
+
+def test_streamed_chat_closes_upstream_when_client_disconnects(monkeypatch):
+    upstream = EndlessGeminiStream()
+
+    async def post(*args, **kwargs):
+        return upstream
+
+    monkeypatch.setattr(backend, 'GOOGLE_API_KEY', 'test-key')
+    monkeypatch.setattr(asgi.gemini_async, 'post', post)
+
+    async def scenario():
+        messages = [{'type': 'http.request', 'body': json.dumps({'message': 'when to sow wheat', 'stream': True}).encode()}]
+
+        async def receive():
+            if messages: return messages.pop(0)
+            await asyncio.sleep(0.1)
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            pass
+
+        await asyncio.wait_for(asgi.app(http_scope('/sarthi_ai_chat'), receive, send), 5)
+
+    asyncio.run(scenario())
+    assert upstream.closed
@@ -0,0 +1,74 @@
+import io
+import json
+
+import pytest
+
+from batch_io import iter_ndjson_lines, parse_batch_rows, parse_ndjson_line
+
+
+class CountingStream(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = 0
+
+    def read(self, size=-1):
+        self.reads += 1
+        return super().read(size)
+
+
+def rows(body, **kwargs):
+    return [parse_ndjson_line(line) for line in iter_ndjson_lines(io.BytesIO(body), **kwargs)]
+
+
+def test_lines_split_across_chunks():
+    body = b'\xef\xbb\xbf{"a": 1}\n\n{"b": 2}\r\n  \n{"c": 3}'
+    assert rows(body, chunk_size=3) == [{"a": 1}, {"b": 2}, {"c": 3}]
+
+
+@pytest.mark.parametrize('chunk_size', [5, 64, 4096])
+def test_oversized_line_is_one_row_error(chunk_size):
+    body = b'{"a": 1}\n{"big": "' + b'x' * 5000 + b'"}\n{"c": 3}\n' + b'y' * 3000
+    result = rows(body, chunk_size=chunk_size, max_line_bytes=1000)
+    assert result[0] == {"a": 1} and result[2] == {"c": 3}
+    assert [str(r) for r in result[1::2]] == ["Line longer than 1000 bytes"] * 2
+    assert len(result) == 4
+
+
+def test_memory_stays_bounded_without_newlines():
+    stream = CountingStream(b'z' * 10 ** 6)
+    lines = iter_ndjson_lines(stream, chunk_size=1000, max_line_bytes=4000)
+    assert [str(line) for line in lines] == ["Line longer than 4000 bytes"]
+    assert stream.reads > 1000 # Read in chunks, not all at once
+
+
+def test_invalid_utf8_is_a_row_error_and_the_stream_continues():
+    result = rows(b'{"a": 1}\n{"b": "\xff\xfe"}\n{"c": 3}\n', chunk_size=4)
+    assert result[0] == {"a": 1} and result[2] == {"c": 3}
+    assert isinstance(result[1], ValueError) and "not valid UTF-8" in str(result[1])
+
+
+def test_invalid_json_line():
+    result = rows(b'{"a": 1}\n{oops\n')
+    assert result[0] == {"a": 1}
+    assert str(result[1]).startswith("Invalid JSON line")
+
+
+def test_parse_batch_rows_formats():
+    assert parse_batch_rows(b'[{"a": 1}]', 'application/json') == [{"a": 1}]
+    assert parse_batch_rows(b'{"plots": [{"a": 1}]}', None) == [{"a": 1}]
+    assert parse_batch_rows(b'a,b\n1, 2\n', 'text/csv; charset=utf-8') == [{"a": "1", "b": "2"}]
+    with pytest.raises(ValueError):
+        parse_batch_rows(b'{"a": 1}', 'application/json')
+
+
+def test_fertilizer_stream_reports_bad_lines_per_row(monkeypatch):
+    import app
+    monkeypatch.setattr(app, 'iter_ndjson_lines', lambda stream: iter_ndjson_lines(stream, 256, 1000))
+    row = b'{"Temparature": 30, "Humidity": 50, "Moisture": 40, "Nitrogen": 10, "Potassium": 5, "Phosphorous": 5, "Soil_Type": "Loamy", "Crop_Type": "Wheat"}'
+    body = b"\n".join([row, b'{"note": "' + b'x' * 4000 + b'"}', b'{"Soil_Type": "\xff"}', row])
+    response = app.app.test_client().post('/recommend_fertilizer/batch', data=body, content_type='application/x-ndjson')
+    lines = [json.loads(line) for line in response.get_data().splitlines()]
+    assert [line['index'] for line in lines] == [0, 1, 2, 3]
+    assert 'recommended_fertilizer' in lines[0] and 'recommended_fertilizer' in lines[3]
+    assert lines[1]['error'] == "Line longer than 1000 bytes"
+    assert "not valid UTF-8" in lines[2]['error']
@@ -0,0 +1,92 @@
+import json
+
+from chat_sessions import ChatSession, ChatSessionStore, estimate_tokens, gemini_content
+
+SYSTEM = 'You are Fasal Sarthi.'
+
+
+def texts(session):
+    return [text for _, text, _ in session.turns]
+
+
+def expected_body(session, message):
+    contents = [{"parts": [{"text": SYSTEM}]}]
+    contents.extend(gemini_content(role, text) for role, text, _ in session.turns)
+    contents.append(gemini_content("user", message))
+    return {"contents": contents}
+
+
+def test_window_drops_oldest_turns_past_the_budget():
+    session = ChatSession('s', SYSTEM, token_budget=10)
+    for i in range(5):
+        session.append('user' if i % 2 == 0 else 'model', f'turn {i} ab') # 3 tokens each
+    assert texts(session) == ['turn 2 ab', 'turn 3 ab', 'turn 4 ab']
+    assert session.window_tokens == 9 <= session.token_budget
+
+    # A single turn over the budget is still kept on its own
+    session.append('user', 'x' * 60)
+    assert texts(session) == ['x' * 60] and session.window_tokens == estimate_tokens('x' * 60)
+
+
+def test_cached_prefix_matches_a_full_rebuild():
+    session = ChatSession('s', SYSTEM, token_budget=12)
+    assert json.loads(session.request_body('नमस्ते')) == expected_body(session, 'नमस्ते')
+    for i in range(6): # Appends extend the cached prefix until a turn drops off the front
+        session.append('user' if i % 2 == 0 else 'model', f'गेहूं {i} "quoted"')
+        assert json.loads(session.request_body('next')) == expected_body(session, 'next')
+
+
+def test_sessions_expire_and_are_evicted():
+    store = ChatSessionStore(SYSTEM, max_sessions=2, ttl_seconds=60)
+    first, is_new = store.get('session-a')
+    assert is_new
+    store.add_exchange(first, 'hi', 'hello')
+    assert store.get('session-a') == (first, False)
+
+    store.get('session-b')
+    store.get('session-c') # Evicts the least recently used (a)
+    assert store.get('session-a')[1]
+
+    session, _ = store.get('session-a')
+    store.add_exchange(session, 'hi', 'hello')
+    session.updated_at -= 61
+    assert store.get('session-a')[1]
+    assert store.stats()['backend'] == 'memory'
+
+
+def test_sqlite_survives_restart_and_is_shared_across_workers(tmp_path):
+    db_path = str(tmp_path / 'chat.sqlite3')
+    worker1 = ChatSessionStore(SYSTEM, db_path=db_path)
+    worker2 = ChatSessionStore(SYSTEM, db_path=db_path)
+
+    session, _ = worker1.get('farmer-0001')
+    worker1.seed(session, [('user', 'old question'), ('model', 'old answer')])
+    worker1.add_exchange(session, 'which fertilizer?', 'urea')
+
+    # Another worker (or a restarted one) rebuilds the conversation from SQLite
+    other, is_new = worker2.get('farmer-0001')
+    assert not is_new
+    assert texts(other) == texts(session)
+    assert json.loads(other.request_body('and now?')) == json.loads(session.request_body('and now?'))
+
+    # Each worker catches up on turns the other one wrote
+    worker2.add_exchange(other, 'how much?', '50 kg')
+    session, _ = worker1.get('farmer-0001')
+    assert texts(session)[-2:] == ['how much?', '50 kg']
+    assert texts(worker1.get('farmer-0001')[0]) == texts(session) # No duplicates on re-read
+
+    restarted = ChatSessionStore(SYSTEM, db_path=db_path)
+    assert texts(restarted.get('farmer-0001')[0]) == texts(session)
+    assert restarted.get('farmer-0002')[1]
+    assert restarted.stats()['backend'] == 'sqlite'
+
+
+def test_sqlite_rows_past_the_ttl_are_not_loaded(tmp_path):
+    db_path = str(tmp_path / 'chat.sqlite3')
+    writer = ChatSessionStore(SYSTEM, db_path=db_path)
+    writer.add_exchange(writer.get('farmer-0001')[0], 'hi', 'hello')
+    writer._connection().execute("UPDATE chat_turns SET created_at = created_at - 120")
+
+    reader = ChatSessionStore(SYSTEM, ttl_seconds=60, db_path=db_path)
+    session, is_new = reader.get('farmer-0001')
+    assert is_new and session.turns == []
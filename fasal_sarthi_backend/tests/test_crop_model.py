@@ -0,0 +1,44 @@
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+import app
+
+CROPS = ['Maize', 'Rice', 'Wheat']
+
+
+def save_crop_models(directory, columns):
+    # Fitted on DataFrames, like the shipped stacking model, scaler and label encoder
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame(rng.random((60, len(columns))), columns=columns)
+    labels = LabelEncoder().fit(CROPS)
+    model = RandomForestClassifier(n_estimators=3, random_state=0)
+    model.fit(frame, labels.transform(rng.choice(CROPS, 60)))
+    scaler = StandardScaler().fit(frame[app.CROP_NUMERICAL_FEATURES])
+    paths = {}
+    for key, obj in [('model', model), ('scaler', scaler), ('encoder', labels)]:
+        paths[key] = str(directory / f'{key}.joblib')
+        joblib.dump(obj, paths[key])
+    return paths
+
+
+def test_crop_predict_does_not_warn_about_feature_names(tmp_path):
+    crop = app.load_crop_models(save_crop_models(tmp_path, app.CROP_FULL_FEATURE_NAMES))
+    app.warm_up_crop_models(crop)
+    feature_matrix, _ = crop.feature_encoder.encode_rows([app.CROP_WARMUP_REQUEST] * 3)
+    with warnings.catch_warnings(record=True) as caught:
+        crop.stacking.predict(feature_matrix)
+    assert caught == []
+    assert set(crop.label_encoder.inverse_transform(crop.stacking.predict(feature_matrix))) <= set(CROPS)
+
+
+def test_crop_model_fitted_on_other_columns_is_rejected(tmp_path):
+    columns = list(app.CROP_FULL_FEATURE_NAMES)
+    columns[7], columns[8] = columns[8], columns[7]
+    with pytest.raises(ValueError, match='fitted on columns'):
+        app.load_crop_models(save_crop_models(tmp_path, columns))
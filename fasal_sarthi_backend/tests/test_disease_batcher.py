@@ -0,0 +1,50 @@
+import threading
+from concurrent.futures import TimeoutError
+
+import numpy as np
+import pytest
+
+from disease_batcher import DiseaseBatcher
+
+
+def doubled(batch_array):
+    return batch_array * 2
+
+
+def test_submit_after_stop_raises_instead_of_hanging():
+    batcher = DiseaseBatcher(doubled, max_wait_ms=1, num_workers=2)
+    assert batcher.predict(np.ones((1, 2)), timeout=5).tolist() == [2, 2]
+    batcher.stop()
+    with pytest.raises(RuntimeError):
+        batcher.predict(np.ones((1, 2)), timeout=5)
+
+    # start() reopens it with fresh workers
+    batcher.start()
+    assert batcher.predict(np.full((1, 2), 3.0), timeout=5).tolist() == [6, 6]
+    batcher.stop()
+
+
+def test_queued_items_are_served_before_stop():
+    release = threading.Event()
+
+    def slow(batch_array):
+        release.wait(5)
+        return batch_array
+
+    batcher = DiseaseBatcher(slow, max_batch_size=1, max_wait_ms=0)
+    futures = [batcher.submit(np.full((1, 1), i)) for i in range(3)]
+    batcher.stop()
+    release.set()
+    assert [f.result(timeout=5).tolist() for f in futures] == [[0], [1], [2]]
+
+
+def test_predict_times_out():
+    release = threading.Event()
+    batcher = DiseaseBatcher(lambda batch_array: release.wait(5) and batch_array, max_batch_size=1,
+                             max_wait_ms=0, result_timeout=0.05)
+    try:
+        with pytest.raises(TimeoutError):
+            batcher.predict(np.ones((1, 1)))
+    finally:
+        release.set()
+        batcher.stop()
@@ -0,0 +1,127 @@
+import io
+import zipfile
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import app
+from model_registry import ModelSlot
+from preprocessing import ImagePreprocessor
+from prediction_cache import PredictionCache
+
+BLIGHT, HEALTHY, EARLY_BLIGHT = 0, 2, 6 # Indexes into app.CLASS_NAMES
+
+
+def leaf(class_index, size=(32, 24), fmt='JPEG'):
+    # Solid photo whose red channel encodes the class the stub model predicts for it
+    out = io.BytesIO()
+    Image.new('RGB', size, (class_index * 20, 120, 40)).save(out, fmt)
+    return out.getvalue()
+
+
+def stub_batch(batches):
+    def run_disease_batch(batch_array, version=None, paths=None):
+        batches.append(len(batch_array))
+        predictions = np.full((len(batch_array), len(app.CLASS_NAMES)), 0.01, dtype=np.float32)
+        for row, tensor in zip(predictions, batch_array):
+            row[int(round(tensor[..., 0].mean() / 20))] = 0.9 # Raw 0-255 pixels (not normalised for (0.0, 0))
+        return predictions
+    return run_disease_batch
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    model_file = tmp_path / 'stub.tflite'
+    model_file.write_bytes(b'stub')
+    preprocessor = ImagePreprocessor({'shape': [1, 8, 8, 3], 'dtype': np.float32, 'quantization': (0.0, 0)})
+    slot = ModelSlot('disease', {'model': str(model_file)}, loader=lambda paths: app.DiseaseModel(None, preprocessor, None))
+    slot.load(warm=False)
+    monkeypatch.setattr(app, 'disease_models', slot)
+    monkeypatch.setitem(app.model_registry.slots, 'disease', slot)
+    monkeypatch.setattr(app, 'prediction_cache', PredictionCache(max_entries=0))
+    monkeypatch.setattr(app, 'DISEASE_BULK_BATCH_SIZE', 2)
+    monkeypatch.setattr(app, 'DISEASE_BULK_MAX_IMAGE_BYTES', 20000)
+    batches = []
+    monkeypatch.setattr(app, 'run_disease_batch', stub_batch(batches))
+    client = app.app.test_client()
+    client.batches = batches
+    return client
+
+
+def zip_bytes(members):
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w') as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return out.getvalue()
+
+
+def test_results_keep_upload_order_with_errors_in_place(client):
+    archive = zip_bytes([
+        ('visit/', b''),
+        ('visit/notes.txt', b'not a photo'),
+        ('__MACOSX/visit/._a.jpg', b'metadata'),
+        ('visit/a.jpg', leaf(HEALTHY)),
+        ('visit/broken.jpg', b'\xff\xd8 truncated'),
+        ('visit/b.png', leaf(EARLY_BLIGHT, fmt='PNG')),
+    ])
+    response = client.post('/predict_disease/bulk', data={
+        'field_id': 'plot-7',
+        'file': [(io.BytesIO(leaf(BLIGHT)), 'first.jpg'), (io.BytesIO(archive), 'visit.zip'),
+                 (io.BytesIO(leaf(BLIGHT)), 'last.jpg')],
+    }, content_type='multipart/form-data')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['field_id'] == 'plot-7'
+    # The text file, folder and macOS metadata are not images and are skipped
+    assert [r['name'] for r in body['results']] == [
+        'first.jpg', 'visit.zip/visit/a.jpg', 'visit.zip/visit/broken.jpg', 'visit.zip/visit/b.png', 'last.jpg']
+    assert [r['index'] for r in body['results']] == list(range(5))
+    assert [r.get('predicted_disease') for r in body['results']] == [
+        app.CLASS_NAMES[BLIGHT], app.CLASS_NAMES[HEALTHY], None, app.CLASS_NAMES[EARLY_BLIGHT], app.CLASS_NAMES[BLIGHT]]
+    assert body['results'][2]['error'] == 'Could not read image'
+    assert body['count'] == 5 and body['errors'] == 1
+    assert sorted(client.batches) == [2, 2] # 4 decoded images, DISEASE_BULK_BATCH_SIZE=2
+
+
+def test_oversized_members_fail_alone(client):
+    big = leaf(BLIGHT, size=(400, 400), fmt='PNG') + b'\0' * 20000
+    archive = zip_bytes([('a.jpg', leaf(HEALTHY)), ('huge.png', big), ('c.jpg', leaf(BLIGHT))])
+    response = client.post('/predict_disease/bulk', data=archive, content_type='application/zip')
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert 'Image too large' in results[1]['error']
+    assert [r.get('predicted_disease') for r in results] == [app.CLASS_NAMES[HEALTHY], None, app.CLASS_NAMES[BLIGHT]]
+
+    response = client.post('/predict_disease/bulk', data={'file': [(io.BytesIO(big), 'huge.png')]},
+                           content_type='multipart/form-data')
+    assert 'Image too large' in response.get_json()['results'][0]['error']
+
+
+def test_requests_without_images(client):
+    response = client.post('/predict_disease/bulk', data=zip_bytes([('notes.txt', b'hi')]), content_type='application/zip')
+    assert response.status_code == 400
+    response = client.post('/predict_disease/bulk', data=b'PK\x03\x04 not really', content_type='application/zip')
+    assert response.status_code == 400
+
+
+def test_field_summary_aggregates_per_disease():
+    results = [
+        {"predicted_disease": "Corn__Blight", "confidence": "90.00%"},
+        {"predicted_disease": "Corn___healthy", "confidence": "80.00%"},
+        {"predicted_disease": "Corn__Blight", "confidence": "70.00%"},
+        {"predicted_disease": "Corn___healthy", "confidence": "60.00%"},
+        {"predicted_disease": "Corn___healthy", "confidence": "100.00%"},
+        {"error": "Could not read image"},
+    ]
+    summary = app.field_summary(results)
+    assert summary["images"] == 6 and summary["predicted"] == 5 and summary["errors"] == 1
+    assert summary["healthy"] == 3 and summary["diseased"] == 2 and summary["diseased_share"] == 0.4
+    # Most frequent first, but the top disease is never a healthy class
+    assert summary["top_disease"] == "Corn__Blight"
+    assert summary["diseases"] == [
+        {"disease": "Corn___healthy", "count": 3, "share": 0.6, "mean_confidence": "80.00%"},
+        {"disease": "Corn__Blight", "count": 2, "share": 0.4, "mean_confidence": "80.00%"},
+    ]
+    assert app.field_summary([{"error": "x"}])["diseased_share"] is None
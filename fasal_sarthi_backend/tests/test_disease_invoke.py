@@ -0,0 +1,105 @@
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+
+import app
+
+
+class FakeInterpreter:
+    # Output row = sum of the input row; optionally refuses resizing or fails one invoke
+    def __init__(self, resizable=True):
+        self.shape = [1, 3]
+        self.resizable = resizable
+        self.allocations = 0
+        self.fail_next_invoke = False
+
+    def get_input_details(self):
+        return [{'index': 0, 'shape': np.array(self.shape)}]
+
+    def get_output_details(self):
+        return [{'index': 1}]
+
+    def resize_tensor_input(self, index, shape, strict=False):
+        self.shape = list(shape)
+
+    def allocate_tensors(self):
+        if not self.resizable and self.shape[0] != 1:
+            raise RuntimeError("batch dimension is fixed")
+        self.allocations += 1
+
+    def set_tensor(self, index, value):
+        assert list(value.shape) == self.shape
+        self.value = value
+
+    def invoke(self):
+        if self.fail_next_invoke:
+            self.fail_next_invoke = False
+            raise RuntimeError("invoke failed")
+
+    def get_tensor(self, index):
+        return self.value.sum(axis=1, keepdims=True).astype(np.float32)
+
+
+class FakePool:
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.batch_resize_supported = True
+
+    def output_details(self):
+        return [{'dtype': np.float32, 'quantization': (0.0, 0)}]
+
+    @contextmanager
+    def checkout(self):
+        yield self.interpreter
+
+
+def batch(n):
+    return np.arange(n * 3, dtype=np.float32).reshape(n, 3)
+
+
+def test_batches_are_padded_to_buckets(monkeypatch):
+    monkeypatch.setattr(app, 'DISEASE_BATCH_BUCKETS', [1, 4, 8])
+    assert [app.batch_bucket(n) for n in (1, 2, 4, 5, 8, 9, 17)] == [1, 4, 4, 8, 8, 16, 24]
+
+    pool = FakePool(FakeInterpreter())
+    for n in (2, 3, 4, 3, 2, 5, 7):
+        out = app.invoke_disease_model(pool, batch(n))
+        assert out.tolist() == batch(n).sum(axis=1, keepdims=True).tolist()
+    # Re-allocated once for the 4 bucket and once for the 8 bucket, not per batch size
+    assert pool.interpreter.allocations == 2
+
+
+def test_failed_invoke_fails_the_batch_but_keeps_batching():
+    pool = FakePool(FakeInterpreter())
+    pool.interpreter.fail_next_invoke = True
+    with pytest.raises(RuntimeError, match='invoke failed'):
+        app.invoke_disease_model(pool, batch(3))
+    assert pool.batch_resize_supported
+    assert app.invoke_disease_model(pool, batch(3)).shape == (3, 1)
+    assert pool.interpreter.shape[0] == 4 # Still one batched invoke
+
+
+def test_fixed_batch_model_falls_back_per_pool():
+    fixed, dynamic = FakePool(FakeInterpreter(resizable=False)), FakePool(FakeInterpreter())
+    assert app.invoke_disease_model(fixed, batch(3)).tolist() == batch(3).sum(axis=1, keepdims=True).tolist()
+    assert not fixed.batch_resize_supported
+    # Another model version keeps batching
+    app.invoke_disease_model(dynamic, batch(3))
+    assert dynamic.batch_resize_supported and dynamic.interpreter.shape[0] == 4
+
+
+def test_batcher_gets_its_own_copy_of_the_request_buffer():
+    # The queued tensor must survive the request thread reusing its buffer (e.g. after a timeout)
+    queued = []
+
+    class Batcher:
+        def predict(self, tensor):
+            queued.append(tensor)
+            return np.zeros(3, dtype=np.float32)
+
+    buffer = np.ones((1, 2, 2, 3), dtype=np.float32)
+    assert app.predict_disease_tensor(buffer, app.DiseaseModel(None, None, Batcher())).shape == (1, 3)
+    assert not np.shares_memory(queued[0], buffer)
+    buffer.fill(7.0)
+    assert queued[0].tolist() == np.ones((1, 2, 2, 3)).tolist()
@@ -0,0 +1,50 @@
+from faq_cache import FAQCache
+
+WHEAT = 'गेहूं में कौन सा खाद डालें?'
+
+
+def cache(threshold):
+    faq = FAQCache(threshold=threshold)
+    faq.put(WHEAT, 'wheat answer')
+    return faq
+
+
+def test_exact_match_after_normalization_by_default():
+    faq = cache(threshold=1.0)
+    assert faq.get('गेहूँ में कौन सा खाद डालें')[0] == 'wheat answer'
+    assert faq.get('गेहूं में कौन सी खाद डालें?')[0] is None
+
+
+def test_default_threshold_is_exact_only():
+    assert FAQCache().threshold == 1.0
+
+
+def test_low_threshold_is_raised():
+    assert FAQCache(threshold=0.8).threshold == FAQCache.MIN_SIMILARITY
+
+
+def test_negated_question_misses():
+    for threshold in (1.0, 0.95):
+        faq = cache(threshold)
+        assert faq.get('गेहूं में कौन सा खाद नहीं डालें?')[0] is None
+        assert faq.get('गेहूं में कौन सा खाद मत डालें?')[0] is None
+
+
+def test_different_crop_misses():
+    for threshold in (1.0, 0.95):
+        faq = cache(threshold)
+        for question in ('धान में कौन सा खाद डालें?', 'मक्का में कौन सा खाद डालें?',
+                         'धान की फसल में कौन सा खाद डालें?', 'गेहूं और धान में कौन सा खाद डालें?'):
+            assert faq.get(question)[0] is None, question
+
+
+def test_different_number_misses():
+    faq = FAQCache(threshold=0.95)
+    faq.put('गेहूं में 2 बोरी यूरिया कब डालें?', 'two bags')
+    assert faq.get('गेहूं में 3 बोरी यूरिया कब डालें?')[0] is None
+
+
+def test_near_duplicate_with_same_key_words_hits():
+    faq = cache(threshold=0.97)
+    answer, score = faq.get('कौन सा खाद गेहूं में डालें?')
+    assert answer == 'wheat answer' and score >= 0.97
@@ -0,0 +1,41 @@
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from crop_features import CropFeatureEncoder
+from fert_features import FertilizerFeatureEncoder
+
+CROP_NUMERICAL = ['soil_ph', 'nitrogen_kg_ha', 'annual_rainfall_mm']
+CROP_FEATURES = CROP_NUMERICAL + ['soil_type_Loamy', 'irrigation_type_Drip', 'previous_crop_Wheat']
+PLOT = {'soil_ph': 6.5, 'nitrogen_kg_ha': 120, 'annual_rainfall_mm': 900,
+        'soil_type': 'Loamy', 'irrigation_type': 'Drip', 'previous_crop': 'Wheat'}
+
+
+def crop_encoder():
+    scaler = SimpleNamespace(mean_=np.zeros(3), scale_=np.ones(3))
+    return CropFeatureEncoder(CROP_FEATURES, CROP_NUMERICAL, scaler)
+
+
+@pytest.mark.parametrize('value', ['nan', 'inf', '-Infinity', float('nan'), float('inf')])
+def test_crop_encoder_rejects_non_finite_values(value):
+    encoder = crop_encoder()
+    with pytest.raises(ValueError, match='nitrogen_kg_ha'):
+        encoder.encode(dict(PLOT, nitrogen_kg_ha=value))
+
+    # In a batch only that plot fails, like a missing field
+    rows = json.loads(json.dumps([PLOT, dict(PLOT, nitrogen_kg_ha=value), {'soil_ph': 6}]))
+    matrix, errors = encoder.encode_rows(rows)
+    assert set(errors) == {1, 2}
+    assert isinstance(errors[1], ValueError) and isinstance(errors[2], KeyError)
+    assert np.isfinite(matrix).all()
+    assert matrix[0].tolist() == [6.5, 120, 900, 1, 1, 1]
+
+
+def test_fertilizer_encoder_rejects_non_finite_values():
+    encoder = FertilizerFeatureEncoder(['Temparature', 'Humidity', 'Soil_Type_Loamy', 'Crop_Type_Wheat'])
+    good = {'Temparature': 30, 'Humidity': 50, 'Soil_Type': 'Loamy', 'Crop_Type': 'Wheat'}
+    matrix, valid, errors = encoder.encode_rows([good, dict(good, Humidity='NaN')])
+    assert valid == [0] and matrix.tolist() == [[30, 50, 1, 1]]
+    assert 'Humidity' in str(errors[1])
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+import app
+
+SOIL = {'Moisture': 40, 'Nitrogen': 10, 'Potassium': 5, 'Phosphorous': 5, 'Soil_Type': 'Loamy', 'Crop_Type': 'Wheat'}
+WEATHER = {"city": "Pune", "temperature": 31.5, "humidity": 48}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app, 'GOOGLE_API_KEY', None)
+    return app.app.test_client()
+
+
+def stub_weather(monkeypatch, fn):
+    calls = []
+
+    def get_weather(lat=None, lon=None, city=None, **request_options):
+        calls.append(request_options)
+        return fn()
+
+    monkeypatch.setattr(app, 'get_weather', get_weather)
+    return calls
+
+
+def test_model_inputs_are_filled_from_the_weather(client, monkeypatch):
+    calls = stub_weather(monkeypatch, lambda: (WEATHER, 200))
+    response = client.post('/field_advisory', json={'city': 'Pune', 'fertilizer': SOIL})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['weather'] == WEATHER
+    assert 'recommended_fertilizer' in body['fertilizer']
+    assert body['filled_from_weather'] == {'fertilizer': ['Humidity', 'Temparature']}
+    assert body['partial'] is False
+    assert set(body['timings_ms']) == {'weather', 'fertilizer', 'total'}
+    # The weather call is bounded by the stage timeout: one attempt, no retries
+    assert calls == [{"timeout": (min(app.HTTP_CONNECT_TIMEOUT, app.ADVISORY_WEATHER_TIMEOUT), app.ADVISORY_WEATHER_TIMEOUT),
+                      "retries": 0}]
+
+
+def test_failed_stage_gives_partial_results(client, monkeypatch):
+    stub_weather(monkeypatch, lambda: (WEATHER, 200))
+    response = client.post('/field_advisory', json={
+        'city': 'Pune', 'fertilizer': {**SOIL, 'Soil_Type': 'Moon dust'}, 'chat': {'message': 'hello'}})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['partial'] is True
+    assert body['weather'] == WEATHER
+    assert body['fertilizer'] == {"error": "Invalid input value: Unknown Soil_Type: Moon dust", "status": 400}
+    assert body['chat'] == {"error": "Chatbot API key not configured.", "status": 503}
+
+
+def test_stage_timeout(client, monkeypatch):
+    monkeypatch.setattr(app, 'ADVISORY_WEATHER_TIMEOUT', 0.1)
+    release = threading.Event()
+    stub_weather(monkeypatch, lambda: (release.wait(5), (WEATHER, 200))[1])
+    try:
+        started = time.perf_counter()
+        response = client.post('/field_advisory', json={
+            'city': 'Pune', 'fertilizer': {**SOIL, 'Temparature': 30, 'Humidity': 50}})
+        assert time.perf_counter() - started < 2
+    finally:
+        release.set()
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['weather'] == {"error": "Timed out after 0.1s", "status": 504}
+    # Had all of its inputs, so it didn't wait for the weather
+    assert 'recommended_fertilizer' in body['fertilizer'] and body['partial'] is True
+
+
+def test_models_needing_the_failed_weather_get_424(client, monkeypatch):
+    stub_weather(monkeypatch, lambda: ({"error": "city not found", "status": 404}, 404))
+    response = client.post('/field_advisory', json={'city': 'Atlantis', 'fertilizer': SOIL})
+    body = response.get_json()
+    assert body['weather'] == {"error": "city not found", "status": 404}
+    assert body['fertilizer']['status'] == 424
+    assert 'Humidity, Temparature' in body['fertilizer']['error']
+    # Every stage failed
+    assert response.status_code == 502
+
+
+def test_every_stage_failing_is_502(client, monkeypatch):
+    def down():
+        raise ConnectionError("OWM unreachable")
+    stub_weather(monkeypatch, down)
+    response = client.post('/field_advisory', json={'city': 'Pune', 'chat': {'message': 'hello'}})
+    assert response.status_code == 502
+    body = response.get_json()
+    assert body['weather'] == {"error": "Failed to fetch detailed weather data", "status": 500}
+    assert body['chat']['status'] == 503 and body['partial'] is True
+
+
+def test_bad_requests(client):
+    assert client.post('/field_advisory', json={}).status_code == 400
+    assert client.post('/field_advisory', json={'crop': 'not an object'}).status_code == 400
@@ -0,0 +1,87 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+import requests
+
+from http_client import AsyncUpstreamClient, CircuitOpenError, UpstreamClient
+
+
+class FailingSession:
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        raise self.error
+
+
+def client_with(error, **kwargs):
+    client = UpstreamClient('test', backoff_base=0, **kwargs)
+    client._session, client._session_pid = FailingSession(error), os.getpid()
+    return client
+
+
+def open_to_half_open(breaker):
+    breaker.record_failure()
+    breaker.opened_at -= breaker.reset_timeout # Reset timeout elapsed
+
+
+@pytest.mark.parametrize('error', [requests.exceptions.ChunkedEncodingError(), requests.exceptions.InvalidURL(),
+                                   requests.exceptions.TooManyRedirects()])
+def test_any_failed_trial_reopens_the_circuit(error):
+    client = client_with(error, failure_threshold=1, reset_timeout=30)
+    open_to_half_open(client.breaker)
+    with pytest.raises(type(error)):
+        client.get('http://upstream.invalid/')
+    assert not client.breaker.trial_in_flight
+    assert client.breaker.state == 'open'
+
+
+def test_cancelled_async_trial_is_released():
+    sync = UpstreamClient('test', failure_threshold=1, reset_timeout=30)
+    client = AsyncUpstreamClient(sync)
+
+    async def cancelled(*args, **kwargs):
+        raise asyncio.CancelledError()
+    client._send = cancelled
+    open_to_half_open(sync.breaker)
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(client.post('http://upstream.invalid/'))
+    assert not sync.breaker.trial_in_flight
+    sync.breaker.before_call() # The next call is let through as the trial, not failed fast
+
+
+def test_post_is_not_retried_after_a_read_timeout():
+    client = client_with(requests.exceptions.ReadTimeout(), retries=2)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.post('http://upstream.invalid/')
+    assert client.session.calls == 1
+
+
+def test_post_is_retried_after_a_connect_error_and_get_after_a_read_timeout():
+    client = client_with(requests.exceptions.ConnectTimeout(), retries=2)
+    with pytest.raises(requests.exceptions.ConnectTimeout):
+        client.post('http://upstream.invalid/')
+    assert client.session.calls == 3
+    client = client_with(requests.exceptions.ReadTimeout(), retries=2, failure_threshold=10)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.get('http://upstream.invalid/')
+    assert client.session.calls == 3
+
+
+def test_async_post_retry_policy():
+    client = AsyncUpstreamClient(UpstreamClient('test'))
+    assert client.can_retry('POST', httpx.ConnectError('refused'))
+    assert not client.can_retry('POST', httpx.ReadTimeout('slow'))
+    assert client.can_retry('GET', httpx.ReadTimeout('slow'))
+
+
+def test_open_circuit_fails_fast():
+    client = client_with(requests.exceptions.ConnectionError(), retries=0, failure_threshold=1)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.get('http://upstream.invalid/')
+    with pytest.raises(CircuitOpenError):
+        client.get('http://upstream.invalid/')
@@ -0,0 +1,48 @@
+import os
+import time
+
+import pytest
+
+from inference_executor import InferenceExecutor, InferenceRejected
+
+
+def worker_pid():
+    return os.getpid()
+
+
+def die():
+    os._exit(1)
+
+
+def test_lost_pool_is_not_reforked_at_runtime():
+    executor = InferenceExecutor(processes=1)
+    executor.add_model('toy', concurrency=1)
+    # Never started: runs in-process instead of forking on first use
+    assert executor.run('toy', worker_pid)[0] == os.getpid()
+
+    executor.start()
+    try:
+        assert executor.run('toy', worker_pid)[0] != os.getpid()
+        with pytest.raises(InferenceRejected):
+            executor.run('toy', die)
+        # The pool is gone and start() won't fork a new one in this process
+        executor.start()
+        assert executor.run('toy', worker_pid)[0] == os.getpid()
+        assert executor.stats()["pool_lost"] is True
+    finally:
+        executor.shutdown()
+
+
+def test_caller_can_cap_the_queue_wait():
+    executor = InferenceExecutor()
+    queue = executor.add_model('toy', concurrency=1, max_wait=10.0)
+    queue.acquire() # The only slot is busy
+    try:
+        started = time.perf_counter()
+        with pytest.raises(InferenceRejected) as rejected:
+            executor.run('toy', worker_pid, max_wait=0.05)
+        assert rejected.value.status == 503
+        assert time.perf_counter() - started < 1
+    finally:
+        queue.release(0.0, None)
+    assert executor.run('toy', worker_pid, max_wait=0.05)[0] == os.getpid()
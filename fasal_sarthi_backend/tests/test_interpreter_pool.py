@@ -0,0 +1,96 @@
+import threading
+
+import numpy as np
+import pytest
+
+from interpreter_pool import InterpreterPool, dequantize, variant_path
+
+
+class FakeInterpreter:
+    # Records how it was built and what was invoked on it
+    def __init__(self, model_path, num_threads):
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.allocated = False
+        self.invoked = []
+
+    def allocate_tensors(self):
+        self.allocated = True
+
+    def get_input_details(self):
+        return [{'index': 0, 'shape': np.array([1, 4, 4, 3]), 'dtype': np.uint8, 'quantization': (1 / 255, 0)}]
+
+    def get_output_details(self):
+        return [{'index': 1, 'dtype': np.uint8, 'quantization': (1 / 256, 0)}]
+
+    def set_tensor(self, index, value):
+        self.value = value
+
+    def invoke(self):
+        self.invoked.append(self.value)
+
+
+def test_pool_builds_and_allocates_every_interpreter():
+    pool = InterpreterPool(FakeInterpreter, 'model.tflite', size=3, num_threads=2)
+    assert len(pool.interpreters) == 3 and len(set(map(id, pool.interpreters))) == 3
+    assert all(i.allocated and i.num_threads == 2 and i.model_path == 'model.tflite' for i in pool.interpreters)
+    assert pool.input_details()[0]['dtype'] == np.uint8
+    assert pool.batch_resize_supported
+    assert InterpreterPool(FakeInterpreter, 'model.tflite', size=0, num_threads=0).size == 1
+
+
+def test_checkout_is_exclusive_and_times_out():
+    pool = InterpreterPool(FakeInterpreter, 'model.tflite', size=2)
+    with pool.checkout() as first, pool.checkout() as second:
+        assert first is not second
+        with pytest.raises(TimeoutError):
+            with pool.checkout(timeout=0.01):
+                pass
+    with pool.checkout(timeout=0.01):
+        pass
+
+
+def test_checkout_returns_the_interpreter_on_error():
+    pool = InterpreterPool(FakeInterpreter, 'model.tflite', size=1)
+    with pytest.raises(RuntimeError):
+        with pool.checkout():
+            raise RuntimeError("invoke failed")
+    with pool.checkout(timeout=0.01) as interpreter:
+        assert interpreter is pool.interpreters[0]
+
+
+def test_checkout_waits_for_a_returned_interpreter():
+    pool = InterpreterPool(FakeInterpreter, 'model.tflite', size=1)
+    got = []
+
+    def wait_for_interpreter():
+        with pool.checkout(timeout=5) as interpreter:
+            got.append(interpreter)
+
+    with pool.checkout():
+        waiter = threading.Thread(target=wait_for_interpreter)
+        waiter.start()
+        waiter.join(0.05)
+        assert got == []
+    waiter.join(5)
+    assert got == [pool.interpreters[0]]
+
+
+def test_warmup_invokes_every_interpreter_with_zeros():
+    pool = InterpreterPool(FakeInterpreter, 'model.tflite', size=2, warmup=True)
+    for interpreter in pool.interpreters:
+        [dummy] = interpreter.invoked
+        assert dummy.shape == (1, 4, 4, 3) and dummy.dtype == np.uint8 and not dummy.any()
+
+
+def test_variant_path():
+    assert variant_path('models/leaf.tflite', 'float') == 'models/leaf.tflite'
+    assert variant_path('models/leaf.tflite', 'int8') == 'models/leaf_int8.tflite'
+
+
+def test_dequantize():
+    detail = {'quantization': (0.5, 10)}
+    np.testing.assert_array_equal(dequantize(np.array([10, 12, 0], dtype=np.uint8), detail), [0.0, 1.0, -5.0])
+    assert dequantize(np.array([3], dtype=np.int8), {'quantization': (0.0, 0)}).dtype == np.float32
+    floats = np.array([0.25], dtype=np.float32)
+    assert dequantize(floats, detail) is floats
@@ -0,0 +1,105 @@
+import pytest
+
+import metrics
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+@pytest.fixture
+def timing():
+    # Restores METRICS_TIMING and the buffering state after the test
+    enabled = metrics.timing_enabled()
+    yield
+    metrics.set_timing(enabled)
+    metrics._buffered = None
+
+
+def test_exposition_format():
+    registry = Registry()
+    requests = registry.register(Counter('requests_total', 'Requests.', ('route', 'status')))
+    load = registry.register(Gauge('load_seconds', 'Load time.', ('model',)))
+    requests.inc('/predict', '200')
+    requests.inc('/predict', '200', amount=2)
+    requests.inc('/say "hi"\\\n', '500')
+    load.set(1.5, 'crop')
+    assert registry.render() == (
+        '# HELP requests_total Requests.\n'
+        '# TYPE requests_total counter\n'
+        'requests_total{route="/predict",status="200"} 3\n'
+        'requests_total{route="/say \\"hi\\"\\\\\\n",status="500"} 1\n'
+        '# HELP load_seconds Load time.\n'
+        '# TYPE load_seconds gauge\n'
+        'load_seconds{model="crop"} 1.5\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    registry = Registry()
+    latency = registry.register(Histogram('latency_seconds', 'Latency.', ('route',), buckets=(0.5, 0.1)))
+    for value in (0.05, 0.1, 0.3, 2.0):
+        latency.observe(value, '/x')
+    lines = registry.render().splitlines()
+    assert lines[1] == '# TYPE latency_seconds histogram'
+    assert lines[2:] == [
+        'latency_seconds_bucket{route="/x",le="0.1"} 2',
+        'latency_seconds_bucket{route="/x",le="0.5"} 3',
+        'latency_seconds_bucket{route="/x",le="+Inf"} 4',
+        'latency_seconds_sum{route="/x"} 2.45',
+        'latency_seconds_count{route="/x"} 4',
+    ]
+
+
+def test_collectors_run_at_scrape_time_and_failures_are_skipped(capsys):
+    registry = Registry()
+    state = {'entries': 1}
+
+    def cache_metrics():
+        return [('cache_entries', 'gauge', 'Entries.', [({'cache': 'faq'}, state['entries'])])]
+
+    def broken():
+        raise RuntimeError('stats unavailable')
+
+    registry.add_collector(broken)
+    registry.add_collector(cache_metrics)
+    state['entries'] = 7
+    assert 'cache_entries{cache="faq"} 7\n' in registry.render()
+    assert 'broken failed: stats unavailable' in capsys.readouterr().out
+
+
+def test_stage_timer_and_timing_switch(timing):
+    before = dict(metrics.stage_latency._values)
+    metrics.set_timing(True)
+    with metrics.stage('test', 'work'):
+        pass
+    count = metrics.stage_latency._values[('test', 'work')][2]
+    assert count == before.get(('test', 'work'), [None, 0, 0])[2] + 1
+
+    metrics.set_timing(False)
+    assert metrics.stage('test', 'work') is metrics._NO_TIMER
+    metrics.observe_stage('test', 'work', 1.0)
+    assert metrics.stage_latency._values[('test', 'work')][2] == count
+
+
+def test_buffered_stages_are_replayed(timing):
+    metrics.set_timing(True)
+    metrics.buffer_stages()
+    metrics.observe_stage('test', 'child', 0.25)
+    samples = metrics.drain_buffered()
+    assert samples == [('test', 'child', 0.25)] and metrics.drain_buffered() == []
+    metrics._buffered = None
+    metrics.replay(samples)
+    assert metrics.stage_latency._values[('test', 'child')][1] >= 0.25
+
+
+def test_metrics_endpoint():
+    import app
+    client = app.app.test_client()
+    client.get('/no-such-route')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type == metrics.CONTENT_TYPE
+    body = response.get_data(as_text=True)
+    assert 'fasal_http_requests_total{route="unmatched",method="GET",status="404"}' in body
+    assert '# TYPE fasal_cache_lookups_total counter' in body
+    assert 'fasal_model_info{' in body # At least the fertilizer model is loaded
+    for line in body.splitlines():
+        assert line.startswith('#') or len(line.rsplit(' ', 1)) == 2, line
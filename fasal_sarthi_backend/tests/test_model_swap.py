@@ -0,0 +1,81 @@
+import os
+
+from inference_executor import InferenceExecutor
+from model_registry import ModelSlot
+
+
+def load_toy(paths):
+    with open(paths['model'] + '.loads', 'a', encoding='utf-8') as log:
+        log.write(f'{os.getpid()}\n')
+    with open(paths['model'], encoding='utf-8') as f:
+        return f.read()
+
+
+def loads_in_other_processes(path):
+    with open(str(path) + '.loads', encoding='utf-8') as log:
+        return sum(1 for pid in log.read().split() if int(pid) != os.getpid())
+
+
+# Module-level, like app.py's slots: the forked inference process inherits it
+slot = ModelSlot('toy', {}, loader=load_toy)
+
+
+def init_inference_worker():
+    slot.reset_after_fork()
+
+
+def predict(version, paths):
+    return slot.get(version, paths).model
+
+
+def test_process_pool_serves_a_version_swapped_in_after_fork(tmp_path):
+    files = {}
+    for version in ('v1', 'v2'):
+        files[version] = tmp_path / f'{version}.txt'
+        files[version].write_text(f'{version} output', encoding='utf-8')
+    slot.load({'model': str(files['v1'])}, 'v1')
+
+    executor = InferenceExecutor(processes=1, initializer=init_inference_worker)
+    executor.add_model('toy', concurrency=1)
+    executor.start() # Forked with v1
+    try:
+        old = slot.acquire()
+        assert executor.run('toy', predict, old.version, old.paths)[0] == 'v1 output'
+
+        slot.load({'model': str(files['v2'])}, 'v2') # Hot swap in the parent only
+        new = slot.acquire()
+        assert new.version == 'v2'
+        assert executor.run('toy', predict, new.version, new.paths)[0] == 'v2 output'
+        # A request pinned before the swap still gets the version it started with
+        assert executor.run('toy', predict, old.version, old.paths)[0] == 'v1 output'
+        slot.release(old)
+        slot.release(new)
+    finally:
+        executor.shutdown()
+
+
+def test_process_keeps_the_previous_version_loaded(tmp_path):
+    files = {}
+    for version in ('v3', 'v4'):
+        files[version] = tmp_path / f'{version}.txt'
+        files[version].write_text(f'{version} output', encoding='utf-8')
+    slot.load({'model': str(files['v3'])}, 'v3')
+
+    executor = InferenceExecutor(processes=1, initializer=init_inference_worker)
+    executor.add_model('toy', concurrency=1)
+    executor.start() # Forked with v3
+    try:
+        old = slot.acquire()
+        slot.load({'model': str(files['v4'])}, 'v4')
+        new = slot.acquire()
+        # Calls pinned to the old and the new version alternate while old requests drain
+        for _ in range(3):
+            assert executor.run('toy', predict, new.version, new.paths)[0] == 'v4 output'
+            assert executor.run('toy', predict, old.version, old.paths)[0] == 'v3 output'
+        slot.release(old)
+        slot.release(new)
+    finally:
+        executor.shutdown()
+    # The inference process loaded v4 once and never reloaded v3
+    assert loads_in_other_processes(files['v4']) == 1
+    assert loads_in_other_processes(files['v3']) == 0
@@ -0,0 +1,124 @@
+import io
+import os
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+import prediction_cache
+from prediction_cache import PredictionCache, average_hash, content_hash, model_fingerprint
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(prediction_cache, 'time', SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def disk_files(root):
+    return sorted(os.path.relpath(os.path.join(d, name), root) for d, _, names in os.walk(root) for name in names)
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = PredictionCache(ttl_seconds=60)
+    cache.put('k', {'class': 'healthy'})
+    clock.value += 60
+    assert cache.get('k') == {'class': 'healthy'}
+    clock.value += 1
+    assert cache.get('k') is None
+    assert cache.stats()['entries'] == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = PredictionCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.evictions == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = PredictionCache(max_entries=0)
+    cache.put('k', 1)
+    assert cache.get('k') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_disk_entries_are_shared_and_expire(tmp_path, clock):
+    writer = PredictionCache(ttl_seconds=60, disk_dir=str(tmp_path))
+    writer.set_model_fingerprint('m1')
+    writer.put('abcd', [0.1, 0.9])
+
+    reader = PredictionCache(ttl_seconds=60, disk_dir=str(tmp_path))
+    reader.set_model_fingerprint('m1')
+    assert reader.get('abcd') == [0.1, 0.9]
+    assert reader.disk_hits == 1
+    assert disk_files(tmp_path) == [os.path.join('m1', 'cd', 'abcd.json')]
+
+    # An expired file is deleted on read
+    late = PredictionCache(ttl_seconds=60, disk_dir=str(tmp_path))
+    late.set_model_fingerprint('m1')
+    clock.value += 61
+    assert late.get('abcd') is None
+    assert disk_files(tmp_path) == []
+
+
+def test_disk_prune_keeps_the_newest_entries_of_the_current_model(tmp_path, clock):
+    old = PredictionCache(disk_dir=str(tmp_path))
+    old.set_model_fingerprint('old')
+    old.put('stale', 1)
+
+    cache = PredictionCache(disk_dir=str(tmp_path), disk_max_entries=10)
+    cache.set_model_fingerprint('new')
+    for i in range(100): # The 100th put prunes
+        cache.put(f'key{i:03d}', i)
+        path = cache._disk_path(f'key{i:03d}')
+        os.utime(path, (i, i))
+    files = disk_files(tmp_path)
+    assert len(files) == 10
+    assert all(f.startswith('new') for f in files)
+    assert {os.path.basename(f) for f in files} == {f'key{i:03d}.json' for i in range(90, 100)}
+
+
+def test_fingerprint_namespaces_entries(tmp_path):
+    cache = PredictionCache(disk_dir=str(tmp_path))
+    cache.set_model_fingerprint('m1')
+    cache.put('k', 'from m1')
+    cache.set_model_fingerprint('m2')
+    assert cache.get('k') is None # Memory cleared, and m1's file is not read
+
+    # A result computed by the previous model is dropped instead of cached under m2
+    cache.put('k', 'late m1 result', fingerprint='m1')
+    assert cache.get('k') is None
+    cache.put('k', 'from m2', fingerprint='m2')
+    assert cache.get('k') == 'from m2'
+
+    cache.set_model_fingerprint('m1')
+    assert cache.get('k') == 'from m1'
+
+
+def test_model_fingerprint_follows_the_file(tmp_path):
+    path = tmp_path / 'model.tflite'
+    path.write_bytes(b'v1')
+    first = model_fingerprint(str(path))
+    assert model_fingerprint(str(path)) == first
+    path.write_bytes(b'v2 bigger')
+    assert model_fingerprint(str(path)) != first
+    assert model_fingerprint(str(tmp_path / 'missing')) == model_fingerprint(str(tmp_path / 'missing'))
+
+
+def test_average_hash_survives_reencoding():
+    img = Image.new('RGB', (64, 64), 'white')
+    img.paste((20, 120, 20), (0, 0, 32, 64))
+    png, jpeg = io.BytesIO(), io.BytesIO()
+    img.save(png, 'PNG')
+    img.save(jpeg, 'JPEG', quality=60)
+    assert content_hash(png.getvalue()) != content_hash(jpeg.getvalue())
+    again = Image.open(io.BytesIO(jpeg.getvalue()))
+    assert average_hash(img) == average_hash(again)
+    assert average_hash(img).startswith('phash-') and len(average_hash(img)) == len('phash-') + 16
@@ -0,0 +1,78 @@
+import io
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from preprocessing import ImagePreprocessor
+
+
+def detail(dtype, quantization, size=8):
+    return {'shape': [1, size, size, 3], 'dtype': dtype, 'quantization': quantization}
+
+
+def encode(img, fmt='PNG', **options):
+    out = io.BytesIO()
+    img.save(out, fmt, **options)
+    return out.getvalue()
+
+
+@pytest.fixture
+def image():
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (8, 8, 3), dtype=np.uint8), 'RGB')
+
+
+def test_float_model_with_unit_scale_gets_0_to_1(image):
+    tensor = ImagePreprocessor(detail(np.float32, (1.0, 0))).preprocess(encode(image))
+    assert tensor.shape == (1, 8, 8, 3) and tensor.dtype == np.float32
+    np.testing.assert_allclose(tensor[0], np.asarray(image, dtype=np.float32) / 255.0, rtol=1e-6)
+
+
+def test_float_model_without_quantization_gets_raw_pixels(image):
+    tensor = ImagePreprocessor(detail(np.float32, (0.0, 0))).preprocess(encode(image))
+    np.testing.assert_array_equal(tensor[0], np.asarray(image, dtype=np.float32))
+
+
+@pytest.mark.parametrize('dtype, quantization', [
+    (np.uint8, (1.0, 0)),      # Raw pixels, as before the lookup table
+    (np.int8, (1.0, -128)),    # Full-integer model of a raw-pixel float model
+    (np.uint8, (2.0, 3)),
+    (np.int8, (1 / 255, -128)), # Saturates
+])
+def test_quantized_input_matches_the_formula(image, dtype, quantization):
+    scale, zero_point = quantization
+    tensor = ImagePreprocessor(detail(dtype, quantization)).preprocess(encode(image))
+    info = np.iinfo(dtype)
+    pixels = np.asarray(image, dtype=np.float64)
+    expected = np.clip(np.round(pixels / scale + zero_point), info.min, info.max).astype(dtype)
+    assert tensor.dtype == dtype
+    np.testing.assert_array_equal(tensor[0], expected)
+
+
+def test_large_jpeg_and_non_rgb_images_are_resized_to_the_input(image):
+    preprocessor = ImagePreprocessor(detail(np.float32, (1.0, 0), size=32))
+    photo = image.resize((1024, 768))
+    assert preprocessor.preprocess(encode(photo, 'JPEG', quality=90)).shape == (1, 32, 32, 3)
+    assert preprocessor.preprocess(encode(photo.convert('RGBA'))).shape == (1, 32, 32, 3)
+    gray = preprocessor.preprocess(encode(Image.new('L', (40, 40), 51)))
+    np.testing.assert_allclose(gray, 0.2, rtol=1e-6)
+
+
+def test_buffer_is_reused_per_thread(image):
+    preprocessor = ImagePreprocessor(detail(np.float32, (1.0, 0)))
+    first = preprocessor.preprocess(encode(image))
+    assert preprocessor.preprocess(encode(Image.new('RGB', (8, 8)))) is first
+    assert not first.any() # Overwritten by the second call
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(preprocessor.preprocess(encode(image))))
+    thread.start()
+    thread.join()
+    assert other[0] is not first
+
+
+def test_undecodable_bytes_raise():
+    with pytest.raises(OSError):
+        ImagePreprocessor(detail(np.float32, (1.0, 0))).preprocess(b'not an image')
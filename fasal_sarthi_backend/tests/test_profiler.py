@@ -0,0 +1,16 @@
+from profiler import HEADER, RequestProfiler
+
+
+def test_secret_is_accepted_only_from_the_header():
+    profiler = RequestProfiler(secret='s3cret')
+    assert profiler.should_profile({HEADER: 's3cret'}) == 'requested'
+    assert profiler.should_profile({HEADER: 's3cre'}) is None
+    assert profiler.should_profile({}) is None
+    # No query string argument any more (it would end up in access logs)
+    assert not profiler.authorized({'profile': 's3cret'})
+
+
+def test_disabled_without_secret():
+    profiler = RequestProfiler(secret='')
+    assert not profiler.enabled
+    assert not profiler.authorized({HEADER: ''})
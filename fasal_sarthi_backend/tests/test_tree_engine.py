@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from tree_engine import CompiledForest, compile_forest
+
+
+@pytest.fixture(scope='module')
+def forest():
+    rng = np.random.default_rng(7)
+    # Integer-valued features (like soil readings) give many thresholds at x.5 and repeated values
+    X = rng.integers(0, 40, size=(600, 6)).astype(np.float64)
+    y = np.array(['Urea', 'DAP', '14-35-14', '28-28'])[(X[:, 0] + 2 * X[:, 3] - X[:, 5]).astype(int) % 4]
+    return RandomForestClassifier(n_estimators=25, max_depth=12, random_state=0).fit(X, y), X
+
+
+def threshold_rows(compiled, n_features):
+    # Rows sitting exactly on split thresholds, and one float32/float64 step either side of them
+    split = compiled.children[:, 0] != np.arange(len(compiled.feature))
+    rows = []
+    for node in np.flatnonzero(split)[:300]:
+        t = compiled.threshold[node]
+        for x in (t, np.nextafter(t, -np.inf), np.nextafter(t, np.inf),
+                  float(np.float32(t)), float(np.nextafter(np.float32(t), np.float32(np.inf)))):
+            row = np.full(n_features, t)
+            row[compiled.feature[node]] = x
+            rows.append(row)
+    return np.array(rows)
+
+
+def test_predictions_match_sklearn_beyond_one_row_block(forest):
+    model, X = forest
+    compiled = CompiledForest.from_sklearn(model)
+    rng = np.random.default_rng(1)
+    rows = np.vstack([X, rng.uniform(-5, 45, size=(900, X.shape[1]))])
+    assert len(rows) > 2 * CompiledForest.ROW_BLOCK
+
+    np.testing.assert_array_equal(compiled.predict(rows), model.predict(rows))
+    np.testing.assert_allclose(compiled.predict_proba(rows), model.predict_proba(rows), rtol=0, atol=1e-12)
+
+
+def test_threshold_ties_match_sklearn(forest):
+    model, X = forest
+    compiled = CompiledForest.from_sklearn(model)
+    rows = threshold_rows(compiled, X.shape[1])
+    np.testing.assert_array_equal(compiled.apply(rows), np.array([e.apply(rows.astype(np.float32)) for e in model.estimators_])
+                                  + compiled.roots[:, np.newaxis])
+    np.testing.assert_array_equal(compiled.predict(rows), model.predict(rows))
+
+
+def test_single_rows_match_sklearn(forest):
+    model, X = forest
+    compiled = CompiledForest.from_sklearn(model)
+    for row in X[:20]:
+        single = row[np.newaxis, :]
+        assert compiled.predict(single).tolist() == model.predict(single).tolist()
+        np.testing.assert_allclose(compiled.predict_proba(single), model.predict_proba(single), rtol=0, atol=1e-12)
+
+
+def test_compile_forest_verifies(forest):
+    model, _ = forest
+    compiled = compile_forest(model, "test forest")
+    assert compiled is not None and compiled.n_trees == 25
+    assert not compiled.value.flags.writeable
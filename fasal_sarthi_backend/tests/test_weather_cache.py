@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from weather_cache import WeatherCache, weather_cache_key
+
+
+def test_cancelled_leader_releases_waiters():
+    async def scenario():
+        cache = WeatherCache()
+        started = asyncio.Event()
+
+        async def slow_fetch():
+            started.set()
+            await asyncio.sleep(10)
+            return {"temp": 1}, 200
+
+        leader = asyncio.ensure_future(cache.aget_or_fetch('city:pune', slow_fetch))
+        await started.wait()
+        waiter = asyncio.ensure_future(cache.aget_or_fetch('city:pune', slow_fetch))
+        await asyncio.sleep(0)
+        leader.cancel() # e.g. the leader's client disconnected
+
+        with pytest.raises(RuntimeError, match='interrupted'):
+            await asyncio.wait_for(waiter, 1)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert 'city:pune' not in cache._ainflight
+
+        async def fast_fetch():
+            return {"temp": 2}, 200
+        assert await cache.aget_or_fetch('city:pune', fast_fetch) == ({"temp": 2}, 200)
+
+    asyncio.run(scenario())
+
+
+def test_failed_fetch_is_not_cached():
+    cache = WeatherCache()
+
+    def failing():
+        raise ConnectionError("upstream down")
+
+    with pytest.raises(ConnectionError):
+        cache.get_or_fetch('city:pune', failing)
+    assert cache.get_or_fetch('city:pune', lambda: ({"temp": 3}, 200)) == ({"temp": 3}, 200)
+    assert cache.stats()["upstream_errors"] == 1
+
+
+@pytest.mark.parametrize('lat, lon', [('abc', '73.8'), (18.5, None), ([18.5], 73.8), ('nan', 73.8)])
+def test_bad_coordinates_pass_through_uncached(lat, lon):
+    key = weather_cache_key(lat, lon, 'Pune' if lon is None else None)
+    if lon is None:
+        assert key == 'city:pune' # Falls back to the city, like the OWM params
+        return
+    assert key is None
+
+    # No key: OWM gets the raw coordinates every time and its own error comes back
+    cache = WeatherCache()
+    calls = []
+
+    def owm():
+        calls.append(1)
+        return {"error": "wrong latitude"}, 404
+
+    assert cache.get_or_fetch(key, owm) == ({"error": "wrong latitude"}, 404)
+    assert cache.get_or_fetch(key, owm) == ({"error": "wrong latitude"}, 404)
+    assert len(calls) == 2 and cache.stats()["entries"] == 0
+
+
+def test_nearby_coordinates_share_a_bucket():
+    assert weather_cache_key('18.5204', 73.8567) == weather_cache_key(18.518, '73.859') == 'geo:18.52:73.86'
@@ -0,0 +1,148 @@
+import time
+
+import numpy as np
+
+
+# --- COMPILED TREE-ENSEMBLE INFERENCE (fertilizer Random Forest) ---
+# sklearn's RandomForestClassifier.predict spends most of a 1-row call on input validation,
+# joblib dispatch and per-tree Python overhead. Here every tree is flattened into shared
+# contiguous arrays (feature, threshold, children, leaf value) once at load time, and one
+# row or a whole batch is evaluated for all trees at once with vectorised traversal.
+#
+# Results match sklearn exactly: inputs are cast to float32 like sklearn does, the split rule
+# is the same (x <= threshold goes left) and leaf class distributions are normalised and
+# averaged the same way. verify() checks this against the original model at load time.
+class CompiledForest:
+    ROW_BLOCK = 512
+
+    def __init__(self, feature, threshold, children, value, roots, max_depth, classes):
+        self.feature = feature       # (n_nodes,) int32, split feature per node (0 for leaves)
+        self.threshold = threshold   # (n_nodes,) float64
+        self.children = children     # (n_nodes, 2) int32, [left, right]; leaves point to themselves
+        self.value = value           # (n_nodes, n_classes) float64, normalised class distribution
+        self.roots = roots           # (n_trees,) int32, root node of each tree
+        self.max_depth = int(max_depth)
+        self.classes_ = classes
+        self.n_trees = len(roots)
+        self.n_features_in_ = None
+        # Never written after compile: read-only arrays stay shared between forked workers
+        for array in (self.feature, self.threshold, self.children, self.value, self.roots):
+            array.flags.writeable = False
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            n_nodes = tree.node_count
+            node_ids = np.arange(n_nodes, dtype=np.int32)
+            left = tree.children_left.astype(np.int32)
+            right = tree.children_right.astype(np.int32)
+            is_leaf = left == -1
+
+            # Leaves loop back to themselves so extra traversal steps are harmless
+            left = np.where(is_leaf, node_ids, left) + offset
+            right = np.where(is_leaf, node_ids, right) + offset
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(tree.threshold.astype(np.float64))
+            children.append(np.stack([left, right], axis=1))
+
+            # Same normalisation as DecisionTreeClassifier.predict_proba (single output)
+            value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = value.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(value / normalizer)
+
+            roots.append(offset)
+            offset += n_nodes
+            max_depth = max(max_depth, tree.max_depth)
+
+        compiled = cls(
+            feature=np.ascontiguousarray(np.concatenate(features)),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds)),
+            children=np.ascontiguousarray(np.concatenate(children)),
+            value=np.ascontiguousarray(np.concatenate(values)),
+            roots=np.array(roots, dtype=np.int32),
+            max_depth=max_depth,
+            classes=np.asarray(forest.classes_),
+        )
+        compiled.n_features_in_ = getattr(forest, 'n_features_in_', None)
+        return compiled
+
+    def apply(self, X):
+        """Leaf node index of every tree for every row: shape (n_trees, n_rows)."""
+        X = np.ascontiguousarray(X, dtype=np.float32) # sklearn evaluates trees on float32 inputs
+        n_rows, n_features = X.shape
+        if n_rows > self.ROW_BLOCK:
+            # Keep the (n_trees, rows) working arrays cache-sized on big batches
+            return np.concatenate([self.apply(X[i:i + self.ROW_BLOCK]) for i in range(0, n_rows, self.ROW_BLOCK)], axis=1)
+
+        flat_x = X.ravel()
+        flat_children = self.children.ravel()
+        row_offset = (np.arange(n_rows, dtype=np.intp) * n_features)[np.newaxis, :]
+        nodes = np.repeat(self.roots[:, np.newaxis], n_rows, axis=1)
+        for _ in range(self.max_depth):
+            go_right = flat_x[row_offset + self.feature[nodes]] > self.threshold[nodes]
+            nodes = flat_children[2 * nodes + go_right]
+        return nodes
+
+    def predict_proba(self, X):
+        # Sum tree distributions in tree order (same order as a sequential sklearn predict)
+        leaves = self.apply(X)
+        if leaves.shape[1] <= 32:
+            proba = np.add.reduce(self.value[leaves], axis=0)
+        else:
+            # Avoid materialising an (n_trees, n_rows, n_classes) array on big batches
+            proba = self.value[leaves[0]].copy()
+            for tree_leaves in leaves[1:]:
+                proba += self.value[tree_leaves]
+        proba /= self.n_trees
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.feature, self.threshold, self.children, self.value, self.roots))
+
+    def probe_inputs(self, n_rows=2000, seed=0):
+        # Random rows spanning every feature's split thresholds, so both branches get exercised
+        n_features = self.n_features_in_ or int(self.feature.max()) + 1
+        rng = np.random.default_rng(seed)
+        low = np.zeros(n_features)
+        high = np.ones(n_features)
+        split_nodes = self.children[:, 0] != np.arange(len(self.feature))
+        for f in range(n_features):
+            used = self.threshold[split_nodes & (self.feature == f)]
+            if used.size:
+                low[f], high[f] = used.min() - 1.0, used.max() + 1.0
+        return rng.uniform(low, high, size=(n_rows, n_features))
+
+    def verify(self, forest, X=None):
+        """Check that predictions match the sklearn forest exactly. Returns (ok, mismatches)."""
+        if X is None:
+            X = self.probe_inputs()
+        expected = forest.predict(X)
+        actual = self.predict(X)
+        mismatches = int(np.sum(expected != actual))
+        return mismatches == 0, mismatches
+
+
+def compile_forest(forest, name="forest"):
+    # Compile + verify; returns None (caller keeps using sklearn) if anything doesn't match
+    try:
+        start = time.perf_counter()
+        compiled = CompiledForest.from_sklearn(forest)
+        ok, mismatches = compiled.verify(forest)
+        elapsed = time.perf_counter() - start
+    except Exception as e:
+        print(f"Warning: Could not compile {name} for fast inference: {e}")
+        return None
+    if not ok:
+        print(f"Warning: Compiled {name} disagrees with sklearn on {mismatches} probe rows; using sklearn predict.")
+        return None
+    print(f"Compiled {name}: {compiled.n_trees} trees, {len(compiled.feature)} nodes, "
+          f"{compiled.nbytes() / 1e6:.1f} MB, verified in {elapsed:.2f}s.")
+    return compiled
@@ -0,0 +1,191 @@
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def weather_cache_key(lat=None, lon=None, city=None, geo_decimals=2):
+    # Nearby coordinates share one bucket: 2 decimals is ~1.1 km, well inside one village/district.
+    # None for coordinates that aren't numbers: those go to OWM uncached, which answers them (404)
+    if lat is not None and lon is not None:
+        try:
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            return None
+        if not (math.isfinite(lat) and math.isfinite(lon)):
+            return None
+        return f"geo:{round(lat, geo_decimals):.{geo_decimals}f}:{round(lon, geo_decimals):.{geo_decimals}f}"
+    if city:
+        return "city:" + " ".join(str(city).split()).casefold()
+    return None
+
+
+# --- WEATHER CACHE (stale-while-revalidate + request coalescing) ---
+# - fresh entry (age < ttl): served from memory
+# - stale entry (age < ttl + stale_ttl): served from memory while ONE background thread refreshes it
+# - miss: the first request calls upstream, concurrent requests for the same bucket wait for it
+# Only successful (200) results are cached.
+class WeatherCache:
+    def __init__(self, ttl_seconds=600, stale_ttl_seconds=1800, max_entries=5000):
+        self.ttl = float(ttl_seconds)
+        self.stale_ttl = float(stale_ttl_seconds)
+        self.max_entries = int(max_entries)
+        self._entries = OrderedDict() # key -> (fetched_at, payload)
+        self._inflight = {}           # key -> Future of (payload, status)
+        self._ainflight = {}          # key -> asyncio.Future, for the ASGI server (see asgi.py)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_entries > 0
+
+    def _lookup(self, key, inflight):
+        # Under the lock: ('fresh'|'stale'|'refresh', payload) for a cached entry, else
+        # ('wait', future) to join an in-flight fetch or ('fetch', None) to become the leader.
+        # 'refresh' means stale and the caller must start the background refresh.
+        entry = self._entries.get(key)
+        if entry is not None:
+            fetched_at, payload = entry
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return 'fresh', payload
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                if key in inflight:
+                    return 'stale', payload
+                self.refreshes += 1
+                return 'refresh', payload
+        if key in inflight:
+            self.coalesced += 1
+            return 'wait', inflight[key]
+        self.misses += 1
+        return 'fetch', None
+
+    def _store(self, key, payload, status):
+        if status != 200: return
+        with self._lock:
+            self._entries[key] = (time.time(), payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_fetch(self, key, fetch):
+        """Return (payload, status). fetch() -> (payload, status) does the upstream call."""
+        if not self.enabled or key is None:
+            return fetch()
+
+        with self._lock:
+            state, value = self._lookup(key, self._inflight)
+            if state in ('fresh', 'stale'):
+                return value, 200
+            if state == 'refresh':
+                self._inflight[key] = Future()
+                threading.Thread(target=self._refresh, args=(key, fetch), daemon=True).start()
+                return value, 200
+            if state == 'fetch':
+                value = self._inflight[key] = Future()
+
+        if state == 'wait':
+            return value.result()
+        return self._fetch_and_store(key, fetch, value)
+
+    async def aget_or_fetch(self, key, fetch):
+        """Async variant for the ASGI server: fetch is a coroutine function -> (payload, status)."""
+        if not self.enabled or key is None:
+            return await fetch()
+
+        with self._lock:
+            state, value = self._lookup(key, self._ainflight)
+            if state in ('fresh', 'stale'):
+                return value, 200
+            if state == 'fetch' or state == 'refresh':
+                future = self._ainflight[key] = asyncio.get_running_loop().create_future()
+
+        if state == 'wait':
+            return await asyncio.shield(value)
+        if state == 'refresh':
+            asyncio.get_running_loop().create_task(self._afetch_and_store(key, fetch, future, background=True))
+            return value, 200
+        return await self._afetch_and_store(key, fetch, future)
+
+    async def _afetch_and_store(self, key, fetch, future, background=False):
+        # The future is resolved on every exit, cancellation included: waiters await it without a timeout
+        try:
+            with self._lock:
+                self.upstream_calls += 1
+            payload, status = await fetch()
+            self._store(key, payload, status)
+            future.set_result((payload, status))
+            return payload, status
+        except BaseException as e:
+            self._fail(key, future, e)
+            future.exception() # Mark retrieved: nobody may be waiting
+            if background and isinstance(e, Exception):
+                print(f"Background weather refresh failed for {key}: {e}")
+                return None
+            raise
+        finally:
+            with self._lock:
+                if self._ainflight.get(key) is future:
+                    del self._ainflight[key]
+
+    def _fail(self, key, future, e):
+        # A cancelled leader (client went away) hands its waiters an error, not its cancellation
+        if isinstance(e, Exception):
+            with self._lock:
+                self.upstream_errors += 1
+        else:
+            e = RuntimeError(f"Weather fetch for {key} was interrupted ({type(e).__name__})")
+        if not future.done():
+            future.set_exception(e)
+
+    def _refresh(self, key, fetch):
+        with self._lock:
+            future = self._inflight.get(key)
+        try:
+            self._fetch_and_store(key, fetch, future)
+        except Exception as e:
+            print(f"Background weather refresh failed for {key}: {e}")
+
+    def _fetch_and_store(self, key, fetch, future):
+        try:
+            with self._lock:
+                self.upstream_calls += 1
+            payload, status = fetch()
+            self._store(key, payload, status)
+            future.set_result((payload, status))
+            return payload, status
+        except BaseException as e:
+            self._fail(key, future, e)
+            raise
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+
+    def stats(self):
+        with self._lock:
+            served = self.hits + self.stale_hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "background_refreshes": self.refreshes,
+                "upstream_calls": self.upstream_calls,
+                "upstream_errors": self.upstream_errors,
+                "hit_ratio": (self.hits + self.stale_hits) / served if served else 0.0,
+            }
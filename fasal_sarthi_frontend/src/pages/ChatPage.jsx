@@ -1,5 +1,4 @@
 import React, { useState, useRef, useEffect } from "react";
-import axios from "axios";
 import ReactMarkdown from "react-markdown";
 import {
   LuBot,
@@ -11,6 +10,74 @@ import {
 const API_BASE_URL =
   import.meta.env.VITE_API_BASE_URL || "http://localhost:5000";
 
+// Thrown when the server no longer has this conversation (other worker, restart, expiry)
+class SessionExpiredError extends Error {}
+
+// --- Streaming chat call ---
+// Asks the backend for Server-Sent Events (`data: {"text": ...}` per piece, then
+// `event: done`) and calls onText with the answer so far, so the reply appears as it is generated.
+// Resolves to the final reply ({ response, session_id }).
+const streamChat = async ({ message, history, sessionId, sessionStarted, onText }) => {
+  const response = await fetch(`${API_BASE_URL}/sarthi_ai_chat?stream=1`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
+    body: JSON.stringify({
+      message,
+      history,
+      session_id: sessionId,
+      session_started: sessionStarted,
+      stream: true,
+    }),
+  });
+  if (response.status === 409) {
+    const payload = await response.json().catch(() => ({}));
+    if (payload.session_expired) throw new SessionExpiredError(payload.error);
+  }
+  if (!response.ok || !response.body) {
+    throw new Error(`Chat request failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder("utf-8");
+  let buffer = "";
+  let answer = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // SSE events are separated by a blank line
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let eventName = "message";
+      let data = "";
+      for (const line of rawEvent.split("\n")) {
+        if (line.startsWith("event:")) eventName = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      }
+      if (!data) continue;
+      const payload = JSON.parse(data);
+
+      if (eventName === "error") throw new Error(payload.error);
+      if (eventName === "done") return { ...payload, response: payload.response ?? answer };
+      if (payload.text) {
+        answer += payload.text;
+        onText(answer);
+      }
+    }
+  }
+  return { response: answer };
+};
+
+// Conversation id for the server-side chat session (the server keeps the context window)
+const newSessionId = () =>
+  window.crypto?.randomUUID?.() ??
+  `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+
 // --- Modern Chat Bubble Component ---
 const ChatBubble = ({ message, role }) => {
   const isUser = role === "user";
@@ -76,6 +143,9 @@ function ChatPage() {
   const [newMessage, setNewMessage] = useState("");
   const [isLoading, setIsLoading] = useState(false);
   const chatEndRef = useRef(null); // For auto-scrolling
+  const sessionIdRef = useRef(newSessionId());
+  // History is sent until the server confirms the session (a reply with session_id)
+  const sessionStartedRef = useRef(false);
 
   // Prevent whole page from scrolling while this page is mounted
   useEffect(() => {
@@ -125,27 +195,41 @@ function ChatPage() {
     setChatHistory(prev => [...prev, { role: "bot", message: "...thinking..." }]);
 
 
-    try {
-      // Send NEW message and the prepared HISTORY
-      const response = await axios.post(`${API_BASE_URL}/sarthi_ai_chat`, {
-        message: userMessage,
-        history: historyToSend, // <-- Send the history
-      });
-      const aiMessage = response.data.response;
-
-      // Replace thinking message with actual response in UI
+    // Replace the last bot bubble ('thinking' or the partial answer) with the text so far
+    const showBotMessage = (text) => {
       setChatHistory((prev) => {
         const updatedHistory = [...prev];
-        // Find the last message (which should be 'thinking') and replace it
         const lastIndex = updatedHistory.length - 1;
-        if (lastIndex >= 0 && updatedHistory[lastIndex].message === '...thinking...') {
-             updatedHistory[lastIndex] = { role: "bot", message: aiMessage };
+        if (lastIndex >= 0 && updatedHistory[lastIndex].role === "bot") {
+             updatedHistory[lastIndex] = { role: "bot", message: text };
         } else {
              // Fallback: just add the message if something went wrong
-             updatedHistory.push({ role: "bot", message: aiMessage });
+             updatedHistory.push({ role: "bot", message: text });
         }
         return updatedHistory;
       });
+    };
+
+    try {
+      // Send NEW message and the prepared HISTORY, streaming the answer into the UI.
+      // Once the server has the conversation for this session_id only the new message is sent.
+      const ask = (sessionStarted) =>
+        streamChat({
+          message: userMessage,
+          history: sessionStarted ? [] : historyToSend,
+          sessionId: sessionIdRef.current,
+          sessionStarted,
+          onText: showBotMessage,
+        });
+      let reply;
+      try {
+        reply = await ask(sessionStartedRef.current);
+      } catch (error) {
+        if (!(error instanceof SessionExpiredError)) throw error;
+        reply = await ask(false); // Server lost the session: resend the whole conversation
+      }
+      sessionStartedRef.current = Boolean(reply.session_id);
+      showBotMessage(reply.response);
     } catch (error) {
       console.error("Chat API error:", error);
       // Replace thinking message with error message in UI